@@ -2,6 +2,7 @@ import bpy
 
 from .blender.com import gltf2_blender_rigid_bodies_ui as rb_extra_ui
 from .blender.com import gltf2_blender_rigid_bodies_ops as rb_ops
+from .blender.com import gltf2_blender_rigid_bodies_cache as rb_cache
 from .blender.exp.gltf2_blender_rigid_bodies import glTF2ExportUserExtension
 from .blender.imp.gltf2_blender_rigid_bodies import glTF2ImportUserExtension
 from io_scene_gltf2 import exporter_extension_layout_draw, importer_extension_layout_draw
@@ -34,6 +35,63 @@ def draw_export(context, layout):
     if body != None:
         body.use_property_split = False
         body.prop(exportProps, "reparent_bones")
+        body.prop(exportProps, "physics_only")
+        body.prop(exportProps, "use_cache")
+        body.prop(exportProps, "verbose_log")
+        body.prop(exportProps, "strip_collision_meshes")
+        row = body.row()
+        row.active = exportProps.strip_collision_meshes
+        row.prop(exportProps, "collision_weld_distance")
+        row = body.row()
+        row.active = exportProps.strip_collision_meshes
+        row.prop(exportProps, "cook_collision_data")
+        row = body.row()
+        row.active = exportProps.strip_collision_meshes
+        row.prop(exportProps, "edge_convexity_flags")
+        row = body.row()
+        row.active = exportProps.strip_collision_meshes
+        row.prop(exportProps, "quantize_collision_meshes")
+        row = body.row()
+        row.active = (
+            exportProps.strip_collision_meshes and exportProps.quantize_collision_meshes
+        )
+        row.prop(exportProps, "quantization_error")
+        body.prop(exportProps, "detect_heightfields")
+        row = body.row()
+        row.active = exportProps.detect_heightfields
+        row.prop(exportProps, "heightfield_tolerance")
+        body.prop(exportProps, "sphere_tree_processes")
+        body.prop(exportProps, "write_broadphase_hints")
+        body.prop(exportProps, "write_simulation_islands")
+        body.prop(exportProps, "write_articulations")
+        body.prop(exportProps, "write_solver_settings")
+        body.prop(exportProps, "flag_ccd")
+        body.prop(exportProps, "bake_simulation")
+        row = body.row()
+        row.active = exportProps.bake_simulation
+        row.prop(exportProps, "bake_tolerance")
+        row = body.row()
+        row.active = exportProps.bake_simulation
+        row.prop(exportProps, "bake_angle_tolerance")
+        body.prop(exportProps, "warm_start")
+        row = body.row()
+        row.active = exportProps.warm_start
+        row.prop(exportProps, "warm_start_frame")
+        row = body.row()
+        row.active = exportProps.warm_start
+        row.prop(exportProps, "warm_start_deactivated")
+        body.prop(exportProps, "detect_overlaps")
+        row = body.row()
+        row.active = exportProps.detect_overlaps
+        row.prop(exportProps, "overlap_tolerance")
+        row = body.row()
+        row.active = exportProps.detect_overlaps
+        row.prop(exportProps, "fail_on_overlap")
+        body.prop(exportProps, "audit_joints")
+        body.prop(exportProps, "batch_static_colliders")
+        row = body.row()
+        row.active = exportProps.batch_static_colliders
+        row.prop(exportProps, "static_batch_cell_size")
 
 
 def draw_import(context, layout):
@@ -49,11 +107,13 @@ def draw_import(context, layout):
 def register():
     rb_ops.register_ops()
     rb_extra_ui.register_ui()
+    rb_cache.register_cache()
     exporter_extension_layout_draw[rigidBody_Extension_Name] = draw_export
     importer_extension_layout_draw[rigidBody_Extension_Name] = draw_import
 
 def unregister():
     rb_ops.unregister_ops()
     rb_extra_ui.unregister_ui()
+    rb_cache.unregister_cache()
     del exporter_extension_layout_draw[rigidBody_Extension_Name]
     del importer_extension_layout_draw[rigidBody_Extension_Name]
@@ -0,0 +1,238 @@
+import numpy as np
+from typing import Optional
+
+# Upper bound on the number of candidate pairs generated at once by
+# sweep_and_prune, to bound memory use on large scenes
+sap_batch_pairs = 1 << 22
+
+
+class UnionFind:
+    """Disjoint sets of hashable items"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+
+def sweep_and_prune(mins: np.ndarray, maxs: np.ndarray) -> np.ndarray:
+    """Finds all pairs of overlapping boxes, given (n, 3) arrays of their
+    minimum and maximum corners. Boxes are sorted along X; each is tested
+    against the boxes which start before it ends, then the candidates are
+    filtered on Y and Z. Returns a (k, 2) array of box indices, i < j."""
+    n = len(mins)
+    if n < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    order = np.argsort(mins[:, 0], kind="stable")
+    sortedMin = mins[order]
+    sortedMax = maxs[order]
+    # Boxes [i + 1, ends[i]) start before box i ends along X
+    ends = np.searchsorted(sortedMin[:, 0], sortedMax[:, 0], side="right")
+    counts = np.maximum(ends - np.arange(n) - 1, 0)
+
+    results = []
+    start = 0
+    while start < n:
+        # Take as many boxes as fit in one batch of candidate pairs
+        cumulative = np.cumsum(counts[start:])
+        stop = start + max(1, int(np.searchsorted(cumulative, sap_batch_pairs)))
+        batchCounts = counts[start:stop]
+        total = int(batchCounts.sum())
+        if total:
+            first = np.repeat(np.arange(start, stop), batchCounts)
+            offsets = np.arange(total) - np.repeat(
+                np.cumsum(batchCounts) - batchCounts, batchCounts
+            )
+            second = first + 1 + offsets
+            overlap = np.all(
+                (sortedMin[first, 1:] <= sortedMax[second, 1:])
+                & (sortedMin[second, 1:] <= sortedMax[first, 1:]),
+                axis=1,
+            )
+            results.append(np.stack((first[overlap], second[overlap]), axis=1))
+        start = stop
+
+    if not results:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = order[np.concatenate(results)]
+    return np.sort(pairs, axis=1)
+
+
+def _closest_segment_points(p1, q1, p2, q2):
+    """Closest points between segments p1-q1 and p2-q2"""
+    d1 = q1 - p1
+    d2 = q2 - p2
+    r = p1 - p2
+    a = d1.dot(d1)
+    e = d2.dot(d2)
+    f = d2.dot(r)
+    if a <= 1e-12 and e <= 1e-12:
+        return p1, p2
+    if a <= 1e-12:
+        s = 0.0
+        t = np.clip(f / e, 0.0, 1.0)
+    else:
+        c = d1.dot(r)
+        if e <= 1e-12:
+            t = 0.0
+            s = np.clip(-c / a, 0.0, 1.0)
+        else:
+            b = d1.dot(d2)
+            denom = a * e - b * b
+            s = np.clip((b * f - c * e) / denom, 0.0, 1.0) if denom > 1e-12 else 0.0
+            t = (b * s + f) / e
+            if t < 0.0:
+                t = 0.0
+                s = np.clip(-c / a, 0.0, 1.0)
+            elif t > 1.0:
+                t = 1.0
+                s = np.clip((b - c) / a, 0.0, 1.0)
+    return p1 + d1 * s, p2 + d2 * t
+
+
+def _closest_point_obb(point, center, axes, halfExtents):
+    local = axes.T @ (point - center)
+    return center + axes @ np.clip(local, -halfExtents, halfExtents)
+
+
+def _obb_obb(a, b, slop) -> bool:
+    """Separating axis test between two oriented boxes"""
+    ca, Ra, ha = a
+    cb, Rb, hb = b
+    axes = [Ra[:, i] for i in range(3)] + [Rb[:, i] for i in range(3)]
+    for i in range(3):
+        for j in range(3):
+            cross = np.cross(Ra[:, i], Rb[:, j])
+            if cross.dot(cross) > 1e-12:
+                axes.append(cross / np.sqrt(cross.dot(cross)))
+    d = cb - ca
+    for axis in axes:
+        ra = np.abs(Ra.T @ axis).dot(ha)
+        rb = np.abs(Rb.T @ axis).dot(hb)
+        if abs(d.dot(axis)) > ra + rb - slop:
+            return False
+    return True
+
+
+def primitives_overlap(a, b, slop: float) -> Optional[bool]:
+    """Tests two world space primitives for overlap deeper than `slop`. Each
+    primitive is ("sphere", center, radius), ("capsule", p, q, radius) or
+    ("box", center, axes, halfExtents). Returns None if the pair of shapes
+    can't be tested."""
+    if a == None or b == None:
+        return None
+    kinds = {"sphere": 0, "capsule": 1, "box": 2}
+    if kinds[a[0]] > kinds[b[0]]:
+        a, b = b, a
+
+    if a[0] in ("sphere", "capsule") and b[0] in ("sphere", "capsule"):
+        # A sphere is a capsule with zero length
+        p1, q1, r1 = (a[1], a[1], a[2]) if a[0] == "sphere" else a[1:]
+        p2, q2, r2 = (b[1], b[1], b[2]) if b[0] == "sphere" else b[1:]
+        c1, c2 = _closest_segment_points(p1, q1, p2, q2)
+        return np.linalg.norm(c1 - c2) < r1 + r2 - slop
+    if a[0] == "sphere" and b[0] == "box":
+        closest = _closest_point_obb(a[1], *b[1:])
+        return np.linalg.norm(closest - a[1]) < a[2] - slop
+    if a[0] == "box" and b[0] == "box":
+        return _obb_obb(a[1:], b[1:], slop)
+    return None
+
+
+def primitive_thickness(primitive, aabbMin, aabbMax) -> float:
+    """Smallest extent of a world space primitive (see primitives_overlap()),
+    falling back to the smallest side of its bounds"""
+    if primitive != None:
+        if primitive[0] == "sphere":
+            return 2.0 * primitive[2]
+        if primitive[0] == "capsule":
+            return 2.0 * primitive[3]
+        if primitive[0] == "box":
+            return 2.0 * float(np.min(primitive[3]))
+    return float(np.min(np.asarray(aabbMax) - np.asarray(aabbMin)))
+
+
+def aabb_to_gltf(lo, hi, yup: bool):
+    """Converts a Blender space AABB to glTF space"""
+    if yup:
+        return [lo[0], lo[2], -hi[1]], [hi[0], hi[2], -lo[1]]
+    return list(lo), list(hi)
+
+
+def _spread_bits(x: np.ndarray) -> np.ndarray:
+    """Inserts two zero bits between each of the low 10 bits of x"""
+    x = x.astype(np.uint32) & 0x3FF
+    x = (x | (x << 16)) & 0x030000FF
+    x = (x | (x << 8)) & 0x0300F00F
+    x = (x | (x << 4)) & 0x030C30C3
+    x = (x | (x << 2)) & 0x09249249
+    return x
+
+
+def morton_order(points: np.ndarray) -> np.ndarray:
+    """Returns the order of the points along a Z-order curve over their
+    bounds, which keeps nearby points close together in the sequence"""
+    if len(points) == 0:
+        return np.empty(0, dtype=np.int64)
+    lo = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lo, 1e-12)
+    cells = np.floor((points - lo) / extent * 1023).astype(np.uint32)
+    codes = (
+        _spread_bits(cells[:, 0])
+        | (_spread_bits(cells[:, 1]) << 1)
+        | (_spread_bits(cells[:, 2]) << 2)
+    )
+    return np.argsort(codes, kind="stable")
+
+
+def tree_components(edges):
+    """Splits a graph, given as (a, b, key) edges, into connected components
+    and returns those which are trees (no loops or repeated edges), each as
+    a (nodes, edges) pair"""
+    components = UnionFind()
+    for a, b, _ in edges:
+        components.union(a, b)
+    nodes = {}
+    componentEdges = {}
+    for edge in edges:
+        root = components.find(edge[0])
+        nodes.setdefault(root, set()).update(edge[:2])
+        componentEdges.setdefault(root, []).append(edge)
+    return [
+        (nodes[root], componentEdges[root])
+        for root in nodes
+        if len(componentEdges[root]) == len(nodes[root]) - 1
+    ]
+
+
+def tree_order(root, edges):
+    """Orders the nodes of a tree breadth first from `root`, so parents come
+    before their children. Returns (node, parentIndex, key) tuples, where
+    parentIndex is -1 for the root and key is that of the edge to the parent"""
+    adjacent = {}
+    for a, b, key in edges:
+        adjacent.setdefault(a, []).append((b, key))
+        adjacent.setdefault(b, []).append((a, key))
+    order = [(root, -1, None)]
+    visited = {root}
+    i = 0
+    while i < len(order):
+        node = order[i][0]
+        for child, key in adjacent.get(node, []):
+            if child not in visited:
+                visited.add(child)
+                order.append((child, i, key))
+        i += 1
+    return order
@@ -0,0 +1,138 @@
+import math
+from typing import List
+from .gltf2_blender_rigid_bodies_analysis import UnionFind
+
+# Number of constrained axes for joint types which always constrain the same
+# axes; the others depend on which limits are enabled
+fixed_joint_axes = {"FIXED": 6, "POINT": 3, "HINGE": 5, "SLIDER": 5, "PISTON": 4}
+
+
+class AuditFinding:
+    def __init__(self, kind: str, name: str, value: float, message: str):
+        self.kind = kind
+        self.name = name
+        self.value = value
+        self.message = message
+
+
+class IslandAudit:
+    def __init__(self):
+        self.bodies = set()
+        self.joints = []
+        self.axes = 0
+        # Constrained axes times solver iterations, summed over the joints
+        self.axisIterations = 0
+        self.maxMassRatio = 1.0
+        self.cost = 0.0
+
+
+def is_dynamic(obj) -> bool:
+    rb = obj.rigid_body if obj != None else None
+    return (
+        rb != None and rb.enabled and rb.type == "ACTIVE" and not rb.kinematic
+    )
+
+
+def constrained_axes(joint_node) -> int:
+    """Number of axes a joint constrains, i.e. the number of rows it adds to
+    the solver, including drives"""
+    joint = joint_node.rigid_body_constraint
+    axes = fixed_joint_axes.get(joint.type, 0)
+    if joint.type == "HINGE":
+        axes += int(joint.use_limit_ang_z)
+    elif joint.type == "SLIDER":
+        axes += int(joint.use_limit_lin_x)
+    elif joint.type == "PISTON":
+        axes += int(joint.use_limit_lin_x) + int(joint.use_limit_ang_x)
+    elif joint.type in ("GENERIC", "GENERIC_SPRING"):
+        for kind in ("lin", "ang"):
+            for axis in "xyz":
+                axes += int(getattr(joint, "use_limit_%s_%s" % (kind, axis)))
+        extra = joint_node.khr_physics_extra_constraint_props
+        for kind in ("lin", "ang"):
+            for axis in "xyz":
+                axes += int(getattr(extra, "use_%s_drive_%s" % (kind, axis)))
+    return axes
+
+
+def joint_iterations(joint_node, solver_iterations: int) -> int:
+    """Solver iterations spent on a joint; its own, if it overrides those of
+    the rigid body world"""
+    joint = joint_node.rigid_body_constraint
+    if joint.use_override_solver_iterations:
+        return joint.solver_iterations
+    return solver_iterations
+
+
+def mass_ratio(joint_node) -> float:
+    """Ratio of the heavier to the lighter of the bodies a joint connects.
+    Joints to static or kinematic bodies don't suffer from mass ratios."""
+    joint = joint_node.rigid_body_constraint
+    if not is_dynamic(joint.object1) or not is_dynamic(joint.object2):
+        return 1.0
+    masses = sorted((joint.object1.rigid_body.mass, joint.object2.rigid_body.mass))
+    return masses[1] / max(masses[0], 1e-9)
+
+
+def audit_joints(
+    joint_nodes,
+    solver_iterations: int,
+    mass_ratio_limit: float,
+    cost_limit: float,
+):
+    """Groups joints into islands of dynamic bodies and estimates the cost of
+    solving each island. The estimate, in arbitrary units, is the number of
+    axes each joint constrains times its solver iterations, summed over the
+    island and scaled up by the island's worst mass ratio, which slows
+    convergence. Returns the islands and a list of findings for joints and
+    islands which exceed the limits."""
+    islands = UnionFind()
+    joints = [j for j in joint_nodes if j.rigid_body_constraint.enabled]
+    for joint_node in joints:
+        joint = joint_node.rigid_body_constraint
+        bodies = [b for b in (joint.object1, joint.object2) if is_dynamic(b)]
+        for body in bodies:
+            islands.union(bodies[0].name, body.name)
+
+    audits = {}
+    findings: List[AuditFinding] = []
+    for joint_node in joints:
+        joint = joint_node.rigid_body_constraint
+        dynamic = [b for b in (joint.object1, joint.object2) if is_dynamic(b)]
+        if not dynamic:
+            continue
+        island = audits.setdefault(islands.find(dynamic[0].name), IslandAudit())
+        island.bodies.update(b.name for b in dynamic)
+        island.joints.append(joint_node)
+        axes = constrained_axes(joint_node)
+        island.axes += axes
+        island.axisIterations += axes * joint_iterations(joint_node, solver_iterations)
+        ratio = mass_ratio(joint_node)
+        island.maxMassRatio = max(island.maxMassRatio, ratio)
+        if ratio > mass_ratio_limit:
+            findings.append(
+                AuditFinding(
+                    "MASS_RATIO",
+                    joint_node.name,
+                    ratio,
+                    "Mass ratio %.1f between '%s' and '%s'"
+                    % (ratio, joint.object1.name, joint.object2.name),
+                )
+            )
+
+    for island in audits.values():
+        island.cost = island.axisIterations * (1 + math.log2(island.maxMassRatio))
+        if island.cost > cost_limit:
+            root = min(island.bodies)
+            findings.append(
+                AuditFinding(
+                    "ISLAND_COST",
+                    root,
+                    island.cost,
+                    "Island of '%s' has %i bodies, %i joints and %i constrained axes; "
+                    "estimated cost %.0f"
+                    % (root, len(island.bodies), len(island.joints), island.axes, island.cost),
+                )
+            )
+    findings.sort(key=lambda f: -f.value)
+    return list(audits.values()), findings
@@ -0,0 +1,82 @@
+import bpy
+from bpy.app.handlers import persistent
+from typing import Any, Dict, Optional
+
+
+class CacheEntry:
+    """Cached export results for a single object"""
+
+    def __init__(self, meshUid: Optional[int]):
+        self.meshUid = meshUid
+        self.values: Dict[Any, Any] = {}
+
+
+class PhysicsExportCache:
+    """Keeps the physics data generated for each object between exports.
+    Entries are dropped whenever the depsgraph reports a change to an object
+    or its mesh, or one of our physics properties is edited, so a re-export
+    only needs to regenerate data for objects which have changed."""
+
+    def __init__(self):
+        self.entries: Dict[int, CacheEntry] = {}
+
+    def get(self, obj, key):
+        entry = self.entries.get(obj.session_uid)
+        if entry == None:
+            return None
+        return entry.values.get(key)
+
+    def put(self, obj, key, value):
+        entry = self.entries.get(obj.session_uid)
+        if entry == None:
+            meshUid = obj.data.session_uid if obj.data != None else None
+            entry = CacheEntry(meshUid)
+            self.entries[obj.session_uid] = entry
+        entry.values[key] = value
+
+    def invalidate(self, obj):
+        self.entries.pop(obj.session_uid, None)
+
+    def invalidate_mesh(self, mesh):
+        uid = mesh.session_uid
+        for objUid in [k for k, v in self.entries.items() if v.meshUid == uid]:
+            del self.entries[objUid]
+
+    def clear(self):
+        self.entries.clear()
+
+
+physics_export_cache = PhysicsExportCache()
+
+
+def mark_physics_dirty(self, context):
+    """Update callback for our physics property groups"""
+    physics_export_cache.invalidate(self.id_data)
+
+
+@persistent
+def _on_depsgraph_update_post(scene, depsgraph):
+    if not physics_export_cache.entries:
+        return
+    for update in depsgraph.updates:
+        updated = update.id.original
+        if isinstance(updated, bpy.types.Object):
+            physics_export_cache.invalidate(updated)
+        elif isinstance(updated, bpy.types.Mesh):
+            physics_export_cache.invalidate_mesh(updated)
+
+
+@persistent
+def _on_load_post(*args):
+    physics_export_cache.clear()
+
+
+def register_cache():
+    bpy.app.handlers.depsgraph_update_post.append(_on_depsgraph_update_post)
+    bpy.app.handlers.load_post.append(_on_load_post)
+
+
+def unregister_cache():
+    bpy.app.handlers.depsgraph_update_post.remove(_on_depsgraph_update_post)
+    bpy.app.handlers.load_post.remove(_on_load_post)
+    physics_export_cache.clear()
@@ -0,0 +1,254 @@
+import math
+import numpy as np
+from typing import Optional, Tuple
+
+# Faces of a convex hull within this angle of coplanar are merged
+hull_dissolve_angle = math.radians(1.0)
+
+# One node of a flattened BVH. For leaves, offset/count select a range of the
+# BVH's triangle order. Internal nodes have a count of 0; their first child
+# immediately follows them and offset is the index of their second child.
+bvh_node_dtype = np.dtype(
+    [("min", "<f4", 3), ("max", "<f4", 3), ("offset", "<u4"), ("count", "<u4")]
+)
+
+
+def build_bvh(
+    positions: np.ndarray, triangles: np.ndarray, leaf_size: int = 4
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Builds an AABB tree over the triangles, splitting at the median
+    centroid along the longest axis. Returns the nodes in depth-first order
+    and the order of the triangles referenced by the leaves"""
+    corners = positions[triangles]
+    triMin = corners.min(axis=1)
+    triMax = corners.max(axis=1)
+    centroids = (triMin + triMax) * 0.5
+
+    order = np.arange(len(triangles), dtype=np.uint32)
+    nodes = []
+    stack = [(0, len(order), None)] if len(order) else []
+    while stack:
+        start, end, parent = stack.pop()
+        nodeIdx = len(nodes)
+        if parent != None:
+            nodes[parent][2] = nodeIdx
+        subset = order[start:end]
+        node = [triMin[subset].min(axis=0), triMax[subset].max(axis=0), start, end - start]
+        nodes.append(node)
+        if end - start <= leaf_size:
+            continue
+
+        subCentroids = centroids[subset]
+        axis = np.argmax(subCentroids.max(axis=0) - subCentroids.min(axis=0))
+        mid = (end - start) // 2
+        order[start:end] = subset[np.argpartition(subCentroids[:, axis], mid)]
+        node[3] = 0
+        # Push the second child first, so the first is visited next
+        stack.append((start + mid, end, nodeIdx))
+        stack.append((start, start + mid, None))
+
+    result = np.zeros(len(nodes), dtype=bvh_node_dtype)
+    for i, (lo, hi, offset, count) in enumerate(nodes):
+        result[i] = (lo, hi, offset, count)
+    return result, order
+
+
+def convex_hull(
+    positions: np.ndarray, dissolve_angle: float = hull_dissolve_angle
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Computes the convex hull of the positions, merging faces which are
+    within `dissolve_angle` of coplanar. Returns the hull's vertices, one
+    plane (normal, distance) per face and the hull's edges as pairs of
+    vertex indices"""
+    import bmesh
+
+    bm = bmesh.new()
+    try:
+        for co in positions:
+            bm.verts.new(co.tolist())
+        hull = bmesh.ops.convex_hull(bm, input=bm.verts[:])
+        bmesh.ops.delete(
+            bm, geom=hull["geom_interior"] + hull["geom_unused"], context="VERTS"
+        )
+        bmesh.ops.dissolve_limit(
+            bm, angle_limit=dissolve_angle, verts=bm.verts[:], edges=bm.edges[:]
+        )
+        bm.normal_update()
+        bm.verts.index_update()
+
+        vertices = np.array([v.co for v in bm.verts], dtype=np.float32).reshape(-1, 3)
+        planes = np.array(
+            [(*f.normal, -f.normal.dot(f.verts[0].co)) for f in bm.faces],
+            dtype=np.float32,
+        ).reshape(-1, 4)
+        edges = np.array(
+            [(e.verts[0].index, e.verts[1].index) for e in bm.edges], dtype=np.uint32
+        ).reshape(-1, 2)
+    finally:
+        bm.free()
+    return vertices, planes, edges
+
+
+# Edge classifications written by edge_convexity()
+edge_boundary = 0
+edge_convex = 1
+edge_concave = 2
+edge_flat = 3
+
+# Edges whose faces are within this angle of coplanar are classed as flat
+flat_edge_angle = math.radians(1.0)
+
+
+def edge_convexity(
+    positions: np.ndarray, triangles: np.ndarray, flat_angle: float = flat_edge_angle
+) -> np.ndarray:
+    """Classifies each triangle's edges by the angle they make with the
+    neighbouring triangle. Edge i of a triangle runs from its vertex i to
+    vertex i+1; its class is stored in bits 2i..2i+1 of the triangle's flags.
+    Edges without exactly one neighbour are classed as boundary edges."""
+    numTris = len(triangles)
+    flags = np.full(numTris * 3, edge_boundary, dtype=np.uint8)
+    if numTris == 0:
+        return flags
+
+    corners = positions[triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    normals /= np.where(lengths > 0, lengths, 1.0)[:, None]
+
+    # Half edge h is edge h % 3 of triangle h // 3
+    starts = triangles.reshape(-1)
+    ends = np.roll(triangles, -1, axis=1).reshape(-1)
+    opposite = np.roll(triangles, -2, axis=1).reshape(-1)
+    keys = np.stack((np.minimum(starts, ends), np.maximum(starts, ends)), axis=1)
+    _, inverse, counts = np.unique(
+        keys, axis=0, return_inverse=True, return_counts=True
+    )
+    inverse = inverse.reshape(-1)
+
+    # Pair up the two half edges of each manifold edge
+    order = np.argsort(inverse, kind="stable")
+    groupStarts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    manifold = groupStarts[counts == 2]
+    h1 = order[manifold]
+    h2 = order[manifold + 1]
+    t1 = h1 // 3
+    t2 = h2 // 3
+
+    cosAngle = np.einsum("ij,ij->i", normals[t1], normals[t2])
+    side = np.einsum(
+        "ij,ij->i", normals[t1], positions[opposite[h2]] - positions[starts[h1]]
+    )
+    edgeClass = np.where(side < 0, edge_convex, edge_concave).astype(np.uint8)
+    edgeClass[cosAngle >= math.cos(flat_angle)] = edge_flat
+    flags[h1] = edgeClass
+    flags[h2] = edgeClass
+
+    flags = flags.reshape(-1, 3)
+    return flags[:, 0] | (flags[:, 1] << 2) | (flags[:, 2] << 4)
+
+
+def _regular_axis(values: np.ndarray, tolerance: float):
+    """If the values lie on a regular 1D grid, returns the grid's origin,
+    spacing and each value's grid index"""
+    ordered = np.sort(values)
+    count = int(np.count_nonzero(np.diff(ordered) > tolerance)) + 1
+    if count < 2:
+        return None
+    origin = ordered[0]
+    spacing = (ordered[-1] - origin) / (count - 1)
+    indices = np.round((values - origin) / spacing).astype(np.int64)
+    if np.abs(values - (origin + indices * spacing)).max() > tolerance:
+        return None
+    return origin, spacing, indices
+
+
+def detect_heightfield(
+    positions: np.ndarray, triangles: np.ndarray, up_axis: int, tolerance: float
+) -> Optional[dict]:
+    """Checks whether a triangle mesh is a regular grid, aligned to the axes
+    perpendicular to `up_axis`, with one vertex per grid point and every cell
+    split into two triangles along the same diagonal. If so, returns its
+    heights as 16 bit samples, in rows along the second horizontal axis and
+    columns along the first, with the grid's origin, spacing, the scale of
+    each sample step and the diagonal; "main" if it joins samples (row, col)
+    and (row + 1, col + 1), "anti" if it joins (row, col + 1) and
+    (row + 1, col). The heights are quantized with an error of at most
+    `tolerance`; otherwise None is returned."""
+    if len(triangles) == 0:
+        return None
+    colAxis, rowAxis = [a for a in range(3) if a != up_axis]
+    cols = _regular_axis(positions[:, colAxis], tolerance)
+    rows = _regular_axis(positions[:, rowAxis], tolerance)
+    if cols == None or rows == None:
+        return None
+    colOrigin, colSpacing, colIdx = cols
+    rowOrigin, rowSpacing, rowIdx = rows
+    numCols = int(colIdx.max()) + 1
+    numRows = int(rowIdx.max()) + 1
+
+    # Every grid point must have exactly one vertex
+    if len(positions) != numCols * numRows or numCols < 2 or numRows < 2:
+        return None
+    cell = rowIdx * numCols + colIdx
+    if len(np.unique(cell)) != len(positions):
+        return None
+    diagonal = _grid_diagonal(colIdx[triangles], rowIdx[triangles], numCols, numRows)
+    if diagonal == None:
+        return None
+
+    heights = np.empty(numCols * numRows, dtype=np.float64)
+    heights[cell] = positions[:, up_axis]
+    lo = heights.min()
+    heightScale = (heights.max() - lo) / 65535.0
+    if heightScale == 0:
+        samples = np.zeros(len(heights), dtype=np.uint16)
+    else:
+        samples = np.round((heights - lo) / heightScale).astype(np.uint16)
+    if np.abs(lo + samples * heightScale - heights).max() > tolerance:
+        return None
+
+    origin = [0.0, 0.0, 0.0]
+    origin[colAxis] = float(colOrigin)
+    origin[rowAxis] = float(rowOrigin)
+    origin[up_axis] = float(lo)
+    return {
+        "samples": samples.reshape(numRows, numCols),
+        "columns": numCols,
+        "rows": numRows,
+        "origin": origin,
+        "spacing": [float(colSpacing), float(rowSpacing)],
+        "heightScale": float(heightScale),
+        "diagonal": diagonal,
+    }
+
+
+def _grid_diagonal(triCols, triRows, numCols, numRows) -> Optional[str]:
+    """Checks that each cell of the grid is made of two triangles, which use
+    three of its corners each and are split along the same diagonal in every
+    cell. Returns that diagonal, or None."""
+    col0 = triCols.min(axis=1)
+    row0 = triRows.min(axis=1)
+    if (triCols.max(axis=1) - col0 != 1).any() or (triRows.max(axis=1) - row0 != 1).any():
+        return None
+    # Corners are numbered 0: (row, col), 1: (row, col + 1), 2: (row + 1, col)
+    # and 3: (row + 1, col + 1); each triangle's corners are a 4 bit mask
+    corners = (triCols - col0[:, None]) + 2 * (triRows - row0[:, None])
+    masks = np.bitwise_or.reduce(1 << corners, axis=1)
+    if not np.isin(masks, (0b0111, 0b1011, 0b1101, 0b1110)).all():
+        return None
+    # A triangle missing corner 0 or 3 lies along the anti diagonal
+    anti = (masks == 0b1110) | (masks == 0b0111)
+    if anti.any() and not anti.all():
+        return None
+
+    numCells = (numCols - 1) * (numRows - 1)
+    cells = row0 * (numCols - 1) + col0
+    if (np.bincount(cells, minlength=numCells) != 2).any():
+        return None
+    # Two different triangles along the same diagonal cover the whole cell
+    covered = np.zeros(numCells, dtype=masks.dtype)
+    np.bitwise_or.at(covered, cells, masks)
+    if (covered != 0b1111).any():
+        return None
+    return "anti" if anti[0] else "main"
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+def linear_error(values: np.ndarray, first: int, last: int) -> np.ndarray:
+    """Distance of each of the evenly spaced samples between `first` and
+    `last` from a linear interpolation of those two samples"""
+    t = np.linspace(0.0, 1.0, last - first + 1)[1:-1, None]
+    approx = values[first] * (1.0 - t) + values[last] * t
+    return np.linalg.norm(values[first + 1 : last] - approx, axis=1)
+
+
+def slerp_error(quats: np.ndarray, first: int, last: int) -> np.ndarray:
+    """Angle between each of the evenly spaced rotations between `first` and
+    `last` and a spherical interpolation of those two rotations"""
+    t = np.linspace(0.0, 1.0, last - first + 1)[1:-1, None]
+    q0 = quats[first]
+    q1 = quats[last]
+    d = q0.dot(q1)
+    if d < 0:
+        q1 = -q1
+        d = -d
+    theta = np.arccos(min(d, 1.0))
+    if theta < 1e-6:
+        approx = q0 * (1.0 - t) + q1 * t
+    else:
+        approx = (np.sin((1.0 - t) * theta) * q0 + np.sin(t * theta) * q1) / np.sin(theta)
+    approx /= np.linalg.norm(approx, axis=1)[:, None]
+    dots = np.abs(np.einsum("ij,ij->i", quats[first + 1 : last], approx))
+    return 2.0 * np.arccos(np.minimum(dots, 1.0))
+
+
+def continuous_quaternions(quats: np.ndarray) -> np.ndarray:
+    """Flips the sign of quaternions so each is in the same hemisphere as the
+    one before it, so interpolation takes the short way round"""
+    quats = quats.copy()
+    for i in range(1, len(quats)):
+        if quats[i].dot(quats[i - 1]) < 0:
+            quats[i] = -quats[i]
+    return quats
+
+
+def simplify_keys(values: np.ndarray, tolerance: float, error=linear_error) -> np.ndarray:
+    """Chooses the keys to keep from a track of evenly spaced samples, so that
+    interpolating between them stays within `tolerance` of every sample, by
+    recursively keeping the sample furthest from the interpolation
+    (Ramer-Douglas-Peucker). Returns the sorted indices of the kept keys."""
+    count = len(values)
+    if count <= 2:
+        return np.arange(count)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        errors = error(values, first, last)
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def is_constant(values: np.ndarray, tolerance: float, error=linear_error) -> bool:
+    """Whether every sample is within `tolerance` of the first"""
+    if len(values) < 2:
+        return True
+    # Measure each sample against an interpolation between the first sample
+    # and itself, i.e. the first sample
+    padded = np.concatenate((values, values[:1]))
+    return error(padded, 0, len(padded) - 1).max() <= tolerance
@@ -0,0 +1,117 @@
+import numpy as np
+from typing import Tuple
+
+# Largest vertex count which can be indexed with 16 bit indices; glTF reserves
+# the maximum value of an index type for primitive restart
+max_uint16_vertices = 0xFFFF
+
+
+def mesh_triangles(meshData) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the vertex positions and triangulated faces of a mesh as
+    (n, 3) float and (m, 3) int arrays"""
+    meshData.calc_loop_triangles()
+    positions = np.empty(len(meshData.vertices) * 3, dtype=np.float32)
+    meshData.vertices.foreach_get("co", positions)
+    triangles = np.empty(len(meshData.loop_triangles) * 3, dtype=np.int32)
+    meshData.loop_triangles.foreach_get("vertices", triangles)
+    return positions.reshape(-1, 3), triangles.reshape(-1, 3)
+
+
+def to_gltf_space(positions: np.ndarray, yup: bool) -> np.ndarray:
+    """Converts Blender positions into glTF's coordinate system"""
+    if not yup:
+        return positions
+    return np.stack((positions[:, 0], positions[:, 2], -positions[:, 1]), axis=1)
+
+
+def weld_vertices(
+    positions: np.ndarray, triangles: np.ndarray, tolerance: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Merges vertices which lie in the same cell of a grid of size
+    `tolerance`. Vertices closer than `tolerance` which straddle a cell
+    boundary are not merged, which is harmless for collision purposes"""
+    if len(positions) == 0:
+        return positions, triangles
+    keys = np.floor(positions / max(tolerance, 1e-12)).astype(np.int64)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    return positions[first], inverse.reshape(-1)[triangles]
+
+
+def remove_degenerate_triangles(
+    positions: np.ndarray, triangles: np.ndarray, area_epsilon: float = 1e-12
+) -> np.ndarray:
+    """Removes triangles which reference the same vertex twice or have no area"""
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    distinct = (a != b) & (b != c) & (c != a)
+    cross = np.cross(positions[b] - positions[a], positions[c] - positions[a])
+    area2 = np.einsum("ij,ij->i", cross, cross)
+    return triangles[distinct & (area2 > area_epsilon * area_epsilon)]
+
+
+def remove_unused_vertices(
+    positions: np.ndarray, triangles: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    used, inverse = np.unique(triangles, return_inverse=True)
+    return positions[used], inverse.reshape(triangles.shape)
+
+
+def transform_points(positions: np.ndarray, matrix) -> np.ndarray:
+    """Applies a 4x4 affine transform to (n, 3) positions"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return positions @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def merge_meshes(parts) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenates (positions, triangles) pairs into a single mesh"""
+    offsets = np.cumsum([0] + [len(p) for p, _ in parts[:-1]])
+    positions = np.concatenate([p for p, _ in parts]).reshape(-1, 3)
+    triangles = np.concatenate(
+        [t + offset for (_, t), offset in zip(parts, offsets)]
+    ).reshape(-1, 3)
+    return positions, triangles
+
+
+def clean_mesh(
+    positions: np.ndarray, triangles: np.ndarray, weld_tolerance: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Welds vertices and removes degenerate triangles and unused vertices.
+    Returns float32 positions and indices of the smallest unsigned type able
+    to index them"""
+    positions, triangles = weld_vertices(positions, triangles, weld_tolerance)
+    triangles = remove_degenerate_triangles(positions, triangles)
+    positions, triangles = remove_unused_vertices(positions, triangles)
+    indexType = np.uint16 if len(positions) < max_uint16_vertices else np.uint32
+    return positions.astype(np.float32), triangles.astype(indexType)
+
+
+def collision_mesh(
+    meshData, yup: bool, weld_tolerance: float
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Builds a single welded triangle list from a mesh, in glTF space,
+    suitable for a collision mesh"""
+    positions, triangles = mesh_triangles(meshData)
+    positions = to_gltf_space(positions.astype(np.float64), yup)
+    return clean_mesh(positions, triangles, weld_tolerance)
+
+
+def quantize_positions(
+    positions: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+    """Quantizes positions to normalized int16, as allowed by
+    KHR_mesh_quantization. Returns the quantized positions, padded to four
+    components so each element stays 4-byte aligned, the offset and scale
+    which dequantize them and the largest error introduced"""
+    lo = positions.min(axis=0).astype(np.float64)
+    hi = positions.max(axis=0).astype(np.float64)
+    offset = (lo + hi) * 0.5
+    scale = (hi - lo) * 0.5
+    scale[scale == 0] = 1.0
+
+    quantized = np.zeros((len(positions), 4), dtype=np.int16)
+    normalized = (positions - offset) / scale
+    quantized[:, :3] = np.clip(np.round(normalized * 32767), -32767, 32767)
+
+    dequantized = offset + scale * (quantized[:, :3] / 32767.0)
+    errors = np.linalg.norm(dequantized - positions, axis=1)
+    maxError = float(errors.max()) if len(errors) else 0.0
+    return quantized, offset, scale, maxError
@@ -1,5 +1,20 @@
 import bpy
+import collections
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from bpy_extras.io_utils import ExportHelper, ImportHelper
 from .gltf2_blender_rigid_bodies_util import *
+from .gltf2_blender_rigid_bodies_progress import (
+    OperationCancelled,
+    PhysicsAbort,
+    cancel_file_env_var,
+    progress_log_prefix,
+)
 
 
 class CalculateConeCapsuleParams(bpy.types.Operator):
@@ -26,9 +41,361 @@ class CalculateConeCapsuleParams(bpy.types.Operator):
         return {"FINISHED"}
 
 
+class BackgroundExport(bpy.types.Operator, ExportHelper):
+    """Export the scene with rigid body data in a background Blender process,
+    without blocking the user interface"""
+
+    bl_idname = "khr_physics_rigid_bodies.background_export"
+    bl_label = "glTF 2.0 with Physics (Background)"
+
+    filename_ext = ".glb"
+    filter_glob: bpy.props.StringProperty(default="*.glb;*.gltf", options={"HIDDEN"})
+    # The glTF exporter's settings which matter most to physics; the others
+    # keep their defaults
+    export_yup: bpy.props.BoolProperty(
+        name="+Y Up",
+        description="Export using glTF convention, +Y up",
+        default=True,
+    )
+    export_apply: bpy.props.BoolProperty(
+        name="Apply Modifiers",
+        description="Apply modifiers (excluding Armatures) to mesh objects",
+        default=False,
+    )
+    use_selection: bpy.props.BoolProperty(
+        name="Selected Objects",
+        description="Export selected objects only",
+        default=False,
+    )
+
+    _timer = None
+    _process = None
+    _tempdir = None
+    _output_lines = None
+    _started = 0.0
+    _cancelled_at = None
+
+    # Give the child this long to stop cleanly after a cancel, before killing it
+    cancel_grace_period = 5.0
+
+    def execute(self, context):
+        if self._process != None:
+            return {"CANCELLED"}
+
+        self._tempdir = tempfile.mkdtemp(prefix="khr_physics_export_")
+        blend_path = os.path.join(self._tempdir, "scene.blend")
+        manifest_path = os.path.join(self._tempdir, "manifest.json")
+        self._report_path = os.path.join(self._tempdir, "report.json")
+        self._cancel_path = os.path.join(self._tempdir, "cancel")
+
+        # The child process exports a snapshot of the scene as it is now,
+        # so the user is free to carry on editing
+        bpy.ops.wm.save_as_mainfile(filepath=blend_path, copy=True, check_existing=False)
+
+        props = context.scene.khr_physics_exporter_props
+        settings = {
+            p.identifier: getattr(props, p.identifier)
+            for p in props.bl_rna.properties
+            if p.identifier != "rna_type"
+        }
+        isGlb = self.filepath.lower().endswith(".glb")
+        settings["gltf"] = {
+            "export_format": "GLB" if isGlb else "GLTF_SEPARATE",
+            "export_yup": self.export_yup,
+            "export_apply": self.export_apply,
+            "use_selection": self.use_selection,
+        }
+        with open(manifest_path, "w") as f:
+            json.dump(
+                {
+                    "settings": settings,
+                    "jobs": [{"input": blend_path, "output": self.filepath}],
+                },
+                f,
+            )
+
+        addonModule = __package__.rsplit(".blender.", 1)[0]
+        batchScript = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            "exp",
+            "gltf2_blender_rigid_bodies_batch.py",
+        )
+        self._process = subprocess.Popen(
+            [
+                bpy.app.binary_path,
+                "--background",
+                "--python",
+                batchScript,
+                "--",
+                manifest_path,
+                "--workers",
+                "0",
+                "--report",
+                self._report_path,
+                "--addon",
+                addonModule,
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            env=dict(os.environ, **{cancel_file_env_var: self._cancel_path}),
+        )
+        # Blocking reads happen on a helper thread; the modal handler only
+        # ever looks at what has already been read
+        self._output_lines = collections.deque(maxlen=200)
+        threading.Thread(
+            target=self._read_output,
+            args=(self._process.stdout, self._output_lines),
+            daemon=True,
+        ).start()
+
+        self._started = time.monotonic()
+        self._cancelled_at = None
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.25, window=context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 1)
+        return {"RUNNING_MODAL"}
+
+    @staticmethod
+    def _read_output(stream, lines):
+        for line in stream:
+            lines.append(line.rstrip())
+
+    def _latest_progress(self):
+        """Finds the most recent progress line written by the export hooks,
+        returning the phase and fraction complete"""
+        for line in reversed(self._output_lines):
+            if line.startswith(progress_log_prefix):
+                phase, _, count = line[len(progress_log_prefix) :].strip().rpartition(" ")
+                done, _, total = count.partition("/")
+                if not done.isdigit() or (total and not total.isdigit()):
+                    # Other messages share the prefix, and may end in names
+                    # which contain "/"
+                    continue
+                if total and int(total):
+                    return phase, int(done) / int(total)
+                return phase, None
+        return None, None
+
+    def modal(self, context, event):
+        if event.type == "ESC" and self._cancelled_at == None:
+            # Ask the hooks to stop cleanly; the child is killed if it doesn't
+            open(self._cancel_path, "w").close()
+            self._cancelled_at = time.monotonic()
+
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+
+        if self._cancelled_at != None:
+            if (
+                self._process.poll() == None
+                and time.monotonic() - self._cancelled_at < self.cancel_grace_period
+            ):
+                return {"PASS_THROUGH"}
+            self._process.terminate()
+            self._process.wait()
+            self._finish(context)
+            self.report({"WARNING"}, "Background export cancelled")
+            return {"CANCELLED"}
+
+        if self._process.poll() == None:
+            elapsed = time.monotonic() - self._started
+            phase, fraction = self._latest_progress()
+            if fraction != None:
+                context.window_manager.progress_update(fraction)
+            context.workspace.status_text_set(
+                "Exporting %s (%.0fs, Esc to cancel)%s"
+                % (
+                    os.path.basename(self.filepath),
+                    elapsed,
+                    ": %s %.0f%%" % (phase, fraction * 100) if fraction != None else "",
+                )
+            )
+            return {"PASS_THROUGH"}
+
+        result = None
+        if os.path.exists(self._report_path):
+            with open(self._report_path) as f:
+                result = json.load(f)[0]
+        self._finish(context)
+
+        if result and result["success"]:
+            self.report(
+                {"INFO"},
+                "Exported %s (%i bytes) in %.1fs"
+                % (self.filepath, result["size"], result["seconds"]),
+            )
+            return {"FINISHED"}
+        error = result["error"] if result else "\n".join(self._output_lines)
+        if error.startswith(OperationCancelled.__name__):
+            self.report({"WARNING"}, "Background export cancelled")
+            return {"CANCELLED"}
+        self.report({"ERROR"}, "Background export failed: %s" % error)
+        return {"CANCELLED"}
+
+    def _finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        shutil.rmtree(self._tempdir, ignore_errors=True)
+        self._process = None
+
+
+class PatchPhysics(bpy.types.Operator, ImportHelper):
+    """Replace the rigid body data in a previously exported glTF file with the
+    scene's current physics settings, leaving all other data untouched"""
+
+    bl_idname = "khr_physics_rigid_bodies.patch_physics"
+    bl_label = "Patch glTF Physics"
+    bl_options = {"REGISTER"}
+
+    filter_glob: bpy.props.StringProperty(default="*.glb;*.gltf", options={"HIDDEN"})
+    export_yup: bpy.props.BoolProperty(
+        name="+Y Up",
+        description="The file was exported with +Y as the up axis",
+        default=True,
+    )
+    export_apply: bpy.props.BoolProperty(
+        name="Apply Modifiers",
+        description="The file was exported with modifiers applied",
+        default=False,
+    )
+
+    def execute(self, context):
+        from ..exp.gltf2_blender_rigid_bodies_patch import patch_physics
+
+        start = time.perf_counter()
+        export_settings = {
+            "gltf_yup": self.export_yup,
+            "gltf_apply": self.export_apply,
+        }
+        try:
+            numPatched = patch_physics(self.filepath, export_settings)
+        except (OSError, ValueError, PhysicsAbort) as e:
+            self.report({"ERROR"}, "Unable to patch %s: %s" % (self.filepath, e))
+            return {"CANCELLED"}
+        self.report(
+            {"INFO"},
+            "Patched physics on %i nodes of %s in %.2fs"
+            % (numPatched, self.filepath, time.perf_counter() - start),
+        )
+        return {"FINISHED"}
+
+
+class TiledExport(bpy.types.Operator, ExportHelper):
+    """Export the scene's physics as one glTF file per grid cell, with a
+    manifest describing the cells, for streaming large worlds"""
+
+    bl_idname = "khr_physics_rigid_bodies.tiled_export"
+    bl_label = "Export glTF Physics Tiles"
+    bl_options = {"REGISTER"}
+
+    filename_ext = ".json"
+    filter_glob: bpy.props.StringProperty(default="*.json", options={"HIDDEN"})
+    cell_size: bpy.props.FloatProperty(
+        name="Cell Size",
+        description="Size of each tile, in the XY plane",
+        default=64.0,
+        min=0.001,
+        subtype="DISTANCE",
+    )
+    physics_only: bpy.props.BoolProperty(
+        name="Physics Only",
+        description="Export only physics data into the tiles",
+        default=True,
+    )
+    export_format: bpy.props.EnumProperty(
+        name="Format",
+        items=(
+            ("GLB", "glTF Binary (.glb)", ""),
+            ("GLTF_SEPARATE", "glTF Separate (.gltf + .bin)", ""),
+        ),
+        default="GLB",
+    )
+    export_yup: bpy.props.BoolProperty(name="+Y Up", default=True)
+
+    def execute(self, context):
+        from ..exp.gltf2_blender_rigid_bodies_tiling import tile_export
+
+        start = time.perf_counter()
+        try:
+            manifest = tile_export(
+                self.filepath,
+                self.cell_size,
+                {"export_format": self.export_format, "export_yup": self.export_yup},
+                self.physics_only,
+            )
+        except (OSError, RuntimeError, PhysicsAbort) as e:
+            self.report({"ERROR"}, "Tiled export failed: %s" % e)
+            return {"CANCELLED"}
+        self.report(
+            {"INFO"},
+            "Exported %i tiles in %.2fs"
+            % (len(manifest["cells"]), time.perf_counter() - start),
+        )
+        return {"FINISHED"}
+
+
+class AuditJoints(bpy.types.Operator):
+    """Find joints between bodies of very different mass and groups of joints
+    which are expensive to solve"""
+
+    bl_idname = "khr_physics_rigid_bodies.audit_joints"
+    bl_label = "Audit Joints"
+    bl_options = {"REGISTER"}
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene.rigidbody_world != None
+
+    def execute(self, context):
+        from .gltf2_blender_rigid_bodies_audit import audit_joints
+
+        scene = context.scene
+        props = scene.khr_physics_audit_props
+        islands, findings = audit_joints(
+            [o for o in scene.objects if o.rigid_body_constraint != None],
+            scene.rigidbody_world.solver_iterations,
+            props.mass_ratio_limit,
+            props.island_cost_limit,
+        )
+        props.results.clear()
+        for finding in findings:
+            item = props.results.add()
+            item.kind = finding.kind
+            item.target = bpy.data.objects.get(finding.name)
+            item.value = finding.value
+            item.message = finding.message
+        props.active_result = 0
+        self.report(
+            {"WARNING"} if findings else {"INFO"},
+            "%i jointed islands, %i issues found" % (len(islands), len(findings)),
+        )
+        return {"FINISHED"}
+
+
+def menu_func_export(self, context):
+    self.layout.operator(BackgroundExport.bl_idname, text=BackgroundExport.bl_label)
+    self.layout.operator(PatchPhysics.bl_idname, text="glTF 2.0 Physics Patch")
+    self.layout.operator(TiledExport.bl_idname, text="glTF 2.0 Physics Tiles (.json)")
+
+
 def register_ops():
     bpy.utils.register_class(CalculateConeCapsuleParams)
+    bpy.utils.register_class(BackgroundExport)
+    bpy.utils.register_class(PatchPhysics)
+    bpy.utils.register_class(TiledExport)
+    bpy.utils.register_class(AuditJoints)
+    bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
 
 
 def unregister_ops():
+    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
+    bpy.utils.unregister_class(AuditJoints)
+    bpy.utils.unregister_class(TiledExport)
+    bpy.utils.unregister_class(PatchPhysics)
+    bpy.utils.unregister_class(BackgroundExport)
     bpy.utils.unregister_class(CalculateConeCapsuleParams)
@@ -0,0 +1,138 @@
+import bpy
+import os
+import time
+from typing import Optional
+
+# Lines written to the log by ProgressReporter start with this prefix, so that
+# tools driving a background export can pick them out of Blender's output
+progress_log_prefix = "KHR_physics_rigid_bodies:"
+
+# Tools which can't call request_cancel() (i.e. those driving Blender as a
+# child process) can cancel by creating the file named by this variable
+cancel_file_env_var = "KHR_PHYSICS_CANCEL_FILE"
+
+_cancel_requested = False
+
+# The error which aborted the current export or import, if any. The glTF addon
+# catches and logs any exception raised by a user extension's hook, then
+# carries on, so an abort can't stop it; instead, our hooks do nothing more
+# once this is set, and whoever started the export checks it afterwards
+_abort: Optional["PhysicsAbort"] = None
+
+# Reporters which have started a progress bar which hasn't been ended
+_open_reporters = []
+
+
+class PhysicsAbort(Exception):
+    """Base class for errors which should abort the whole export or import,
+    rather than just being logged by the hook which raised them"""
+
+
+class OperationCancelled(PhysicsAbort):
+    pass
+
+
+class ExportValidationError(PhysicsAbort):
+    """The scene failed a check which the user asked to fail the export"""
+
+
+def log(message: str):
+    """Writes a message to the log with the progress prefix, flushed so that
+    tools reading Blender's output see it straight away"""
+    print("%s %s" % (progress_log_prefix, message), flush=True)
+
+
+def request_cancel():
+    """Ask any running export or import to stop at the next opportunity"""
+    global _cancel_requested
+    _cancel_requested = True
+
+
+def reset_cancel():
+    """Clears any cancellation request and abort, as an export or import starts"""
+    global _cancel_requested, _abort
+    _cancel_requested = False
+    _abort = None
+
+
+def record_abort(error: "PhysicsAbort"):
+    """Records the error aborting the current export or import, closing any
+    progress reports it left open"""
+    global _abort
+    if _abort == None:
+        _abort = error
+        log("aborted: %s" % error)
+    end_progress()
+
+
+def is_aborted() -> bool:
+    return _abort != None
+
+
+def check_aborted(output_path: Optional[str] = None):
+    """Raises the error which aborted the last export, if any, first deleting
+    the partial file the glTF exporter wrote to `output_path`"""
+    global _abort
+    error, _abort = _abort, None
+    if error == None:
+        return
+    if output_path:
+        partialFiles = [output_path]
+        if output_path.lower().endswith(".gltf"):
+            partialFiles.append(os.path.splitext(output_path)[0] + ".bin")
+        for path in partialFiles:
+            if os.path.exists(path):
+                os.remove(path)
+    raise error
+
+
+def end_progress():
+    """Ends the progress reports of an operation which has been aborted"""
+    for reporter in list(_open_reporters):
+        reporter.end()
+
+
+def check_cancelled():
+    """Raises OperationCancelled if cancellation has been requested"""
+    cancel_file = os.environ.get(cancel_file_env_var)
+    if _cancel_requested or (cancel_file and os.path.exists(cancel_file)):
+        raise OperationCancelled("Cancelled by request")
+
+
+class ProgressReporter:
+    """Reports the progress of a long-running phase to the window manager and
+    the log, checking for cancellation on each step"""
+
+    log_interval = 1.0
+
+    def __init__(self, phase: str, total: Optional[int] = None):
+        self.phase = phase
+        self.total = total
+        self.count = 0
+        self.last_log = time.monotonic()
+        self.wm = bpy.context.window_manager
+        if self.wm and total:
+            self.wm.progress_begin(0, total)
+            _open_reporters.append(self)
+
+    def step(self, n: int = 1):
+        check_cancelled()
+        self.count += n
+        if self.wm and self.total:
+            self.wm.progress_update(min(self.count, self.total))
+        now = time.monotonic()
+        if now - self.last_log > self.log_interval:
+            self.last_log = now
+            self._log()
+
+    def end(self):
+        if self in _open_reporters:
+            _open_reporters.remove(self)
+            self.wm.progress_end()
+        self._log()
+
+    def _log(self):
+        if self.total:
+            log("%s %i/%i" % (self.phase, self.count, self.total))
+        else:
+            log("%s %i" % (self.phase, self.count))
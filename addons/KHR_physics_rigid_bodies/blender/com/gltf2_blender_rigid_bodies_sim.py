@@ -0,0 +1,47 @@
+import bpy
+from mathutils import Matrix
+from typing import Dict, List
+from .gltf2_blender_rigid_bodies_progress import ProgressReporter
+
+
+def simulated_bodies(scene) -> List[bpy.types.Object]:
+    """Objects whose motion comes from the scene's rigid body simulation,
+    i.e. dynamic bodies which aren't animated"""
+    world = scene.rigidbody_world
+    if world == None or world.collection == None:
+        return []
+    return [
+        o
+        for o in world.collection.objects
+        if o.rigid_body != None
+        and o.rigid_body.enabled
+        and o.rigid_body.type == "ACTIVE"
+        and not o.rigid_body.kinematic
+    ]
+
+
+def sample_simulation(scene, objects, frames) -> Dict[bpy.types.Object, List[Matrix]]:
+    """Records the world matrix of each object at each of the (sorted) frames.
+    The simulation is stepped one frame at a time from the start of its point
+    cache, since Blender can't jump to a frame which hasn't been simulated.
+    The current frame is restored afterwards."""
+    samples = {o: [] for o in objects}
+    world = scene.rigidbody_world
+    if world == None or not len(frames) or not len(objects):
+        return samples
+
+    wanted = set(frames)
+    first = min(world.point_cache.frame_start, frames[0])
+    oldFrame, oldSubframe = scene.frame_current, scene.frame_subframe
+    progress = ProgressReporter("frames simulated", frames[-1] - first + 1)
+    try:
+        for frame in range(first, frames[-1] + 1):
+            progress.step()
+            scene.frame_set(frame)
+            if frame in wanted:
+                for o in objects:
+                    samples[o].append(o.matrix_world.copy())
+    finally:
+        scene.frame_set(oldFrame, subframe=oldSubframe)
+        progress.end()
+    return samples
@@ -0,0 +1,224 @@
+# Approximates meshes with sets of spheres. This module only depends on numpy,
+# and is imported by its own name (not as part of the addon package) when it is
+# used from worker processes, which don't have bpy available.
+import contextlib
+import importlib.util
+import numpy as np
+import os
+import sys
+import types
+from typing import Tuple
+
+# Number of points sampled from the surface of the mesh, in addition to its
+# vertices; every one of them is covered by a sphere
+surface_sample_count = 2048
+
+# Resolution of the grid of points tested for being inside the mesh, which
+# the spheres' centers are clustered from
+volume_grid_resolution = 16
+
+# Number of points on each sphere tested for sticking out of the mesh
+sphere_sample_count = 32
+
+# Upper bound on the number of point/triangle pairs tested at once
+parity_batch_size = 1 << 22
+
+
+def sample_surface(
+    positions: np.ndarray, triangles: np.ndarray, count: int, rng
+) -> np.ndarray:
+    """Returns the mesh's vertices, plus `count` points spread evenly over
+    its surface"""
+    corners = positions[triangles]
+    areas = 0.5 * np.linalg.norm(
+        np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1
+    )
+    if len(triangles) == 0 or areas.sum() <= 0:
+        return positions.copy()
+    tri = rng.choice(len(triangles), size=count, p=areas / areas.sum())
+    u, v = rng.random((2, count))
+    flip = u + v > 1
+    u[flip] = 1 - u[flip]
+    v[flip] = 1 - v[flip]
+    a, b, c = corners[tri, 0], corners[tri, 1], corners[tri, 2]
+    points = a + u[:, None] * (b - a) + v[:, None] * (c - a)
+    return np.concatenate((positions, points))
+
+
+def inside_mesh(points: np.ndarray, positions: np.ndarray, triangles: np.ndarray):
+    """Tests which points are inside a closed mesh, by counting how many
+    triangles a ray cast along +Z from each point crosses"""
+    inside = np.zeros(len(points), dtype=bool)
+    if len(triangles) == 0 or len(points) == 0:
+        return inside
+    corners = positions[triangles]
+    a = corners[:, 0]
+    e0 = corners[:, 1] - a
+    e1 = corners[:, 2] - a
+    det = e0[:, 0] * e1[:, 1] - e1[:, 0] * e0[:, 1]
+    valid = np.abs(det) > 1e-12
+    a, e0, e1, det = a[valid], e0[valid], e1[valid], det[valid]
+
+    batch = max(1, parity_batch_size // max(len(a), 1))
+    for start in range(0, len(points), batch):
+        p = points[start : start + batch, None, :]
+        d = p - a
+        s = (d[..., 0] * e1[:, 1] - e1[:, 0] * d[..., 1]) / det
+        t = (e0[:, 0] * d[..., 1] - d[..., 0] * e0[:, 1]) / det
+        z = a[:, 2] + s * e0[:, 2] + t * e1[:, 2]
+        crossings = (s >= 0) & (t >= 0) & (s + t <= 1) & (z > p[..., 2])
+        inside[start : start + batch] = crossings.sum(axis=1) % 2 == 1
+    return inside
+
+
+def _volume_points(positions, triangles, rng) -> np.ndarray:
+    """Points of a grid over the mesh's bounds which lie inside it. The grid
+    is jittered, so rays don't pass exactly through shared edges."""
+    lo = positions.min(axis=0)
+    hi = positions.max(axis=0)
+    steps = (np.arange(volume_grid_resolution) + 0.5) / volume_grid_resolution
+    grid = np.stack(np.meshgrid(steps, steps, steps, indexing="ij"), axis=-1)
+    grid = grid.reshape(-1, 3)
+    grid += (rng.random(grid.shape) - 0.5) * (0.1 / volume_grid_resolution)
+    grid = lo + grid * (hi - lo)
+    return grid[inside_mesh(grid, positions, triangles)]
+
+
+def _squared_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2)
+
+
+def kmeans(points: np.ndarray, k: int, rng, iterations: int = 20) -> np.ndarray:
+    """Clusters the points into (at most) k groups, returning their centers"""
+    centers = [points[rng.integers(len(points))]]
+    nearest = ((points - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        if nearest.sum() <= 0:
+            break
+        # k-means++: pick new centers far from the existing ones
+        centers.append(points[rng.choice(len(points), p=nearest / nearest.sum())])
+        nearest = np.minimum(nearest, ((points - centers[-1]) ** 2).sum(axis=1))
+    centers = np.array(centers)
+    for _ in range(iterations):
+        labels = np.argmin(_squared_distances(points, centers), axis=1)
+        updated = centers.copy()
+        for i in range(len(centers)):
+            members = points[labels == i]
+            if len(members):
+                updated[i] = members.mean(axis=0)
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    return centers
+
+
+def _covering_radii(centers: np.ndarray, surface: np.ndarray):
+    """Assigns each surface point to its nearest center and sizes each
+    sphere to cover its points. Spheres with no points are dropped."""
+    d2 = _squared_distances(surface, centers)
+    labels = np.argmin(d2, axis=1)
+    radii = np.zeros(len(centers))
+    np.maximum.at(radii, labels, d2[np.arange(len(surface)), labels])
+    used = np.bincount(labels, minlength=len(centers)) > 0
+    return centers[used], np.sqrt(radii[used])
+
+
+def _fibonacci_directions(count: int) -> np.ndarray:
+    i = np.arange(count) + 0.5
+    z = 1 - 2 * i / count
+    r = np.sqrt(1 - z * z)
+    theta = np.pi * (1 + 5**0.5) * i
+    return np.stack((r * np.cos(theta), r * np.sin(theta), z), axis=1)
+
+
+def protrusion(
+    centers: np.ndarray,
+    radii: np.ndarray,
+    positions: np.ndarray,
+    triangles: np.ndarray,
+    surface: np.ndarray,
+) -> float:
+    """Estimates how far the spheres stick out of the mesh; the largest
+    distance from a point on a sphere outside the mesh to the mesh surface"""
+    directions = _fibonacci_directions(sphere_sample_count)
+    points = (centers[:, None, :] + radii[:, None, None] * directions).reshape(-1, 3)
+    outside = points[~inside_mesh(points, positions, triangles)]
+    if len(outside) == 0:
+        return 0.0
+    nearest = np.full(len(outside), np.inf)
+    for start in range(0, len(surface), 1024):
+        d2 = _squared_distances(outside, surface[start : start + 1024])
+        nearest = np.minimum(nearest, d2.min(axis=1))
+    return float(np.sqrt(nearest.max()))
+
+
+def sphere_tree(
+    positions: np.ndarray,
+    triangles: np.ndarray,
+    max_count: int,
+    tolerance: float,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Approximates a closed mesh with up to `max_count` spheres which cover
+    its surface. Sphere centers are found by k-means clustering of points
+    inside the mesh, with increasing numbers of spheres until they stick out
+    of the mesh by no more than `tolerance`. Returns the centers and radii of
+    the best set found, and how far it sticks out."""
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    if len(positions) == 0:
+        return np.empty((0, 3)), np.empty(0), 0.0
+    rng = np.random.default_rng(seed)
+    surface = sample_surface(positions, triangles, surface_sample_count, rng)
+    volume = _volume_points(positions, triangles, rng)
+    # Open meshes have no inside; fall back to clustering the surface
+    clusterPoints = volume if len(volume) >= max_count else surface
+
+    best = None
+    for count in range(1, max(max_count, 1) + 1):
+        centers = kmeans(clusterPoints, count, rng)
+        centers, radii = _covering_radii(centers, surface)
+        error = protrusion(centers, radii, positions, triangles, surface)
+        if best == None or error < best[2]:
+            best = (centers, radii, error)
+        if error <= tolerance:
+            break
+    return best
+
+
+def sphere_tree_job(args) -> Tuple[np.ndarray, np.ndarray, float]:
+    """Entry point for worker processes; takes sphere_tree()'s arguments as
+    a tuple"""
+    return sphere_tree(*args)
+
+
+# Directory worker processes import this module from
+module_directory = os.path.dirname(os.path.abspath(__file__))
+
+
+def standalone_module():
+    """Imports this module under its own name, from its own file, so that
+    functions pickled from it can be imported by spawned processes without
+    importing the addon. Those processes need `module_directory` on their
+    path; the path of this process is left alone"""
+    name = os.path.splitext(os.path.basename(__file__))[0]
+    module = sys.modules.get(name)
+    if module == None:
+        spec = importlib.util.spec_from_file_location(name, __file__)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return module
+
+
+@contextlib.contextmanager
+def hidden_main_module():
+    """Hides the __main__ module while worker processes are spawned, which
+    would otherwise re-import it. When Blender runs a script, such as the
+    batch exporter, that script imports bpy, which isn't available there"""
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
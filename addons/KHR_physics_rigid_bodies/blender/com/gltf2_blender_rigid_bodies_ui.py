@@ -1,5 +1,6 @@
 import bpy
 import gpu
+from bpy.app.handlers import persistent
 from gpu_extras.batch import batch_for_shader
 from mathutils import Quaternion, Vector, Euler
 import math
@@ -8,6 +9,7 @@ from ...io.com.gltf2_io_rigid_bodies import (
     physics_material_combine_types,
     physics_drive_mode_types,
 )
+from .gltf2_blender_rigid_bodies_cache import mark_physics_dirty
 
 
 class KHR_rigid_body_scene_properties(bpy.types.PropertyGroup):
@@ -76,6 +78,33 @@ class KHR_rigid_body_node_properties(bpy.types.PropertyGroup):
     )
     cone_capsule_height: bpy.props.FloatProperty(name="Height", default=1.0, min=0)
 
+    # Approximation of complex dynamic bodies by a compound of spheres
+    use_sphere_tree: bpy.props.BoolProperty(
+        name="Approximate with Spheres",
+        description="Export the collider as a compound of spheres fitted to the "
+        "mesh, which is cheaper to collide than a convex hull or triangle mesh",
+        default=False,
+    )
+    sphere_tree_count: bpy.props.IntProperty(
+        name="Max Spheres",
+        description="Largest number of spheres to use",
+        default=8,
+        min=1,
+        max=64,
+    )
+    sphere_tree_tolerance: bpy.props.FloatProperty(
+        name="Sphere Tolerance",
+        description="Use the fewest spheres which stick out of the mesh by no "
+        "more than this",
+        default=0.01,
+        min=0.0,
+        subtype="DISTANCE",
+    )
+
+    # Written to exported nodes, so they can be matched up when patching a
+    # file. Assigned when the .blend is saved; see assign_stable_ids()
+    stable_id: bpy.props.StringProperty(name="Stable ID", options={"HIDDEN"})
+
 
 class KHR_rigid_body_constraint_node_properties(bpy.types.PropertyGroup):
     use_ang_drive_x: bpy.props.BoolProperty(name="X Axis Drive", default=False)
@@ -157,6 +186,22 @@ class KHR_rigid_body_constraint_node_properties(bpy.types.PropertyGroup):
     lin_z_drive_damping: bpy.props.FloatProperty(name="Damping", default=0)
 
 
+def _add_update_callback(cls, callback, exclude=()):
+    """Adds an update callback to every property declared on `cls`, other
+    than those named in `exclude`"""
+    for name, prop in cls.__annotations__.items():
+        if name not in exclude:
+            prop.keywords.setdefault("update", callback)
+
+
+# Any edit to these invalidates the cached export data for that object. The
+# stable ID doesn't affect the exported physics.
+_add_update_callback(
+    KHR_rigid_body_node_properties, mark_physics_dirty, exclude=("stable_id",)
+)
+_add_update_callback(KHR_rigid_body_constraint_node_properties, mark_physics_dirty)
+
+
 class KHR_rigid_body_exporter_properties(bpy.types.PropertyGroup):
     enabled: bpy.props.BoolProperty(
         name="KHR_physics_rigid_bodies",
@@ -170,6 +215,234 @@ class KHR_rigid_body_exporter_properties(bpy.types.PropertyGroup):
         default=True,
     )
 
+    physics_only: bpy.props.BoolProperty(
+        name="Physics Only",
+        description="Export only bodies, colliders and joints, with collision meshes "
+        "reduced to positions. Suitable for headless servers",
+        default=False,
+    )
+
+    write_stable_ids: bpy.props.BoolProperty(
+        name="Write Stable IDs",
+        description="Store an ID in the extras of physics nodes, so the file's "
+        "physics data can later be patched without a full re-export",
+        default=True,
+    )
+
+    use_cache: bpy.props.BoolProperty(
+        name="Reuse Unchanged Physics",
+        description="Reuse physics data generated by a previous export for objects "
+        "which haven't changed since",
+        default=True,
+    )
+
+    verbose_log: bpy.props.BoolProperty(
+        name="Verbose Log",
+        description="Write statistics about the export, such as how many shapes "
+        "were reused from the cache, to the console",
+        default=False,
+    )
+
+    strip_collision_meshes: bpy.props.BoolProperty(
+        name="Stripped Collision Meshes",
+        description="Give mesh and convex hull colliders their own mesh, with a single "
+        "primitive holding only welded positions and indices, instead of sharing the "
+        "render mesh",
+        default=False,
+    )
+
+    collision_weld_distance: bpy.props.FloatProperty(
+        name="Weld Distance",
+        description="Vertices of stripped collision meshes closer than this are merged",
+        default=0.0001,
+        min=0.0,
+        subtype="DISTANCE",
+    )
+
+    cook_collision_data: bpy.props.BoolProperty(
+        name="Cook Collision Data",
+        description="Precompute a BVH for each stripped triangle mesh collider, and "
+        "the face planes and edges of each convex hull, and store them in the "
+        "binary buffer",
+        default=False,
+    )
+
+    edge_convexity_flags: bpy.props.BoolProperty(
+        name="Edge Convexity Flags",
+        description="Classify each edge of stripped triangle mesh colliders as "
+        "convex, concave or flat, so runtimes can avoid collisions with internal edges",
+        default=False,
+    )
+
+    detect_heightfields: bpy.props.BoolProperty(
+        name="Detect Heightfields",
+        description="Describe triangle mesh colliders which are regular, axis "
+        "aligned grids as heightfields, in addition to the triangle mesh",
+        default=False,
+    )
+
+    heightfield_tolerance: bpy.props.FloatProperty(
+        name="Heightfield Tolerance",
+        description="How far vertices may be from a regular grid, and how much "
+        "heights may change when stored as 16 bit samples",
+        default=0.01,
+        min=0.0,
+        subtype="DISTANCE",
+    )
+
+    batch_static_colliders: bpy.props.BoolProperty(
+        name="Batch Static Colliders",
+        description="Merge nearby passive bodies into one node per grid cell, "
+        "combining their triangle meshes where material and filter match",
+        default=False,
+    )
+
+    static_batch_cell_size: bpy.props.FloatProperty(
+        name="Batch Cell Size",
+        description="Size of the grid cells used to group static colliders. Larger "
+        "cells mean fewer static bodies, but more work when one of them changes",
+        default=32.0,
+        min=0.001,
+        subtype="DISTANCE",
+    )
+
+    write_broadphase_hints: bpy.props.BoolProperty(
+        name="Write Broadphase Hints",
+        description="Store the world bounds and a static/kinematic/dynamic "
+        "broadphase layer in the extras of each collider's node, and a spatially "
+        "sorted list of those nodes in the scene's extras",
+        default=False,
+    )
+
+    write_simulation_islands: bpy.props.BoolProperty(
+        name="Write Simulation Islands",
+        description="Store the island of bodies connected by joints which each "
+        "dynamic body belongs to, and which islands can start asleep",
+        default=False,
+    )
+
+    write_articulations: bpy.props.BoolProperty(
+        name="Write Articulations",
+        description="Store the layout of groups of bodies whose joints form a tree, "
+        "for engines which can simulate them as articulations",
+        default=False,
+    )
+
+    sphere_tree_processes: bpy.props.IntProperty(
+        name="Sphere Fitting Processes",
+        description="Number of worker processes used to fit spheres to bodies "
+        "which are approximated with spheres; 0 fits them in Blender's process",
+        default=0,
+        min=0,
+        max=64,
+    )
+
+    write_solver_settings: bpy.props.BoolProperty(
+        name="Write Solver Settings",
+        description="Store each body's deactivation thresholds, each joint's "
+        "solver iteration override and the rigid body world's substeps and "
+        "iterations in extras",
+        default=False,
+    )
+
+    warm_start: bpy.props.BoolProperty(
+        name="Warm Start",
+        description="Export dynamic bodies where the rigid body simulation has "
+        "moved them to by the warm start frame, rather than in their rest pose, "
+        "so they don't need to settle at runtime",
+        default=False,
+    )
+
+    warm_start_frame: bpy.props.IntProperty(
+        name="Warm Start Frame",
+        description="Frame of the simulation whose state is exported",
+        default=50,
+    )
+
+    warm_start_deactivated: bpy.props.BoolProperty(
+        name="Start Settled Bodies Asleep",
+        description="Mark bodies exported at their settled transform as starting "
+        "deactivated",
+        default=True,
+    )
+
+    bake_simulation: bpy.props.BoolProperty(
+        name="Bake Simulation",
+        description="Export the motion of simulated bodies, over the simulation's "
+        "cache range, as animation and make them kinematic",
+        default=False,
+    )
+
+    bake_tolerance: bpy.props.FloatProperty(
+        name="Bake Tolerance",
+        description="Keys are removed where the animation stays within this "
+        "distance of the simulation",
+        default=0.001,
+        min=0.0,
+        subtype="DISTANCE",
+    )
+
+    bake_angle_tolerance: bpy.props.FloatProperty(
+        name="Bake Angle Tolerance",
+        description="Keys are removed where the animation stays within this "
+        "angle of the simulation",
+        default=math.radians(0.5),
+        min=0.0,
+        subtype="ANGLE",
+    )
+
+    flag_ccd: bpy.props.BoolProperty(
+        name="Flag Continuous Collision",
+        description="Mark dynamic bodies whose initial velocity carries them "
+        "further than their thinnest collider in one simulation step, and so "
+        "need continuous collision detection",
+        default=False,
+    )
+
+    detect_overlaps: bpy.props.BoolProperty(
+        name="Detect Overlaps",
+        description="Report colliders of dynamic bodies which start out "
+        "interpenetrating other colliders they can collide with",
+        default=False,
+    )
+
+    overlap_tolerance: bpy.props.FloatProperty(
+        name="Overlap Tolerance",
+        description="Penetration depth below which overlaps are ignored",
+        default=0.001,
+        min=0.0,
+        subtype="DISTANCE",
+    )
+
+    fail_on_overlap: bpy.props.BoolProperty(
+        name="Fail on Overlap",
+        description="Abort the export if any overlaps are found",
+        default=False,
+    )
+
+    quantize_collision_meshes: bpy.props.BoolProperty(
+        name="Quantize Collision Meshes",
+        description="Store stripped collision mesh positions as normalized 16 bit "
+        "integers (KHR_mesh_quantization)",
+        default=False,
+    )
+
+    quantization_error: bpy.props.FloatProperty(
+        name="Max Quantization Error",
+        description="Meshes whose vertices would move further than this when "
+        "quantized keep float positions",
+        default=0.001,
+        min=0.0,
+        subtype="DISTANCE",
+    )
+
+    audit_joints: bpy.props.BoolProperty(
+        name="Audit Joints",
+        description="Report joints with large mass ratios and joint chains which "
+        "are expensive to solve, using the limits of the joint audit panel",
+        default=False,
+    )
+
 
 class KHR_rigid_body_importer_properties(bpy.types.PropertyGroup):
     enabled: bpy.props.BoolProperty(
@@ -179,6 +452,38 @@ class KHR_rigid_body_importer_properties(bpy.types.PropertyGroup):
     )
 
 
+class KHR_rigid_body_audit_item(bpy.types.PropertyGroup):
+    kind: bpy.props.EnumProperty(
+        items=(
+            ("MASS_RATIO", "Mass Ratio", "", "CON_SAMEVOL", 0),
+            ("ISLAND_COST", "Island Cost", "", "CON_PIVOT", 1),
+        )
+    )
+    target: bpy.props.PointerProperty(type=bpy.types.Object)
+    value: bpy.props.FloatProperty()
+    message: bpy.props.StringProperty()
+
+
+class KHR_rigid_body_audit_properties(bpy.types.PropertyGroup):
+    mass_ratio_limit: bpy.props.FloatProperty(
+        name="Mass Ratio Limit",
+        description="Report joints between dynamic bodies whose masses differ by "
+        "more than this factor",
+        default=10.0,
+        min=1.0,
+    )
+    island_cost_limit: bpy.props.FloatProperty(
+        name="Island Cost Limit",
+        description="Report groups of jointed bodies whose estimated solver cost "
+        "(constrained axes x solver iterations, scaled by the worst mass ratio) "
+        "exceeds this",
+        default=2000.0,
+        min=0.0,
+    )
+    results: bpy.props.CollectionProperty(type=KHR_rigid_body_audit_item)
+    active_result: bpy.props.IntProperty()
+
+
 class KHR_rigid_body_viewport_render:
     def __init__(self):
         if not bpy.app.background:
@@ -565,6 +870,18 @@ class KHR_PT_rigid_body_shape(KHR_PT_rigid_body_panel_base):
             row.prop(obj.khr_physics_extra_props, "cone_capsule_height")
             row.prop(obj.khr_physics_extra_props, "cone_capsule_radius_top")
 
+        if (
+            context.object.rigid_body.collision_shape in ("CONVEX_HULL", "MESH")
+            and context.object.rigid_body.type == "ACTIVE"
+        ):
+            col = flow.column()
+            col.active = not obj.khr_physics_extra_props.is_trigger
+            col.prop(obj.khr_physics_extra_props, "use_sphere_tree")
+            col = flow.column()
+            col.active = obj.khr_physics_extra_props.use_sphere_tree
+            col.prop(obj.khr_physics_extra_props, "sphere_tree_count")
+            col.prop(obj.khr_physics_extra_props, "sphere_tree_tolerance")
+
 
 class KHR_PT_rigid_body_collections(KHR_PT_rigid_body_panel_base):
     """Additional panel to display collision collections for a body, as, by default,
@@ -720,12 +1037,71 @@ class KHR_PT_rigid_body_constraint_drives_linear(
         )
 
 
+class KHR_UL_rigid_body_audit(bpy.types.UIList):
+    def draw_item(
+        self, context, layout, data, item, icon, active_data, active_propname
+    ):
+        icon = item.bl_rna.properties["kind"].enum_items[item.kind].icon
+        layout.label(text=item.message, icon=icon)
+
+
+class KHR_PT_rigid_body_audit(bpy.types.Panel):
+    bl_label = "KHR Physics Joint Audit"
+    bl_space_type = "PROPERTIES"
+    bl_region_type = "WINDOW"
+    bl_context = "scene"
+    bl_options = {"DEFAULT_CLOSED"}
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene.rigidbody_world != None
+
+    def draw(self, context):
+        layout = self.layout
+        props = context.scene.khr_physics_audit_props
+        layout.use_property_split = True
+        layout.prop(props, "mass_ratio_limit")
+        layout.prop(props, "island_cost_limit")
+        layout.operator("khr_physics_rigid_bodies.audit_joints")
+        layout.template_list(
+            "KHR_UL_rigid_body_audit", "", props, "results", props, "active_result"
+        )
+
+
+def assign_stable_ids(objects):
+    """Gives each object with physics an identifier which survives renaming,
+    so that exported nodes can be matched up with their objects later.
+    Duplicating an object also duplicates its ID, so all but the first copy
+    (by name) are given new ones."""
+    import uuid
+
+    seen = set()
+    for obj in sorted(objects, key=lambda o: o.name):
+        if obj.rigid_body == None and obj.rigid_body_constraint == None:
+            continue
+        extraProps = obj.khr_physics_extra_props
+        if obj.library == None and (
+            not extraProps.stable_id or extraProps.stable_id in seen
+        ):
+            extraProps.stable_id = uuid.uuid4().hex
+        seen.add(extraProps.stable_id)
+
+
+@persistent
+def _on_save_pre(*args):
+    # IDs are assigned here, rather than during an export, so that exporting
+    # doesn't modify the file
+    assign_stable_ids(bpy.data.objects)
+
+
 # Seems we need to keep a global utility around for drawing in the 3D viewport:
 draw_handler = None
 
 registered_classes = [
     KHR_rigid_body_exporter_properties,
     KHR_rigid_body_importer_properties,
+    KHR_rigid_body_audit_item,
+    KHR_rigid_body_audit_properties,
     KHR_rigid_body_scene_properties,
     KHR_rigid_body_node_properties,
     KHR_rigid_body_constraint_node_properties,
@@ -740,6 +1116,8 @@ registered_classes = [
     KHR_PT_rigid_body_constraint_drives,
     KHR_PT_rigid_body_constraint_drives_angular,
     KHR_PT_rigid_body_constraint_drives_linear,
+    KHR_UL_rigid_body_audit,
+    KHR_PT_rigid_body_audit,
 ]
 
 
@@ -756,6 +1134,9 @@ def register_ui():
     bpy.types.Scene.khr_physics_scene_viewer_props = bpy.props.PointerProperty(
         type=KHR_rigid_body_scene_properties
     )
+    bpy.types.Scene.khr_physics_audit_props = bpy.props.PointerProperty(
+        type=KHR_rigid_body_audit_properties
+    )
     bpy.types.Object.khr_physics_extra_props = bpy.props.PointerProperty(
         type=KHR_rigid_body_node_properties
     )
@@ -766,6 +1147,7 @@ def register_ui():
     draw_handler = bpy.types.SpaceView3D.draw_handler_add(
         viewportRenderHelper.drawExtraPhysicsProperties, (), "WINDOW", "POST_VIEW"
     )
+    bpy.app.handlers.save_pre.append(_on_save_pre)
 
 
 def unregister_ui():
@@ -773,8 +1155,10 @@ def unregister_ui():
         bpy.utils.unregister_class(panel)
     del bpy.types.Scene.khr_physics_exporter_props
     del bpy.types.Scene.khr_physics_scene_viewer_props
+    del bpy.types.Scene.khr_physics_audit_props
     del bpy.types.Object.khr_physics_extra_props
 
     global draw_handler
     bpy.types.SpaceView3D.draw_handler_remove(draw_handler, "WINDOW")
     draw_handler = None
+    bpy.app.handlers.save_pre.remove(_on_save_pre)
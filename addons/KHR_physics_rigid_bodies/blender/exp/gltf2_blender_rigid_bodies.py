@@ -1,9 +1,64 @@
 import bpy
+import json
+import math
+import multiprocessing
+import numpy as np
+import site
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from ...blender.com.gltf2_blender_rigid_bodies_util import *
+from ...blender.com.gltf2_blender_rigid_bodies_progress import *
+from ...blender.com.gltf2_blender_rigid_bodies_cache import physics_export_cache
+from ...blender.com.gltf2_blender_rigid_bodies_analysis import (
+    UnionFind,
+    aabb_to_gltf,
+    morton_order,
+    primitive_thickness,
+    primitives_overlap,
+    sweep_and_prune,
+    tree_components,
+    tree_order,
+)
+from ...blender.com.gltf2_blender_rigid_bodies_audit import audit_joints, is_dynamic
+from ...blender.com.gltf2_blender_rigid_bodies_cooking import (
+    build_bvh,
+    convex_hull,
+    detect_heightfield,
+    edge_convexity,
+)
+from ...blender.com.gltf2_blender_rigid_bodies_keys import (
+    continuous_quaternions,
+    is_constant,
+    linear_error,
+    simplify_keys,
+    slerp_error,
+)
+from ...blender.com.gltf2_blender_rigid_bodies_mesh import (
+    clean_mesh,
+    collision_mesh,
+    merge_meshes,
+    mesh_triangles,
+    quantize_positions,
+    to_gltf_space,
+    transform_points,
+)
+from ...blender.com.gltf2_blender_rigid_bodies_spheres import (
+    hidden_main_module,
+    module_directory,
+    sphere_tree,
+    standalone_module,
+)
+from ...blender.com.gltf2_blender_rigid_bodies_sim import (
+    sample_simulation,
+    simulated_bodies,
+)
 from ...io.com.gltf2_io_implicit_shapes import *
 from ...io.com.gltf2_io_rigid_bodies import *
 from io_scene_gltf2.io.com import gltf2_io
-from mathutils import Matrix, Euler
+from io_scene_gltf2.io.com import gltf2_io_constants
+from io_scene_gltf2.io.exp import gltf2_io_binary_data
+from mathutils import Matrix, Euler, Quaternion
+
+meshQuantization_Extension_Name = "KHR_mesh_quantization"
 
 # Constant used to construct some quaternions when switching up axis
 halfSqrt2 = 2**0.5 * 0.5
@@ -14,59 +69,229 @@ from io_scene_gltf2.blender.exp.nodes import __convert_swizzle_rotation as conve
 from io_scene_gltf2.blender.exp.nodes import __convert_swizzle_location as convert_swizzle_location
 
 
-class glTF2ExportUserExtension:
-    isExt: ImplicitShapesGlTFExtension
-    rbExt: RigidBodiesGlTFExtension
+class CollisionMesh:
+    """A stripped collision mesh, and the transform which must be applied to
+    the node using it when its positions are quantized"""
 
     def __init__(self):
-        # We need to wait until we create the gltf2UserExtension to import the gltf2 modules
-        # Otherwise, it may fail because the gltf2 may not be loaded yet
-        from io_scene_gltf2.io.com.gltf2_io_extensions import Extension
-        from io_scene_gltf2.io.com.gltf2_io_extensions import ChildOfRootExtension
+        self.mesh: Optional[gltf2_io.Mesh] = None
+        self.translation: Optional[list[float]] = None
+        self.scale: Optional[list[float]] = None
+
+        # Unquantized geometry, for cooking
+        self.positions = None
+        self.triangles = None
+        # Extras holding cooked collision data, by collision shape type
+        self.cooked = {}
+
+
+class ColliderRecord:
+    """World space data about a collider, used to analyse the whole scene
+    once every node has been seen"""
+
+    def __init__(self, obj, body, aabbMin, aabbMax, primitive):
+        self.obj = obj
+        # The glTF node the collider ends up on
+        self.colliderNode = None
+        # The object which owns the collider's body
+        self.body = body
+        self.aabbMin = aabbMin
+        self.aabbMax = aabbMax
+        # Primitive shape for exact overlap tests, see primitives_overlap()
+        self.primitive = primitive
+        rb = body.rigid_body
+        self.isDynamic = rb.type == "ACTIVE" and rb.enabled and not rb.kinematic
+        if self.isDynamic:
+            self.broadphaseLayer = "dynamic"
+        elif rb.kinematic:
+            self.broadphaseLayer = "kinematic"
+        else:
+            self.broadphaseLayer = "static"
+        self.isTrigger = obj.khr_physics_extra_props.is_trigger
+        self.collections = sum(
+            1 << i for i, e in enumerate(obj.rigid_body.collision_collections) if e
+        )
 
-        self.Extension = Extension
-        self.ChildOfRootExtension = ChildOfRootExtension
-        self.properties = bpy.context.scene.khr_physics_exporter_props
+
+class ExportSession:
+    """Holds all state for a single export. A new session is created for each
+    export and dropped once the root extensions have been written, so no
+    references to Blender or glTF objects outlive the export."""
+
+    def __init__(self):
         self.rbExt = RigidBodiesGlTFExtension()
         self.isExt = ImplicitShapesGlTFExtension()
 
         # Supporting data allowing us to save joints correctly
         self.blenderJointObjects = []
+        # The node holding each joint's extension, by joint object
+        self.jointNodes = {}
+        # Fixed node for joints to static bodies which aren't exported
+        self.worldAnchor = None
         self.blenderNodeToGltfNode = {}
         self.blenderBoneToGltfNode = {}
         self.gltfNodeToBlender = {}
 
+        self.nodeProgress: Optional[ProgressReporter] = None
+
+        # Number of objects with each stable ID; built on first use
+        self.stableIdCounts = None
+
+        # Meshes with render-only attributes removed, keyed by id() of the original
+        self.positionsOnlyMeshes = {}
+
+        # Stripped collision meshes, keyed by the Blender data they were built from
+        self.collisionMeshes = {}
+
+        # Quantized position accessors, whose buffer views need a byte stride
+        self.quantizedAccessors = []
+
+        # Nodes added to hold the colliders of z-up capsules and cylinders
+        self.alignmentNodes = {}
+        # Static bodies which may be merged with their neighbours
+        self.staticColliders = []
+
+        self.colliders: list[ColliderRecord] = []
+
+        # Spheres approximating bodies, by object; built on first use
+        self.sphereTrees = None
+
+        # World matrices of dynamic bodies at the warm start frame
+        self.settledMatrices = {}
+        # World matrices of baked bodies at each of the bake's frames
+        self.bakeFrames = []
+        self.bakedSamples = {}
+
+        # Number of shapes reused from, or added to, the cache
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
+
+class glTF2ExportUserExtension:
+    session: Optional[ExportSession]
+
+    def __init__(self, patching: bool = False):
+        # We need to wait until we create the gltf2UserExtension to import the gltf2 modules
+        # Otherwise, it may fail because the gltf2 may not be loaded yet
+        from io_scene_gltf2.io.com.gltf2_io_extensions import Extension
+        from io_scene_gltf2.io.com.gltf2_io_extensions import ChildOfRootExtension
+
+        self.Extension = Extension
+        self.ChildOfRootExtension = ChildOfRootExtension
+        self.properties = bpy.context.scene.khr_physics_exporter_props
+        self.session = ExportSession()
+        # Batching adds new root nodes and buffers, which patching can't do
+        self.allowStaticBatching = not patching
+        # A patched file keeps its render data, and its meshes are already
+        # indices, which can't be stripped
+        self.physicsOnly = self.properties.physics_only and not patching
+        reset_cancel()
+
+        # Baking takes precedence over a warm start. Patching can't add
+        # animations, so a patched file keeps the one it was baked with
+        if self.properties.bake_simulation:
+            needsSimulation = not patching
+        else:
+            needsSimulation = self.properties.warm_start
+        if self.properties.enabled and needsSimulation:
+            # The simulation has to be stepped before the export starts
+            # evaluating the scene, so do it now
+            try:
+                self._sampleSimulation(bpy.context.scene)
+            except PhysicsAbort as e:
+                record_abort(e)
+            except:
+                import traceback
+
+                print(traceback.format_exc())
+
+    def _sampleSimulation(self, scene):
+        """Steps the simulation for the bake and warm start options. Baked
+        bodies are animated from the start of the simulation, so baking
+        takes precedence over a warm start."""
+        bodies = simulated_bodies(scene)
+        if not len(bodies):
+            return
+        if self.properties.bake_simulation:
+            cache = scene.rigidbody_world.point_cache
+            frames = list(range(cache.frame_start, cache.frame_end + 1))
+            samples = sample_simulation(scene, bodies, frames)
+            self.session.bakeFrames = frames
+            self.session.bakedSamples = {o: m for o, m in samples.items() if m}
+        else:
+            frame = self.properties.warm_start_frame
+            samples = sample_simulation(scene, bodies, [frame])
+            self.session.settledMatrices = {o: m[0] for o, m in samples.items() if m}
+
     def gather_gltf_extensions_hook(self, gltf2_plan, export_settings):
+        try:
+            if not is_aborted():
+                self.gather_gltf_extensions_hook2(gltf2_plan, export_settings)
+        except PhysicsAbort as e:
+            record_abort(e)
+        finally:
+            # This is the last hook called during an export; release everything
+            # we've been holding on to
+            self.session = None
+
+    def gather_gltf_extensions_hook2(self, gltf2_plan, export_settings):
         if not self.properties.enabled:
             return
 
         if gltf2_plan.extensions is None:
             gltf2_plan.extensions = {}
 
-        if self.rbExt.should_export():
+        if self.session.rbExt.should_export():
             physicsRootExtension = self.Extension(
                 name=rigidBody_Extension_Name,
-                extension=self.rbExt.to_dict(),
+                extension=self.session.rbExt.to_dict(),
                 required=False,
             )
             gltf2_plan.extensions[rigidBody_Extension_Name] = physicsRootExtension
 
         if (
             not implicitShapes_Extension_Name in gltf2_plan.extensions
-            and self.isExt.should_export()
+            and self.session.isExt.should_export()
         ):
             isRootExtension = self.Extension(
                 name=implicitShapes_Extension_Name,
-                extension=self.isExt.to_dict(),
+                extension=self.session.isExt.to_dict(),
                 required=False,
             )
             gltf2_plan.extensions[implicitShapes_Extension_Name] = isRootExtension
 
+        if len(self.session.quantizedAccessors):
+            self._finishQuantizedAccessors(gltf2_plan)
+
+        if self.properties.use_cache and self.properties.verbose_log:
+            print(
+                "%s reused %i cached shapes, fitted %i"
+                % (progress_log_prefix, self.session.cacheHits, self.session.cacheMisses)
+            )
+
+    def _finishQuantizedAccessors(self, gltf2_plan):
+        """Sets the stride of quantized position buffer views, which are padded
+        to keep each element 4-byte aligned, and declares the extension. The
+        buffer views have been created from our accessors by the time this
+        is called"""
+        for accessor in self.session.quantizedAccessors:
+            if isinstance(accessor.buffer_view, int):
+                gltf2_plan.buffer_views[accessor.buffer_view].byte_stride = 8
+        for extList in ("extensions_used", "extensions_required"):
+            if getattr(gltf2_plan, extList) == None:
+                setattr(gltf2_plan, extList, [])
+            if meshQuantization_Extension_Name not in getattr(gltf2_plan, extList):
+                getattr(gltf2_plan, extList).append(meshQuantization_Extension_Name)
+
     def gather_scene_hook(
         self, gltf2_scene: gltf2_io.Scene, blender_scene, export_settings
     ):
+        if is_aborted():
+            return
         try:
             self.gather_scene_hook2(gltf2_scene, blender_scene, export_settings)
+        except PhysicsAbort as e:
+            record_abort(e)
         except:
             import traceback
 
@@ -78,12 +303,20 @@ class glTF2ExportUserExtension:
         if not self.properties.enabled:
             return
 
+        if self.session.nodeProgress != None:
+            self.session.nodeProgress.end()
+            self.session.nodeProgress = None
+
         #
         # Export any joints we've seen. These joints may need additional gltf nodes
         # created, in order to supply the pivot transform
         #
-        for joint_node in self.blenderJointObjects:
-            gltf2_object = self.blenderNodeToGltfNode[joint_node]
+        jointProgress = ProgressReporter(
+            "joints resolved", len(self.session.blenderJointObjects)
+        )
+        for joint_node in self.session.blenderJointObjects:
+            jointProgress.step()
+            gltf2_object = self.session.blenderNodeToGltfNode[joint_node]
             jointData = self._generateJointData(
                 joint_node, gltf2_object, export_settings
             )
@@ -95,20 +328,29 @@ class glTF2ExportUserExtension:
             # contain those transforms.
 
             bodyA = joint_node.rigid_body_constraint.object1
-            aFromWorld = bodyA.matrix_world.copy() if bodyA else Matrix()
-            aFromWorld.invert()
             bodyB = joint_node.rigid_body_constraint.object2
-            bFromWorld = bodyB.matrix_world.copy() if bodyB else Matrix()
-            bFromWorld.invert()
+            # gltf_A/B are the nodes connected to the constraint
+            # jointInA/B are the pivots in the space of their connected node
+            gltf_A = self._jointBodyNode(bodyA, gltf2_scene, export_settings)
+            gltf_B = self._jointBodyNode(bodyB, gltf2_scene, export_settings)
+            if gltf_A == None or gltf_B == None:
+                log(
+                    "Joint '%s' connects a moving body which isn't exported; skipped"
+                    % joint_node.name
+                )
+                continue
+
+            aFromWorld = Matrix()
+            if gltf_A != self.session.worldAnchor:
+                aFromWorld = bodyA.matrix_world.inverted()
+            bFromWorld = Matrix()
+            if gltf_B != self.session.worldAnchor:
+                bFromWorld = bodyB.matrix_world.inverted()
 
             worldFromJoint = joint_node.matrix_world.copy()
             jointFromBodyA = aFromWorld @ worldFromJoint
             jointFromBodyB = bFromWorld @ worldFromJoint
 
-            # gltf_A/B are the nodes connected to the constraint
-            # jointInA/B are the pivots in the space of their connected node
-            gltf_B = self.blenderNodeToGltfNode[bodyB]
-
             jointInB = self._constructNode(
                 "jointSpaceB",
                 jointFromBodyB.to_translation(),
@@ -118,7 +360,6 @@ class glTF2ExportUserExtension:
             gltf_B.children.append(jointInB)
             jointData.connected_node = jointInB
 
-            gltf_A = self.blenderNodeToGltfNode[bodyA]
             jointInA = self._constructNode(
                 "jointSpaceA",
                 jointFromBodyA.to_translation(),
@@ -132,8 +373,42 @@ class glTF2ExportUserExtension:
                 required=False,
             )
             gltf_A.children.append(jointInA)
+            self.session.jointNodes[joint_node] = jointInA
+        jointProgress.end()
+
+        world = blender_scene.rigidbody_world
+        if self.properties.write_solver_settings and world != None:
+            self._setNodeExtra(
+                gltf2_scene,
+                "solver",
+                {
+                    "substepsPerFrame": world.substeps_per_frame,
+                    "solverIterations": world.solver_iterations,
+                },
+            )
+
+        if self.properties.detect_overlaps:
+            self._detectOverlaps()
+
+        if self.properties.audit_joints:
+            self._auditJoints(blender_scene)
+
+        if self.properties.batch_static_colliders and self.allowStaticBatching:
+            self._batchStaticColliders(gltf2_scene, export_settings)
+
+        if self.properties.write_broadphase_hints:
+            self._writeBroadphaseHints(gltf2_scene, export_settings)
+
+        if self.properties.write_simulation_islands:
+            self._writeSimulationIslands(gltf2_scene)
 
-        if self.properties.reparent_bones and len(self.blenderBoneToGltfNode):
+        if self.properties.write_articulations:
+            self._writeArticulations(gltf2_scene)
+
+        if self.properties.flag_ccd:
+            self._flagContinuousCollision(blender_scene)
+
+        if self.properties.reparent_bones and len(self.session.blenderBoneToGltfNode):
             # Want to be able to find the parents of both the bones and
             # the rigid body nodes which need remapping
             gltfNodeToParent = {}
@@ -141,8 +416,8 @@ class glTF2ExportUserExtension:
                 for c in n.children:
                     self._buildParentMap(gltfNodeToParent, n, c)
 
-            for blender_bone in self.blenderBoneToGltfNode:
-                gltf_bone = self.blenderBoneToGltfNode[blender_bone]
+            for blender_bone in self.session.blenderBoneToGltfNode:
+                gltf_bone = self.session.blenderBoneToGltfNode[blender_bone]
                 constraint = self._getBoneChildConstraint(blender_bone)
                 if not constraint:
                     continue
@@ -152,10 +427,10 @@ class glTF2ExportUserExtension:
                 )
 
                 gltf_bone_parent = gltfNodeToParent[gltf_bone]
-                gltf_rb = self.blenderNodeToGltfNode[rb]
-                gltf_target = self.blenderNodeToGltfNode[target]
+                gltf_rb = self.session.blenderNodeToGltfNode[rb]
+                gltf_target = self.session.blenderNodeToGltfNode[target]
 
-                blender_bone_parent = self.gltfNodeToBlender[gltf_bone_parent]
+                blender_bone_parent = self.session.gltfNodeToBlender[gltf_bone_parent]
                 wFbp = self._worldMatrix(blender_bone_parent, export_settings)
                 rbFtarget = rb.matrix_world.inverted() @ target.matrix_world
                 # Calculate new local transforms
@@ -205,6 +480,470 @@ class glTF2ExportUserExtension:
                 else:
                     gltf2_scene.nodes.remove(gltf_rb)
 
+    def _writeSimulationIslands(self, gltf2_scene):
+        """Groups dynamic bodies connected by joints into the islands a solver
+        would wake and sleep together. Each body's extras get its island's
+        index into the scene's list of islands, which records the number of
+        bodies and whether the whole island can start asleep."""
+        bodies = [
+            o
+            for o in self.session.blenderNodeToGltfNode
+            if isinstance(o, bpy.types.Object)
+            and self._hasMotion(o)
+            and not o.rigid_body.kinematic
+        ]
+        bodySet = set(bodies)
+        islands = UnionFind()
+        for body in bodies:
+            islands.find(body)
+        for joint_node in self.session.blenderJointObjects:
+            joint = joint_node.rigid_body_constraint
+            if joint.enabled and joint.object1 in bodySet and joint.object2 in bodySet:
+                islands.union(joint.object1, joint.object2)
+
+        members = {}
+        for body in bodies:
+            members.setdefault(islands.find(body), []).append(body)
+        # Number islands in a stable order, so re-exports give the same IDs
+        ordered = sorted(members.values(), key=lambda m: min(b.name for b in m))
+
+        islandInfo = []
+        for islandId, island in enumerate(ordered):
+            islandInfo.append(
+                {
+                    "bodyCount": len(island),
+                    "startAsleep": all(
+                        b.rigid_body.use_start_deactivated for b in island
+                    ),
+                }
+            )
+            for body in island:
+                self._setNodeExtra(
+                    self.session.blenderNodeToGltfNode[body], "islandId", islandId
+                )
+        self._setNodeExtra(gltf2_scene, "simulationIslands", islandInfo)
+
+    def _writeArticulations(self, gltf2_scene):
+        """Finds groups of bodies whose joints form a tree, which engines can
+        simulate as articulations, and stores their layout in the scene's
+        extras. Links are ordered parent first from the root body; trees
+        attached to more than one non-dynamic body contain a loop through the
+        world, so are skipped."""
+        edges = []
+        for joint_node in self.session.blenderJointObjects:
+            joint = joint_node.rigid_body_constraint
+            if (
+                joint.enabled
+                and joint.object1 in self.session.blenderNodeToGltfNode
+                and joint.object2 in self.session.blenderNodeToGltfNode
+            ):
+                edges.append((joint.object1, joint.object2, joint_node))
+
+        articulations = []
+        for bodies, treeEdges in tree_components(edges):
+            fixed = [
+                b for b in bodies if not self._hasMotion(b) or b.rigid_body.kinematic
+            ]
+            if len(fixed) > 1:
+                continue
+            if len(fixed) == 1:
+                root = fixed[0]
+            else:
+                root = max(bodies, key=lambda b: (b.rigid_body.mass, b.name))
+
+            links = []
+            for body, parentIdx, joint_node in tree_order(root, treeEdges):
+                link = {"node": self.session.blenderNodeToGltfNode[body]}
+                if parentIdx >= 0:
+                    link["parent"] = parentIdx
+                    link["joint"] = self.session.jointNodes.get(joint_node)
+                links.append(link)
+            articulations.append((root.name, {"fixedBase": len(fixed) == 1, "links": links}))
+
+        if len(articulations):
+            self._setNodeExtra(
+                gltf2_scene, "articulations", [a for _, a in sorted(articulations)]
+            )
+
+    def _detectOverlaps(self):
+        """Reports pairs of colliders which start out interpenetrating, where
+        at least one belongs to a dynamic body and the pair can collide"""
+        records = self.session.colliders
+        if len(records) < 2:
+            return
+        slop = self.properties.overlap_tolerance
+        mins = np.array([r.aabbMin for r in records]) + slop
+        maxs = np.array([r.aabbMax for r in records]) - slop
+        pairs = sweep_and_prune(mins, maxs)
+
+        noCollision = set()
+        for joint_node in self.session.blenderJointObjects:
+            joint = joint_node.rigid_body_constraint
+            if joint.disable_collisions:
+                noCollision.add(frozenset((joint.object1, joint.object2)))
+
+        # Pairs whose shapes can't be tested exactly (meshes and convex hulls)
+        # are only warned about, as their bounds overlapping proves nothing
+        overlaps = []
+        boundsOverlaps = []
+        for i, j in pairs:
+            a, b = records[i], records[j]
+            if (
+                a.body == b.body
+                or not (a.isDynamic or b.isDynamic)
+                or a.isTrigger
+                or b.isTrigger
+                or not (a.collections & b.collections)
+                or frozenset((a.body, b.body)) in noCollision
+            ):
+                continue
+            result = primitives_overlap(a.primitive, b.primitive, slop)
+            if result == True:
+                overlaps.append((a, b))
+            elif result == None:
+                boundsOverlaps.append((a, b))
+
+        maxReported = 50
+        for pairList, message in (
+            (overlaps, "overlapping colliders"),
+            (boundsOverlaps, "warning: bounds overlap for colliders"),
+        ):
+            for a, b in pairList[:maxReported]:
+                print(
+                    "%s %s '%s' and '%s'"
+                    % (progress_log_prefix, message, a.obj.name, b.obj.name)
+                )
+            if len(pairList) > maxReported:
+                print(
+                    "%s ... and %i more"
+                    % (progress_log_prefix, len(pairList) - maxReported)
+                )
+        print(
+            "%s %i overlapping pairs and %i pairs with overlapping bounds found among %i colliders"
+            % (progress_log_prefix, len(overlaps), len(boundsOverlaps), len(records))
+        )
+        if len(overlaps) and self.properties.fail_on_overlap:
+            raise ExportValidationError(
+                "%i pairs of colliders overlap at the start of the simulation"
+                % len(overlaps)
+            )
+
+    def _auditJoints(self, blender_scene):
+        """Reports joints with large mass ratios and expensive joint islands"""
+        limits = blender_scene.khr_physics_audit_props
+        world = blender_scene.rigidbody_world
+        islands, findings = audit_joints(
+            self.session.blenderJointObjects,
+            world.solver_iterations if world else 10,
+            limits.mass_ratio_limit,
+            limits.island_cost_limit,
+        )
+        for finding in findings:
+            print("%s %s" % (progress_log_prefix, finding.message))
+        if islands:
+            costliest = max(islands, key=lambda i: i.cost)
+            print(
+                "%s %i jointed islands, costliest %.0f (%i joints)"
+                % (
+                    progress_log_prefix,
+                    len(islands),
+                    costliest.cost,
+                    len(costliest.joints),
+                )
+            )
+
+    def _flagContinuousCollision(self, blender_scene):
+        """Marks dynamic bodies which can pass through another collider in a
+        single step, i.e. whose initial speed times the simulation timestep
+        exceeds the smallest extent of their thinnest collider"""
+        world = blender_scene.rigidbody_world
+        fps = blender_scene.render.fps / blender_scene.render.fps_base
+        substeps = world.substeps_per_frame if world else 10
+        timestep = 1.0 / (fps * max(substeps, 1))
+
+        thickness = {}
+        for record in self.session.colliders:
+            if not record.isDynamic or record.isTrigger:
+                continue
+            extent = primitive_thickness(
+                record.primitive, record.aabbMin, record.aabbMax
+            )
+            thickness[record.body] = min(thickness.get(record.body, extent), extent)
+
+        flagged = []
+        for body, extent in thickness.items():
+            speed = Vector(body.khr_physics_extra_props.linear_velocity).length
+            travel = speed * timestep
+            if travel <= extent:
+                continue
+            glNode = self.session.blenderNodeToGltfNode.get(body)
+            if glNode == None:
+                continue
+            self._setNodeExtra(glNode, "ccd", True)
+            flagged.append((travel / max(extent, 1e-9), body.name))
+
+        for ratio, name in sorted(flagged, reverse=True):
+            print(
+                "%s '%s' moves %.1fx its thickness per step; flagged for CCD"
+                % (progress_log_prefix, name, ratio)
+            )
+        print(
+            "%s %i of %i dynamic bodies flagged for CCD (timestep %.4fs)"
+            % (progress_log_prefix, len(flagged), len(thickness), timestep)
+        )
+
+    def _settledWorldMatrix(self, obj) -> Matrix:
+        """The object's world matrix as exported, i.e. where the simulation
+        left it, if it or one of its ancestors was exported settled"""
+        cur = obj
+        while cur != None:
+            settled = self.session.settledMatrices.get(cur)
+            if settled != None:
+                return settled @ cur.matrix_world.inverted() @ obj.matrix_world
+            cur = cur.parent
+        return obj.matrix_world
+
+    def _setSettledTransform(self, gltf2_object, blender_object, export_settings):
+        """Replaces the node's rest transform with the settled one"""
+        parent = blender_object.parent
+        parentMatrix = self._settledWorldMatrix(parent) if parent != None else Matrix()
+        local = parentMatrix.inverted() @ self.session.settledMatrices[blender_object]
+        loc, rot, scale = local.decompose()
+        gltf2_object.translation = [
+            x for x in convert_swizzle_location(loc, export_settings)
+        ]
+        gltf2_object.rotation = self._serializeQuaternion(
+            convert_swizzle_rotation(rot, export_settings)
+        )
+        gltf2_object.scale = [x for x in convert_swizzle_scale(scale, export_settings)]
+        gltf2_object.matrix = None
+
+    def _recordCollider(
+        self, node, glNode, shape: Optional[Shape], export_settings
+    ) -> ColliderRecord:
+        worldMatrix = self._settledWorldMatrix(node)
+        corners = np.array([worldMatrix @ Vector(c) for c in node.bound_box])
+        body = self._getParentCompoundBody(node) or node
+        record = ColliderRecord(
+            node,
+            body,
+            corners.min(axis=0),
+            corners.max(axis=0),
+            self._worldPrimitive(worldMatrix, shape, export_settings),
+        )
+        record.colliderNode = glNode
+        self.session.colliders.append(record)
+        return record
+
+    def _writeBroadphaseHints(self, gltf2_scene, export_settings):
+        """Stores the world AABB and broadphase layer of every node with a
+        collider in its extras, and the nodes' Z-order in the scene's extras,
+        so a broadphase can be built in a single pass"""
+        nodes = {}
+        for record in self.session.colliders:
+            entry = nodes.get(record.colliderNode)
+            if entry == None:
+                nodes[record.colliderNode] = [
+                    record.aabbMin,
+                    record.aabbMax,
+                    record.broadphaseLayer,
+                ]
+            else:
+                entry[0] = np.minimum(entry[0], record.aabbMin)
+                entry[1] = np.maximum(entry[1], record.aabbMax)
+
+        glNodes = list(nodes)
+        for glNode in glNodes:
+            lo, hi, layer = nodes[glNode]
+            lo, hi = aabb_to_gltf(lo.tolist(), hi.tolist(), export_settings["gltf_yup"])
+            self._setNodeExtra(glNode, "worldAabb", {"min": lo, "max": hi})
+            self._setNodeExtra(glNode, "broadphaseLayer", layer)
+
+        centers = np.array([(nodes[n][0] + nodes[n][1]) * 0.5 for n in glNodes])
+        order = morton_order(centers.reshape(-1, 3))
+        self._setNodeExtra(
+            gltf2_scene, "broadphaseOrder", [glNodes[i] for i in order]
+        )
+
+    @staticmethod
+    def _worldPrimitive(worldMatrix, shape: Optional[Shape], export_settings):
+        """Describes a fitted shape in world space"""
+        if shape == None:
+            return None
+        loc, rot, scale = worldMatrix.decompose()
+        center = np.array(loc)
+        axes = np.array(rot.to_matrix())
+        scale = np.abs(np.array(scale))
+        if shape.type == "sphere":
+            return ("sphere", center, shape.sphere.radius * scale.max())
+        if shape.type == "box":
+            size = np.array(shape.box.size)
+            if export_settings["gltf_yup"]:
+                size = size[[0, 2, 1]]
+            return ("box", center, axes, size * 0.5 * scale)
+        if shape.type == "capsule":
+            capsule = shape.capsule
+            # Blender's capsules lie along the object's Z axis
+            halfHeight = axes[:, 2] * capsule.height * 0.5 * scale[2]
+            radius = max(capsule.radiusTop, capsule.radiusBottom) * scale[:2].max()
+            return ("capsule", center - halfHeight, center + halfHeight, radius)
+        return None
+
+    def _isBatchable(self, blender_object) -> bool:
+        """Whether the object is a plain static collider, which doesn't need a
+        body of its own"""
+        rb = blender_object.rigid_body
+        return (
+            rb != None
+            and rb.type == "PASSIVE"
+            and not rb.kinematic
+            and rb.collision_shape != "COMPOUND"
+            and blender_object.rigid_body_constraint == None
+            and self._getParentCompoundBody(blender_object) == None
+        )
+
+    def _batchStaticColliders(self, gltf2_scene, export_settings):
+        """Moves static colliders which are near each other into a single node
+        per grid cell. Primitive and convex shapes become children of that node,
+        while triangle meshes sharing a material and filter are merged."""
+        jointBodies = set()
+        for joint_node in self.session.blenderJointObjects:
+            jointBodies.add(joint_node.rigid_body_constraint.object1)
+            jointBodies.add(joint_node.rigid_body_constraint.object2)
+
+        records = {r.obj: r for r in self.session.colliders}
+        cellSize = max(self.properties.static_batch_cell_size, 1e-3)
+        cells = {}
+        for obj in self.session.staticColliders:
+            if obj in jointBodies:
+                continue
+            corners = [obj.matrix_world @ Vector(c) for c in obj.bound_box]
+            center = sum(corners, Vector()) / len(corners)
+            cell = tuple(math.floor(x / cellSize) for x in center)
+            cells.setdefault(cell, []).append(obj)
+
+        for cell, objects in sorted(cells.items()):
+            if len(objects) < 2:
+                continue
+            batchNode = self._constructNode(
+                "staticBatch_%i_%i_%i" % cell,
+                Vector((0, 0, 0)),
+                Quaternion((1, 0, 0, 0)),
+                export_settings,
+            )
+            meshGroups = {}
+            for obj in objects:
+                glNode = self.session.blenderNodeToGltfNode[obj]
+                key = "trigger" if obj.khr_physics_extra_props.is_trigger else "collider"
+                colliderDict = self._takeCollider(glNode, key)
+                alignment = self.session.alignmentNodes.get(obj)
+
+                if colliderDict != None and obj.rigid_body.collision_shape == "MESH":
+                    groupKey = (
+                        key,
+                        self._rootItemKey(colliderDict.get("physicsMaterial")),
+                        self._rootItemKey(colliderDict.get("collisionFilter")),
+                    )
+                    meshGroups.setdefault(groupKey, (colliderDict, []))[1].append(obj)
+                    continue
+
+                loc, rot, scale = obj.matrix_world.decompose()
+                proxy = self._constructNode(
+                    "staticBatchCollider", loc, rot, export_settings
+                )
+                proxy.scale = [x for x in convert_swizzle_scale(scale, export_settings)]
+                if colliderDict != None:
+                    proxy.extensions[rigidBody_Extension_Name] = self.Extension(
+                        name=rigidBody_Extension_Name,
+                        extension={key: colliderDict},
+                        required=False,
+                    )
+                    if obj in records:
+                        records[obj].colliderNode = proxy
+                if alignment != None:
+                    glNode.children.remove(alignment)
+                    proxy.children.append(alignment)
+                batchNode.children.append(proxy)
+
+            for (key, _, _), (colliderDict, meshObjects) in meshGroups.items():
+                collisionMesh = self._mergedCollisionMesh(
+                    meshObjects, batchNode.name, export_settings
+                )
+                shape_node = self._constructNode(
+                    "physicsMeshDataNode",
+                    Vector((0, 0, 0)),
+                    Quaternion((1, 0, 0, 0)),
+                    export_settings,
+                )
+                self._useCollisionMesh(shape_node, collisionMesh)
+                merged = dict(colliderDict)
+                merged["geometry"] = {"node": shape_node}
+                merged["extras"] = self._cookedExtras(collisionMesh, "MESH") or None
+
+                proxy = self._constructNode(
+                    "staticBatchCollider",
+                    Vector((0, 0, 0)),
+                    Quaternion((1, 0, 0, 0)),
+                    export_settings,
+                )
+                proxy.extensions[rigidBody_Extension_Name] = self.Extension(
+                    name=rigidBody_Extension_Name,
+                    extension={key: merged},
+                    required=False,
+                )
+                batchNode.children.append(proxy)
+                for obj in meshObjects:
+                    if obj in records:
+                        records[obj].colliderNode = proxy
+
+            gltf2_scene.nodes.append(batchNode)
+
+    @staticmethod
+    def _takeCollider(glNode, key) -> Optional[dict]:
+        """Removes the collider or trigger from a node's extension, removing
+        the extension if nothing else is left in it"""
+        ext = glNode.extensions.get(rigidBody_Extension_Name)
+        if ext == None:
+            return None
+        colliderDict = ext.extension.get(key)
+        ext.extension[key] = None
+        if not any(ext.extension.get(k) for k in ("motion", "collider", "trigger", "joint")):
+            del glNode.extensions[rigidBody_Extension_Name]
+        return colliderDict
+
+    @staticmethod
+    def _rootItemKey(item) -> Optional[str]:
+        if item == None:
+            return None
+        return json.dumps(item.extension, sort_keys=True, default=str)
+
+    def _mergedCollisionMesh(self, objects, name, export_settings) -> CollisionMesh:
+        """Builds one collision mesh from the world space triangles of all the
+        objects"""
+        parts = []
+        for obj in objects:
+            with accessMeshData(obj, export_settings["gltf_apply"]) as meshData:
+                positions, triangles = mesh_triangles(meshData)
+            parts.append((transform_points(positions, obj.matrix_world), triangles))
+        positions, triangles = merge_meshes(parts)
+        positions, indices = clean_mesh(
+            to_gltf_space(positions, export_settings["gltf_yup"]),
+            triangles,
+            self.properties.collision_weld_distance,
+        )
+        return self._buildCollisionMesh(positions, indices, name)
+
+    @staticmethod
+    def _countExportedObjects(export_settings) -> Optional[int]:
+        vtree = export_settings.get("vtree")
+        if vtree == None:
+            return None
+        from io_scene_gltf2.blender.exp.tree import VExportNode
+
+        return sum(
+            1 for n in vtree.nodes.values() if n.blender_type == VExportNode.OBJECT
+        )
+
     def _worldMatrix(
         self, o: Union[bpy.types.Object, bpy.types.PoseBone], export_settings
     ):
@@ -247,19 +986,27 @@ class glTF2ExportUserExtension:
         blender_bone: bpy.types.PoseBone,
         export_settings,
     ):
-        if not self.properties.enabled or not self.properties.reparent_bones:
+        if (
+            not self.properties.enabled
+            or not self.properties.reparent_bones
+            or is_aborted()
+        ):
             return
 
-        self.gltfNodeToBlender[gltf2_node] = blender_bone
+        self.session.gltfNodeToBlender[gltf2_node] = blender_bone
         constraint = self._getBoneChildConstraint(blender_bone)
         if constraint != None and constraint.target != None:
             target = constraint.target
             if target.rigid_body or self._getParentCompoundBody(target) != None:
-                self.blenderBoneToGltfNode[blender_bone] = gltf2_node
+                self.session.blenderBoneToGltfNode[blender_bone] = gltf2_node
 
     def gather_node_hook(self, gltf2_object, blender_object, export_settings):
+        if is_aborted():
+            return
         try:
             self.gather_node_hook2(gltf2_object, blender_object, export_settings)
+        except PhysicsAbort as e:
+            record_abort(e)
         except:
             import traceback
 
@@ -267,8 +1014,17 @@ class glTF2ExportUserExtension:
 
     def gather_node_hook2(self, gltf2_object, blender_object, export_settings):
         if self.properties.enabled:
-            self.gltfNodeToBlender[gltf2_object] = blender_object
-            self.blenderNodeToGltfNode[blender_object] = gltf2_object
+            if self.session.nodeProgress == None:
+                self.session.nodeProgress = ProgressReporter(
+                    "nodes processed", self._countExportedObjects(export_settings)
+                )
+            self.session.nodeProgress.step()
+
+            self.session.gltfNodeToBlender[gltf2_object] = blender_object
+            self.session.blenderNodeToGltfNode[blender_object] = gltf2_object
+
+            if blender_object in self.session.settledMatrices:
+                self._setSettledTransform(gltf2_object, blender_object, export_settings)
 
             if gltf2_object.extensions is None:
                 # <todo.eoin Pretty sure this is never hit, due to export_user_extensions()
@@ -277,13 +1033,7 @@ class glTF2ExportUserExtension:
             extension_data = RigidBodiesNodeExtension()
             # Blender has no way to specify a shape without a rigid body. Instead, a single shape is
             # specified by being a child of a body whose collider type is "Compound Parent"
-            if (
-                blender_object.rigid_body
-                and self._getParentCompoundBody(blender_object) == None
-                and blender_object.rigid_body.enabled
-                # Not PASSIVE, which seems to imply static:
-                and blender_object.rigid_body.type == "ACTIVE"
-            ):
+            if self._hasMotion(blender_object):
                 rb = blender_object.rigid_body
                 extraProps = blender_object.khr_physics_extra_props
 
@@ -326,6 +1076,26 @@ class glTF2ExportUserExtension:
                 motion.angular_damping = blender_object.rigid_body.angular_damping
                 motion.linear_damping = blender_object.rigid_body.linear_damping
                 motion.start_deactivated = blender_object.rigid_body.use_start_deactivated
+                if (
+                    blender_object in self.session.settledMatrices
+                    and self.properties.warm_start_deactivated
+                ):
+                    motion.start_deactivated = True
+
+                if blender_object in self.session.bakedSamples:
+                    # The baked animation replaces the simulation
+                    motion.is_kinematic = True
+                    motion.linear_velocity = None
+                    motion.angular_velocity = None
+
+                if self.properties.write_solver_settings:
+                    motion.extras = {
+                        "deactivation": {
+                            "enabled": rb.use_deactivation,
+                            "linearVelocity": rb.deactivate_linear_velocity,
+                            "angularVelocity": rb.deactivate_angular_velocity,
+                        }
+                    }
 
                 extension_data.motion = motion
 
@@ -346,6 +1116,9 @@ class glTF2ExportUserExtension:
                         extension_data.trigger = Trigger()
                         extension_data.trigger.geometry = geom_data
                         extension_data.trigger.collision_filter = filter_obj
+                        extension_data.trigger.extras = self._cookedCollisionData(
+                            blender_object, export_settings
+                        )
                     else:
                         extension_data.collider = Collider()
                         extension_data.collider.geometry = geom_data
@@ -353,11 +1126,14 @@ class glTF2ExportUserExtension:
                         extension_data.collider.physics_material = (
                             self._generateMaterialRootObject(blender_object)
                         )
+                        extension_data.collider.extras = self._cookedCollisionData(
+                            blender_object, export_settings
+                        )
 
             if blender_object.rigid_body_constraint:
                 # Because joints refer to another node in the scene, which may not be processed yet,
                 # We'll just save all the joint objects we see and process them later.
-                self.blenderJointObjects.append(blender_object)
+                self.session.blenderJointObjects.append(blender_object)
 
             if (
                 blender_object.rigid_body != None
@@ -368,6 +1144,431 @@ class glTF2ExportUserExtension:
                     extension=extension_data.to_dict(),
                     required=False,
                 )
+                if self.properties.write_stable_ids:
+                    stableId = self._getStableId(blender_object)
+                    if stableId != None:
+                        self._setNodeExtra(gltf2_object, "stableId", stableId)
+
+            if self.properties.batch_static_colliders and self._isBatchable(
+                blender_object
+            ):
+                self.session.staticColliders.append(blender_object)
+
+            if self.physicsOnly:
+                self._stripRenderData(gltf2_object)
+
+    def _stripRenderData(self, gltf2_object):
+        """Removes everything but the transform and physics data from a node.
+        Collision geometry has already been copied to a child node."""
+        gltf2_object.mesh = None
+        gltf2_object.skin = None
+        gltf2_object.camera = None
+        gltf2_object.weights = None
+        for name in list(gltf2_object.extensions):
+            if name != rigidBody_Extension_Name:
+                del gltf2_object.extensions[name]
+
+    def _positionsOnlyMesh(self, mesh: gltf2_io.Mesh) -> gltf2_io.Mesh:
+        """Returns a copy of `mesh` whose primitives only have positions and
+        indices, sharing the original accessors"""
+        stripped = self.session.positionsOnlyMeshes.get(id(mesh))
+        if stripped != None:
+            return stripped
+        primitives = [
+            gltf2_io.MeshPrimitive(
+                attributes={"POSITION": p.attributes["POSITION"]},
+                extensions=None,
+                extras=None,
+                indices=p.indices,
+                material=None,
+                mode=p.mode,
+                targets=None,
+            )
+            for p in mesh.primitives
+        ]
+        stripped = gltf2_io.Mesh(
+            extensions=None,
+            extras=None,
+            name=mesh.name,
+            primitives=primitives,
+            weights=None,
+        )
+        self.session.positionsOnlyMeshes[id(mesh)] = stripped
+        return stripped
+
+    def _collisionMesh(self, node, export_settings) -> CollisionMesh:
+        """Builds a mesh holding only the welded triangles of the node's
+        geometry, in a single primitive"""
+        # Objects sharing unmodified mesh data can share the collision mesh too
+        if export_settings["gltf_apply"] and len(node.modifiers):
+            key = ("object", node.session_uid)
+        else:
+            key = ("data", node.data.session_uid)
+        if key in self.session.collisionMeshes:
+            return self.session.collisionMeshes[key]
+
+        with accessMeshData(node, export_settings["gltf_apply"]) as meshData:
+            positions, indices = collision_mesh(
+                meshData,
+                export_settings["gltf_yup"],
+                self.properties.collision_weld_distance,
+            )
+        result = self._buildCollisionMesh(positions, indices, node.data.name)
+        self.session.collisionMeshes[key] = result
+        return result
+
+    def _buildCollisionMesh(self, positions, indices, name) -> CollisionMesh:
+        result = CollisionMesh()
+        result.positions = positions
+        result.triangles = indices
+        if len(indices):
+            positionAccessor = None
+            if self.properties.quantize_collision_meshes:
+                quantized, offset, scale, maxError = quantize_positions(positions)
+                if maxError <= self.properties.quantization_error:
+                    positionAccessor = self._makeAccessor(
+                        quantized,
+                        len(quantized),
+                        gltf2_io_constants.ComponentType.Short,
+                        gltf2_io_constants.DataType.Vec3,
+                        gltf2_io_constants.BufferViewTarget.ARRAY_BUFFER,
+                        bounds=quantized[:, :3],
+                        normalized=True,
+                    )
+                    self.session.quantizedAccessors.append(positionAccessor)
+                    result.translation = offset.tolist()
+                    result.scale = scale.tolist()
+                else:
+                    print(
+                        "%s quantizing '%s' would move vertices by up to %f; "
+                        "exporting float positions"
+                        % (progress_log_prefix, name, maxError)
+                    )
+            if positionAccessor == None:
+                positionAccessor = self._makeAccessor(
+                    positions,
+                    len(positions),
+                    gltf2_io_constants.ComponentType.Float,
+                    gltf2_io_constants.DataType.Vec3,
+                    gltf2_io_constants.BufferViewTarget.ARRAY_BUFFER,
+                    bounds=positions,
+                )
+
+            indices = indices.reshape(-1)
+            primitive = gltf2_io.MeshPrimitive(
+                attributes={"POSITION": positionAccessor},
+                extensions=None,
+                extras=None,
+                indices=self._makeAccessor(
+                    indices,
+                    len(indices),
+                    gltf2_io_constants.ComponentType.UnsignedShort
+                    if indices.dtype.itemsize == 2
+                    else gltf2_io_constants.ComponentType.UnsignedInt,
+                    gltf2_io_constants.DataType.Scalar,
+                    gltf2_io_constants.BufferViewTarget.ELEMENT_ARRAY_BUFFER,
+                ),
+                material=None,
+                mode=None,
+                targets=None,
+            )
+            result.mesh = gltf2_io.Mesh(
+                extensions=None,
+                extras=None,
+                name=name + "_collision",
+                primitives=[primitive],
+                weights=None,
+            )
+        return result
+
+    @staticmethod
+    def _useCollisionMesh(shape_node, collisionMesh: CollisionMesh):
+        shape_node.mesh = collisionMesh.mesh
+        shape_node.skin = None
+        if collisionMesh.translation != None:
+            # KHR_mesh_quantization's dequantization transform
+            shape_node.translation = collisionMesh.translation
+            shape_node.scale = collisionMesh.scale
+
+    def _cookedCollisionData(self, node, export_settings) -> Optional[dict]:
+        """Returns extras referencing precomputed data for the node's collision
+        mesh; a heightfield, BVH and edge flags for triangle meshes, or the
+        faces and edges of convex hulls"""
+        shapeType = node.rigid_body.collision_shape
+        if shapeType not in ("MESH", "CONVEX_HULL"):
+            return None
+
+        extras = {}
+        if self.properties.detect_heightfields and shapeType == "MESH":
+            heightfield = self._heightfield(node, export_settings)
+            if heightfield != None:
+                extras["heightfield"] = heightfield
+
+        if self.properties.strip_collision_meshes:
+            collisionMesh = self._collisionMesh(node, export_settings)
+            extras.update(self._cookedExtras(collisionMesh, shapeType))
+        return extras if len(extras) else None
+
+    def _cookedExtras(self, collisionMesh: CollisionMesh, shapeType: str) -> dict:
+        extras = {}
+        if collisionMesh.mesh != None:
+            if self.properties.cook_collision_data:
+                extras.update(self._cook(collisionMesh, shapeType))
+            if self.properties.edge_convexity_flags and shapeType == "MESH":
+                extras.update(self._cook(collisionMesh, "EDGE_FLAGS"))
+        return extras
+
+    def _heightfield(self, node, export_settings) -> Optional[dict]:
+        """Describes the node's mesh as a heightfield, if it is a regular grid.
+        The triangle mesh is still exported, for readers which don't
+        understand heightfields."""
+        # The welded, cleaned geometry of the collision mesh is needed, even if
+        # the mesh itself won't be exported
+        collisionMesh = self._collisionMesh(node, export_settings)
+        if "HEIGHTFIELD" not in collisionMesh.cooked:
+            heightfield = detect_heightfield(
+                collisionMesh.positions,
+                collisionMesh.triangles,
+                1 if export_settings["gltf_yup"] else 2,
+                self.properties.heightfield_tolerance,
+            )
+            if heightfield != None:
+                heightfield["samples"] = gltf2_io_binary_data.BinaryData(
+                    heightfield["samples"].tobytes()
+                )
+            collisionMesh.cooked["HEIGHTFIELD"] = heightfield
+        heightfield = collisionMesh.cooked["HEIGHTFIELD"]
+        return dict(heightfield) if heightfield != None else None
+
+    def _cook(self, collisionMesh: CollisionMesh, dataType: str) -> dict:
+        cooked = collisionMesh.cooked.get(dataType)
+        if cooked != None:
+            return cooked
+
+        if dataType == "MESH":
+            bvhNodes, triangleOrder = build_bvh(
+                collisionMesh.positions, collisionMesh.triangles
+            )
+            arrays = {"bvhNodes": bvhNodes, "bvhTriangles": triangleOrder}
+        elif dataType == "CONVEX_HULL":
+            vertices, planes, edges = convex_hull(collisionMesh.positions)
+            arrays = {"hullVertices": vertices, "hullPlanes": planes, "hullEdges": edges}
+        else:
+            arrays = {
+                "edgeFlags": edge_convexity(
+                    collisionMesh.positions, collisionMesh.triangles
+                )
+            }
+        cooked = {
+            k: gltf2_io_binary_data.BinaryData(v.tobytes()) for k, v in arrays.items()
+        }
+        collisionMesh.cooked[dataType] = cooked
+        return cooked
+
+    @staticmethod
+    def _makeAccessor(
+        array, count, componentType, dataType, target, bounds=None, normalized=None
+    ) -> gltf2_io.Accessor:
+        """Creates an accessor for a numpy array, backed by its own buffer view"""
+        return gltf2_io.Accessor(
+            buffer_view=gltf2_io_binary_data.BinaryData(
+                array.tobytes(), bufferViewTarget=target
+            ),
+            byte_offset=None,
+            component_type=componentType,
+            count=count,
+            extensions=None,
+            extras=None,
+            max=bounds.max(axis=0).tolist() if bounds is not None else None,
+            min=bounds.min(axis=0).tolist() if bounds is not None else None,
+            name=None,
+            normalized=normalized,
+            sparse=None,
+            type=dataType,
+        )
+
+    def gather_gltf_hook(self, active_scene_idx, scenes, animations, export_settings):
+        if is_aborted():
+            return
+        try:
+            self.gather_gltf_hook2(active_scene_idx, scenes, animations, export_settings)
+        except PhysicsAbort as e:
+            record_abort(e)
+
+    def gather_gltf_hook2(self, active_scene_idx, scenes, animations, export_settings):
+        if not self.properties.enabled:
+            return
+        if self.physicsOnly:
+            # Only keep animation which moves physics nodes, i.e. kinematic bodies
+            for animation in list(animations):
+                animation.channels = [
+                    c
+                    for c in animation.channels
+                    if c.target.path != "weights"
+                    and rigidBody_Extension_Name in (c.target.node.extensions or {})
+                ]
+                if not len(animation.channels):
+                    animations.remove(animation)
+                else:
+                    self._pruneSamplers(animation)
+
+        if len(self.session.bakedSamples):
+            self._addBakedAnimation(animations, export_settings)
+
+    @staticmethod
+    def _pruneSamplers(animation):
+        """Removes the samplers which no channel uses, so their keys aren't
+        exported, and renumbers the channels' references to the rest"""
+        used = sorted(set(c.sampler for c in animation.channels))
+        remap = {old: new for new, old in enumerate(used)}
+        animation.samplers = [animation.samplers[i] for i in used]
+        for channel in animation.channels:
+            channel.sampler = remap[channel.sampler]
+
+    def _addBakedAnimation(self, animations, export_settings):
+        """Adds an animation replaying the simulation of the baked bodies. Keys
+        which can be interpolated within the bake tolerances are removed, as
+        are the tracks of bodies which never move."""
+        scene = bpy.context.scene
+        fps = scene.render.fps / scene.render.fps_base
+        frames = np.array(self.session.bakeFrames, dtype=np.float64)
+        times = ((frames - frames[0]) / fps).astype(np.float32)
+        samples = self.session.bakedSamples
+
+        channels = []
+        samplers = []
+        numMoving = 0
+        for obj, matrices in samples.items():
+            glNode = self.session.blenderNodeToGltfNode.get(obj)
+            if glNode == None:
+                continue
+            parent = obj.parent
+            translations = []
+            rotations = []
+            for i, worldMatrix in enumerate(matrices):
+                if parent in samples:
+                    parentMatrix = samples[parent][i]
+                else:
+                    parentMatrix = parent.matrix_world if parent != None else Matrix()
+                loc, rot, _ = (parentMatrix.inverted() @ worldMatrix).decompose()
+                translations.append(list(convert_swizzle_location(loc, export_settings)))
+                rotations.append(
+                    self._serializeQuaternion(convert_swizzle_rotation(rot, export_settings))
+                )
+
+            tracks = (
+                (
+                    "translation",
+                    np.array(translations),
+                    self.properties.bake_tolerance,
+                    linear_error,
+                    gltf2_io_constants.DataType.Vec3,
+                ),
+                (
+                    "rotation",
+                    continuous_quaternions(np.array(rotations)),
+                    self.properties.bake_angle_tolerance,
+                    slerp_error,
+                    gltf2_io_constants.DataType.Vec4,
+                ),
+            )
+            moving = False
+            for path, values, tolerance, error, dataType in tracks:
+                if is_constant(values, tolerance, error):
+                    continue
+                moving = True
+                keys = simplify_keys(values, tolerance, error)
+                keyTimes = times[keys]
+                samplers.append(
+                    gltf2_io.AnimationSampler(
+                        extensions=None,
+                        extras=None,
+                        input=self._makeAccessor(
+                            keyTimes,
+                            len(keys),
+                            gltf2_io_constants.ComponentType.Float,
+                            gltf2_io_constants.DataType.Scalar,
+                            None,
+                            bounds=keyTimes.reshape(-1, 1),
+                        ),
+                        interpolation="LINEAR",
+                        output=self._makeAccessor(
+                            values[keys].astype(np.float32),
+                            len(keys),
+                            gltf2_io_constants.ComponentType.Float,
+                            dataType,
+                            None,
+                        ),
+                    )
+                )
+                channels.append(
+                    gltf2_io.AnimationChannel(
+                        extensions=None,
+                        extras=None,
+                        sampler=len(samplers) - 1,
+                        target=gltf2_io.AnimationChannelTarget(
+                            extensions=None, extras=None, node=glNode, path=path
+                        ),
+                    )
+                )
+            numMoving += int(moving)
+
+        if len(channels):
+            animations.append(
+                gltf2_io.Animation(
+                    channels=channels,
+                    extensions=None,
+                    extras=None,
+                    name="physicsBake",
+                    samplers=samplers,
+                )
+            )
+        print(
+            "%s baked %i bodies over %i frames; %i moved, using %i keys"
+            % (
+                progress_log_prefix,
+                len(samples),
+                len(frames),
+                numMoving,
+                sum(s.input.count for s in samplers),
+            )
+        )
+
+    def _getStableId(self, blender_object) -> Optional[str]:
+        """Returns the identifier which survives renaming, so that exported
+        nodes can be matched up with their objects later. IDs are assigned
+        when the .blend file is saved, not during an export, so objects
+        created since, and duplicates which still share an ID, have none."""
+        if self.session.stableIdCounts == None:
+            counts = {}
+            for o in bpy.data.objects:
+                stableId = o.khr_physics_extra_props.stable_id
+                counts[stableId] = counts.get(stableId, 0) + 1
+            self.session.stableIdCounts = counts
+        stableId = blender_object.khr_physics_extra_props.stable_id
+        if not stableId or self.session.stableIdCounts[stableId] > 1:
+            return None
+        return stableId
+
+    @staticmethod
+    def _setNodeExtra(gltf_object, key, value):
+        """Stores a value in the object's extras, under our extension's name,
+        leaving any other extras intact"""
+        if gltf_object.extras == None:
+            gltf_object.extras = {}
+        if not isinstance(gltf_object.extras, dict):
+            return
+        gltf_object.extras.setdefault(rigidBody_Extension_Name, {})[key] = value
+
+    def _hasMotion(self, blender_object) -> bool:
+        """Whether the object is exported as a body with a motion"""
+        return (
+            blender_object.rigid_body != None
+            and self._getParentCompoundBody(blender_object) == None
+            and blender_object.rigid_body.enabled
+            # Not PASSIVE, which seems to imply static:
+            and blender_object.rigid_body.type == "ACTIVE"
+        )
 
     def _getParentCompoundBody(self, node: bpy.types.Node) -> Optional[bpy.types.Node]:
         cur = node.parent
@@ -404,6 +1605,11 @@ class glTF2ExportUserExtension:
         jointData = Joint()
         if not joint.disable_collisions:
             jointData.enable_collision = not joint.disable_collisions
+        if (
+            self.properties.write_solver_settings
+            and joint.use_override_solver_iterations
+        ):
+            jointData.extras = {"solverIterations": joint.solver_iterations}
 
         if export_settings["gltf_yup"]:
             X, Y, Z = (0, 2, 1)
@@ -607,10 +1813,257 @@ class glTF2ExportUserExtension:
             )
             shape_node.mesh = glNode.mesh
             shape_node.skin = glNode.skin
+            if self.properties.strip_collision_meshes:
+                self._useCollisionMesh(
+                    shape_node, self._collisionMesh(node, export_settings)
+                )
+            elif self.physicsOnly and glNode.mesh != None:
+                shape_node.mesh = self._positionsOnlyMesh(glNode.mesh)
+                shape_node.skin = None
             geom.convex_hull = node.rigid_body.collision_shape == "CONVEX_HULL"
             geom.node = shape_node
+            self._recordCollider(node, glNode, None, export_settings)
             return geom
 
+        if self._usesSphereTree(node):
+            tree = self._sphereTree(node, export_settings)
+            if tree != None and len(tree[1]):
+                self._addSphereTree(node, glNode, tree, export_settings)
+                self._recordCollider(node, glNode, None, export_settings)
+                # The spheres are colliders on children of glNode, making the
+                # body a compound
+                return None
+
+        shape = self._fitShape(node, export_settings)
+        record = self._recordCollider(node, glNode, shape, export_settings)
+        geom.shape = self.ChildOfRootExtension(
+            name=implicitShapes_Extension_Name,
+            path=["shapes"],
+            required=False,
+            extension=shape.to_dict(),
+        )
+
+        if shape.type in ("capsule", "cylinder") and not export_settings["gltf_yup"]:
+            # Add an additional node to align the object, so the shape is oriented correctly when constructed along +Y
+            shape_alignment = self._constructNode(
+                "physicsAlignmentNode",
+                Vector((0, 0, 0)),
+                Quaternion((halfSqrt2, 0, 0, halfSqrt2)),
+                export_settings,
+            )
+
+            node_ext = RigidBodiesNodeExtension()
+            if node.khr_physics_extra_props.is_trigger:
+                node_ext.trigger = Trigger()
+                node_ext.trigger.collision_filter = self._generateFilterRootObject(
+                    node
+                )
+                node_ext.trigger.geometry = geom
+            else:
+                node_ext.collider = Collider()
+                node_ext.collider.physics_material = (
+                    self._generateMaterialRootObject(node)
+                )
+                node_ext.collider.collision_filter = self._generateFilterRootObject(
+                    node
+                )
+                node_ext.collider.geometry = geom
+
+            shape_alignment.extensions[rigidBody_Extension_Name] = self.Extension(
+                name=rigidBody_Extension_Name,
+                extension=node_ext.to_dict(),
+                required=False,
+            )
+            glNode.children.append(shape_alignment)
+            self.session.alignmentNodes[node] = shape_alignment
+            record.colliderNode = shape_alignment
+
+            # We've added the shape data to a child of glNode;
+            # return None so that the glNode doesn't get shape data,
+            return None
+        return geom
+
+    def _usesSphereTree(self, node) -> bool:
+        rb = node.rigid_body
+        extraProps = node.khr_physics_extra_props
+        return (
+            extraProps.use_sphere_tree
+            and not extraProps.is_trigger
+            and rb.collision_shape in ("CONVEX_HULL", "MESH")
+            and self._hasMotion(node)
+        )
+
+    def _sphereTree(self, node, export_settings):
+        if self.session.sphereTrees == None:
+            self._buildSphereTrees(export_settings)
+        return self.session.sphereTrees.get(node)
+
+    def _buildSphereTrees(self, export_settings):
+        """Fits spheres to every exported body which is approximated by them.
+        They're all fitted at once, so the work can be spread over several
+        processes."""
+        vtree = export_settings.get("vtree")
+        if vtree != None:
+            from io_scene_gltf2.blender.exp.tree import VExportNode
+
+            objects = [
+                n.blender_object
+                for n in vtree.nodes.values()
+                if n.blender_type == VExportNode.OBJECT
+            ]
+        else:
+            objects = bpy.context.scene.objects
+        self.session.sphereTrees = {}
+
+        jobs = []
+        for obj in objects:
+            if obj.rigid_body == None or not self._usesSphereTree(obj):
+                continue
+            extraProps = obj.khr_physics_extra_props
+            cacheKey = (
+                "sphereTree",
+                extraProps.sphere_tree_count,
+                extraProps.sphere_tree_tolerance,
+                export_settings["gltf_apply"],
+            )
+            tree = None
+            if self.properties.use_cache:
+                tree = physics_export_cache.get(obj, cacheKey)
+            if tree != None:
+                self.session.cacheHits += 1
+                self.session.sphereTrees[obj] = tree
+                continue
+            with accessMeshData(obj, export_settings["gltf_apply"]) as meshData:
+                positions, triangles = mesh_triangles(meshData)
+            args = (
+                positions,
+                triangles,
+                extraProps.sphere_tree_count,
+                extraProps.sphere_tree_tolerance,
+            )
+            jobs.append((obj, cacheKey, args))
+        if not len(jobs):
+            return
+
+        progress = ProgressReporter("sphere trees fitted", len(jobs))
+        workers = self.properties.sphere_tree_processes
+        results = None
+        if workers > 0 and len(jobs) > 1:
+            try:
+                results = self._runSphereTreeJobs(
+                    [args for _, _, args in jobs], workers, progress
+                )
+            except PhysicsAbort:
+                raise
+            except:
+                # e.g. BrokenProcessPool, if the workers couldn't start
+                import traceback
+
+                print(traceback.format_exc())
+                print("%s fitting spheres in this process" % progress_log_prefix)
+        if results == None:
+            results = []
+            for _, _, args in jobs:
+                progress.step()
+                results.append(sphere_tree(*args))
+        progress.end()
+
+        for (obj, cacheKey, _), tree in zip(jobs, results):
+            self.session.sphereTrees[obj] = tree
+            if self.properties.use_cache:
+                physics_export_cache.put(obj, cacheKey, tree)
+                self.session.cacheMisses += 1
+            print(
+                "%s '%s' approximated by %i spheres (error %.4g)"
+                % (progress_log_prefix, obj.name, len(tree[1]), tree[2])
+            )
+
+    @staticmethod
+    def _runSphereTreeJobs(argsList, workers, progress) -> list:
+        # Workers are spawned, rather than forked from Blender, and run the
+        # sphere fitting module without the rest of the addon, which needs bpy.
+        # They're started by the first submissions.
+        module = standalone_module()
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=site.addsitedir,
+            initargs=(module_directory,),
+        ) as pool:
+            with hidden_main_module():
+                futures = [
+                    pool.submit(module.sphere_tree_job, args) for args in argsList
+                ]
+            try:
+                for _ in as_completed(futures):
+                    progress.step()
+            except PhysicsAbort:
+                for future in futures:
+                    future.cancel()
+                raise
+            return [future.result() for future in futures]
+
+    def _addSphereTree(self, node, glNode, tree, export_settings):
+        """Adds a child node with a sphere collider for each sphere"""
+        centers, radii, _ = tree
+        for center, radius in zip(centers, radii):
+            shape = Shape()
+            shape.type = "sphere"
+            shape.sphere = Sphere(radius=float(radius))
+            geom = Geometry()
+            geom.shape = self.ChildOfRootExtension(
+                name=implicitShapes_Extension_Name,
+                path=["shapes"],
+                required=False,
+                extension=shape.to_dict(),
+            )
+            node_ext = RigidBodiesNodeExtension()
+            node_ext.collider = Collider()
+            node_ext.collider.physics_material = self._generateMaterialRootObject(node)
+            node_ext.collider.collision_filter = self._generateFilterRootObject(node)
+            node_ext.collider.geometry = geom
+
+            sphereNode = self._constructNode(
+                "physicsSphereTreeNode",
+                Vector(center.tolist()),
+                Quaternion((1, 0, 0, 0)),
+                export_settings,
+            )
+            sphereNode.extensions[rigidBody_Extension_Name] = self.Extension(
+                name=rigidBody_Extension_Name,
+                extension=node_ext.to_dict(),
+                required=False,
+            )
+            glNode.children.append(sphereNode)
+
+    def _fitShape(self, node, export_settings) -> Shape:
+        """Fits a primitive shape to the node's mesh, reusing the shape from a
+        previous export if the node hasn't changed since"""
+        if not self.properties.use_cache:
+            return self._calculateShape(node, export_settings)
+
+        extraProps = node.khr_physics_extra_props
+        cacheKey = (
+            "shape",
+            node.rigid_body.collision_shape,
+            extraProps.cone_capsule_override,
+            extraProps.cone_capsule_height,
+            extraProps.cone_capsule_radius_bottom,
+            extraProps.cone_capsule_radius_top,
+            export_settings["gltf_yup"],
+            export_settings["gltf_apply"],
+        )
+        shape = physics_export_cache.get(node, cacheKey)
+        if shape != None:
+            self.session.cacheHits += 1
+            return shape
+        shape = self._calculateShape(node, export_settings)
+        physics_export_cache.put(node, cacheKey, shape)
+        self.session.cacheMisses += 1
+        return shape
+
+    def _calculateShape(self, node, export_settings) -> Shape:
         shape = Shape()
         # If the shape is a geometric primitive, we may have to apply modifiers
         # to see the final geometry. (glNode has already had modifiers applied)
@@ -658,58 +2111,22 @@ class glTF2ExportUserExtension:
                         radiusTop=radiusTop,
                         radiusBottom=radiusBottom,
                     )
-
-                if not export_settings["gltf_yup"]:
-                    # Add an additional node to align the object, so the shape is oriented correctly when constructed along +Y
-                    shape_alignment = self._constructNode(
-                        "physicsAlignmentNode",
-                        Vector((0, 0, 0)),
-                        Quaternion((halfSqrt2, 0, 0, halfSqrt2)),
-                        export_settings,
-                    )
-
-                    node_ext = RigidBodiesNodeExtension()
-                    geom.shape = self.ChildOfRootExtension(
-                        name=implicitShapes_Extension_Name,
-                        path=["shapes"],
-                        required=False,
-                        extension=shape.to_dict(),
-                    )
-                    if node.khr_physics_extra_props.is_trigger:
-                        node_ext.trigger = Trigger()
-                        node_ext.trigger.collision_filter = (
-                            self._generateFilterRootObject(node)
-                        )
-                        node_ext.trigger.geometry = geom
-                    else:
-                        node_ext.collider = Collider()
-                        node_ext.collider.physics_material = (
-                            self._generateMaterialRootObject(node)
-                        )
-                        node_ext.collider.collision_filter = (
-                            self._generateFilterRootObject(node)
-                        )
-                        node_ext.collider.geometry = geom
-
-                    shape_alignment.extensions[rigidBody_Extension_Name] = (
-                        self.Extension(
-                            name=rigidBody_Extension_Name,
-                            extension=node_ext.to_dict(),
-                            required=False,
-                        )
-                    )
-                    glNode.children.append(shape_alignment)
-
-                    # We've added the shape data to a child of glNode;
-                    # return None so that the glNode doesn't get shape data,
-                    return None
-        geom.shape = self.ChildOfRootExtension(
-            name=implicitShapes_Extension_Name,
-            path=["shapes"],
-            required=False,
-            extension=shape.to_dict(),
-        )
-        return geom
+        return shape
+
+    def _jointBodyNode(self, body, gltf2_scene, export_settings):
+        """The node a joint connects to for `body`. Static bodies which aren't
+        part of this export (e.g. those in another tile) never move, so joints
+        to them are connected to a node fixed in the world instead"""
+        glNode = self.session.blenderNodeToGltfNode.get(body)
+        animated = body != None and body.rigid_body != None and body.rigid_body.kinematic
+        if glNode != None or animated or is_dynamic(body):
+            return glNode
+        if self.session.worldAnchor == None:
+            self.session.worldAnchor = self._constructNode(
+                "physicsWorldAnchor", Vector((0, 0, 0)), Quaternion(), export_settings
+            )
+            gltf2_scene.nodes.append(self.session.worldAnchor)
+        return self.session.worldAnchor
 
     def _constructNode(self, name, translation, rotation, export_settings):
         return gltf2_io.Node(
@@ -0,0 +1,316 @@
+"""Headless batch exporter.
+
+Exports many .blend files using a small pool of long-lived Blender worker
+processes, so that Blender's startup cost is paid once per worker rather than
+once per file. Run with:
+
+    blender --background --python gltf2_blender_rigid_bodies_batch.py -- \\
+        manifest.json [--workers N] [--report report.json]
+
+The manifest is a JSON document of the form:
+
+    {
+        "settings": {
+            "enabled": true,
+            "reparent_bones": true,
+            "gltf": {"export_format": "GLB"}
+        },
+        "jobs": [
+            {"input": "level01.blend", "output": "out/level01.glb"},
+            {"input": "level02.blend", "output": "out/level02.glb",
+             "settings": {"reparent_bones": false}}
+        ]
+    }
+
+A job with "mode": "patch" doesn't run a full export; instead the physics data
+in its existing "output" file is replaced with data from "input" (see
+gltf2_blender_rigid_bodies_patch.py). Its "gltf" settings may give the
+"export_yup" and "export_apply" options the file was exported with, which
+default to the glTF exporter's defaults.
+
+A bare list of jobs is also accepted. Keys in "settings" (other than "gltf")
+are applied to the scene's KHR_physics_rigid_bodies exporter properties; the
+"gltf" dictionary is passed through to bpy.ops.export_scene.gltf. Per-job
+settings are merged over the manifest settings.
+
+This file is intentionally free of relative imports, so that it can be run
+directly by Blender's --python argument.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import bpy
+
+addon_name = "KHR_physics_rigid_bodies"
+
+
+def ensure_addon_enabled(module_name=None):
+    """Make sure the physics extension is registered in this Blender instance"""
+    if hasattr(bpy.types.Scene, "khr_physics_exporter_props"):
+        return
+    import addon_utils
+
+    candidates = [module_name] if module_name else []
+    candidates.append(addon_name)
+    for repo in bpy.context.preferences.extensions.repos:
+        candidates.append("bl_ext.%s.%s" % (repo.module, addon_name))
+    for candidate in candidates:
+        addon_utils.enable(candidate, default_set=False)
+        if hasattr(bpy.types.Scene, "khr_physics_exporter_props"):
+            return
+    raise RuntimeError("Unable to enable the %s addon" % addon_name)
+
+
+def addon_module(name):
+    """Imports one of the enabled addon's modules, by its name within the
+    addon, from wherever the addon is installed"""
+    props = type(bpy.context.scene.khr_physics_exporter_props)
+    package = props.__module__.rsplit(".blender.", 1)[0]
+    return importlib.import_module("%s.%s" % (package, name))
+
+
+def merge_settings(base, override):
+    """Merges per-job settings over the manifest settings"""
+    result = dict(base or {})
+    for key, value in (override or {}).items():
+        if key == "gltf":
+            gltf = dict(result.get("gltf", {}))
+            gltf.update(value)
+            result["gltf"] = gltf
+        else:
+            result[key] = value
+    return result
+
+
+def apply_exporter_settings(scene, settings):
+    props = scene.khr_physics_exporter_props
+    for key, value in settings.items():
+        if key == "gltf":
+            continue
+        if not hasattr(props, key):
+            raise KeyError("Unknown exporter setting '%s'" % key)
+        setattr(props, key, value)
+
+
+def export_job(job, settings, reopen=True):
+    """Opens a single .blend file and exports it. Returns a result dictionary
+    with the success, timing and size of the export. If `reopen` is False,
+    the currently open file is exported as-is when it is the job's input"""
+    result = {"input": job["input"], "output": job["output"], "success": False}
+    start = time.perf_counter()
+    try:
+        settings = merge_settings(settings, job.get("settings"))
+        if reopen or os.path.abspath(bpy.data.filepath) != os.path.abspath(
+            job["input"]
+        ):
+            bpy.ops.wm.open_mainfile(filepath=job["input"], load_ui=False)
+        apply_exporter_settings(bpy.context.scene, settings)
+        if job.get("mode") == "patch":
+            gltf = settings.get("gltf", {})
+            status = bpy.ops.khr_physics_rigid_bodies.patch_physics(
+                filepath=job["output"],
+                export_yup=gltf.get("export_yup", True),
+                export_apply=gltf.get("export_apply", False),
+            )
+            # The operator reports its errors rather than raising them
+            if "FINISHED" not in status:
+                raise RuntimeError("Unable to patch %s; see the log" % job["output"])
+        else:
+            output_dir = os.path.dirname(os.path.abspath(job["output"]))
+            os.makedirs(output_dir, exist_ok=True)
+            bpy.ops.export_scene.gltf(
+                filepath=job["output"], **settings.get("gltf", {})
+            )
+            # The glTF exporter only logs errors raised by the physics hooks,
+            # and writes the file regardless
+            progress = addon_module("blender.com.gltf2_blender_rigid_bodies_progress")
+            progress.check_aborted(job["output"])
+        result["size"] = os.path.getsize(job["output"])
+        result["success"] = True
+    except Exception as e:
+        result["error"] = "%s: %s" % (type(e).__name__, e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def load_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {"jobs": manifest}
+
+    # Resolve paths relative to the manifest, so manifests can be relocated
+    base = os.path.dirname(os.path.abspath(path))
+    for job in manifest["jobs"]:
+        job["input"] = os.path.join(base, job["input"])
+        job["output"] = os.path.join(base, job["output"])
+    return manifest
+
+
+def partition_jobs(jobs, num_workers):
+    """Splits jobs between workers, largest inputs first, always giving the
+    next job to the least loaded worker"""
+
+    def input_size(job):
+        try:
+            return os.path.getsize(job["input"])
+        except OSError:
+            return 0
+
+    buckets = [[] for _ in range(num_workers)]
+    loads = [0] * num_workers
+    for job in sorted(jobs, key=input_size, reverse=True):
+        idx = loads.index(min(loads))
+        buckets[idx].append(job)
+        loads[idx] += input_size(job) + 1
+    return [b for b in buckets if len(b)]
+
+
+def run_worker(jobs_path, results_path, addon_module):
+    ensure_addon_enabled(addon_module)
+    with open(jobs_path) as f:
+        work = json.load(f)
+    results = []
+    for job in work["jobs"]:
+        results.append(export_job(job, work.get("settings")))
+        # Rewrite after every job, so a crashing worker still reports its
+        # completed files. The file is replaced whole, so it's never read
+        # half written
+        temp_path = results_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(results, f)
+        os.replace(temp_path, results_path)
+
+
+def run_pool(manifest, num_workers, addon_module):
+    """Runs the manifest's jobs over a pool of Blender worker processes"""
+    chunks = partition_jobs(manifest["jobs"], num_workers)
+    with tempfile.TemporaryDirectory(prefix="khr_physics_batch_") as tmp:
+        workers = []
+        for i, chunk in enumerate(chunks):
+            jobs_path = os.path.join(tmp, "jobs_%i.json" % i)
+            results_path = os.path.join(tmp, "results_%i.json" % i)
+            with open(jobs_path, "w") as f:
+                json.dump({"settings": manifest.get("settings"), "jobs": chunk}, f)
+            args = [
+                bpy.app.binary_path,
+                "--background",
+                "--python",
+                os.path.abspath(__file__),
+                "--",
+                "--worker",
+                jobs_path,
+                "--results",
+                results_path,
+            ]
+            if addon_module:
+                args += ["--addon", addon_module]
+            workers.append((subprocess.Popen(args), chunk, results_path))
+
+        results = []
+        for proc, chunk, results_path in workers:
+            proc.wait()
+            completed = []
+            try:
+                with open(results_path) as f:
+                    completed = json.load(f)
+            except (OSError, ValueError):
+                # The worker didn't finish any jobs, or didn't finish writing
+                # their results; they are reported as failed below
+                pass
+            results.extend(completed)
+            for job in chunk[len(completed) :]:
+                results.append(
+                    {
+                        "input": job["input"],
+                        "output": job["output"],
+                        "success": False,
+                        "error": "Worker exited with code %i" % proc.returncode,
+                        "seconds": 0.0,
+                    }
+                )
+    return results
+
+
+def print_report(results, wall_seconds):
+    print("")
+    print("%-7s %9s %12s  %s" % ("Status", "Time (s)", "Size (B)", "Input"))
+    for r in sorted(results, key=lambda r: r["input"]):
+        print(
+            "%-7s %9.2f %12s  %s"
+            % (
+                "OK" if r["success"] else "FAILED",
+                r["seconds"],
+                r.get("size", "-"),
+                r["input"],
+            )
+        )
+        if not r["success"]:
+            print("        %s" % r.get("error"))
+    succeeded = [r for r in results if r["success"]]
+    print(
+        "\n%i/%i files exported, %i bytes, %.2fs of export time in %.2fs"
+        % (
+            len(succeeded),
+            len(results),
+            sum(r["size"] for r in succeeded),
+            sum(r["seconds"] for r in results),
+            wall_seconds,
+        )
+    )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="gltf2_blender_rigid_bodies_batch",
+        description="Export many .blend files to glTF with rigid body data",
+    )
+    parser.add_argument("manifest", nargs="?", help="JSON manifest of jobs")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of Blender worker processes; 0 exports in this process",
+    )
+    parser.add_argument("--report", help="Write the per-file report as JSON")
+    parser.add_argument("--addon", help="Module name of the installed addon")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--results", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.worker:
+        run_worker(args.worker, args.results, args.addon)
+        return 0
+
+    if not args.manifest:
+        print("A manifest is required")
+        return 2
+
+    manifest = load_manifest(args.manifest)
+    start = time.perf_counter()
+    if args.workers > 0:
+        results = run_pool(manifest, args.workers, args.addon)
+    else:
+        ensure_addon_enabled(args.addon)
+        results = [export_job(job, manifest.get("settings")) for job in manifest["jobs"]]
+    print_report(results, time.perf_counter() - start)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(r["success"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+    sys.exit(main(argv))
@@ -0,0 +1,107 @@
+"""Client for gltf2_blender_rigid_bodies_daemon.py.
+
+Does not depend on Blender, so can be used from any Python tool:
+
+    client = ExportClient(port=9123)
+    result = client.export("level01.blend", "out/level01.glb")
+
+or from the command line:
+
+    python gltf2_blender_rigid_bodies_client.py --port 9123 \\
+        export level01.blend out/level01.glb
+"""
+
+import argparse
+import json
+import socket
+import sys
+
+
+class ExportError(Exception):
+    pass
+
+
+class ExportClient:
+    def __init__(self, host="127.0.0.1", port=9123, socket_path=None, timeout=None):
+        if socket_path:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(socket_path)
+        else:
+            self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.stream = self.sock.makefile("rwb")
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(self, request):
+        self.stream.write(json.dumps(request).encode() + b"\n")
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ExportError("Connection closed by daemon")
+        return json.loads(line)
+
+    def ping(self):
+        return self.request({"op": "ping"})["status"] == "ok"
+
+    def export(self, input_path, output_path, settings=None):
+        """Exports `input_path` to `output_path`, raising ExportError on failure"""
+        response = self.request(
+            {
+                "op": "export",
+                "input": input_path,
+                "output": output_path,
+                "settings": settings or {},
+            }
+        )
+        if response["status"] != "ok":
+            raise ExportError(response.get("error"))
+        return response
+
+    def shutdown(self):
+        return self.request({"op": "shutdown"})
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="gltf2_blender_rigid_bodies_client",
+        description="Send jobs to a running glTF physics export daemon",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9123)
+    parser.add_argument("--socket", help="Connect to this Unix socket instead")
+    parser.add_argument("--settings", help="Exporter settings, as JSON")
+    sub = parser.add_subparsers(dest="op", required=True)
+    export = sub.add_parser("export")
+    export.add_argument("input")
+    export.add_argument("output")
+    sub.add_parser("ping")
+    sub.add_parser("shutdown")
+    args = parser.parse_args(argv)
+
+    with ExportClient(args.host, args.port, args.socket) as client:
+        if args.op == "export":
+            settings = json.loads(args.settings) if args.settings else None
+            try:
+                response = client.export(args.input, args.output, settings)
+            except ExportError as e:
+                print("Export failed: %s" % e)
+                return 1
+        elif args.op == "ping":
+            response = client.request({"op": "ping"})
+        else:
+            response = client.shutdown()
+    print(json.dumps(response))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,158 @@
+"""Long-running headless export daemon.
+
+Loads Blender and the physics extension once, then serves export jobs over a
+local socket, so that interactive "re-export this asset" requests don't pay
+Blender's startup cost. Run with:
+
+    blender --background --python gltf2_blender_rigid_bodies_daemon.py -- \\
+        [--port 9123 | --socket /tmp/khr_physics.sock] [--port-file path]
+
+Requests and responses are single lines of JSON. Supported requests:
+
+    {"op": "export", "input": "a.blend", "output": "a.glb", "settings": {...}}
+    {"op": "ping"}
+    {"op": "shutdown"}
+
+"settings" has the same format as the batch exporter's manifest settings. An
+export response looks like:
+
+    {"status": "ok", "output": "a.glb", "seconds": 1.2, "size": 12345}
+
+or {"status": "error", "error": "..."} on failure. When consecutive jobs
+export the same, unmodified, .blend file with the same settings, the open
+file is reused rather than loaded again.
+
+gltf2_blender_rigid_bodies_client.py provides a small client for this daemon.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+# Share the job handling with the batch exporter; this file is run directly
+# by Blender, so can't use a relative import
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import gltf2_blender_rigid_bodies_batch as batch
+
+
+class ExportDaemon:
+    def __init__(self, addon_module=None):
+        batch.ensure_addon_enabled(addon_module)
+        self.running = True
+        # Identifies the currently open file, to decide if it can be reused
+        self.loaded_key = None
+
+    def handle(self, request):
+        op = request.get("op")
+        if op == "ping":
+            return {"status": "ok"}
+        if op == "shutdown":
+            self.running = False
+            return {"status": "ok"}
+        if op == "export":
+            return self.export(request)
+        return {"status": "error", "error": "Unknown op '%s'" % op}
+
+    def export(self, request):
+        job = {
+            "input": os.path.abspath(request["input"]),
+            "output": os.path.abspath(request["output"]),
+        }
+        settings = request.get("settings", {})
+        try:
+            key = (
+                job["input"],
+                os.path.getmtime(job["input"]),
+                json.dumps(settings, sort_keys=True),
+            )
+        except OSError as e:
+            return {"status": "error", "error": str(e)}
+
+        result = batch.export_job(job, settings, reopen=(key != self.loaded_key))
+        self.loaded_key = key if result["success"] else None
+
+        response = {
+            "status": "ok" if result["success"] else "error",
+            "output": result["output"],
+            "seconds": result["seconds"],
+        }
+        if result["success"]:
+            response["size"] = result["size"]
+        else:
+            response["error"] = result["error"]
+        return response
+
+    def serve_connection(self, conn):
+        with conn, conn.makefile("rwb") as stream:
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    response = self.handle(json.loads(line))
+                except Exception as e:
+                    response = {"status": "error", "error": str(e)}
+                stream.write(json.dumps(response).encode() + b"\n")
+                stream.flush()
+                if not self.running:
+                    return
+
+    def serve(self, server):
+        # Blender's API is single threaded, so connections are handled in turn
+        while self.running:
+            conn, _ = server.accept()
+            try:
+                self.serve_connection(conn)
+            except OSError as e:
+                # A client going away mustn't take the daemon down with it
+                print("Connection dropped: %s" % e, flush=True)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="gltf2_blender_rigid_bodies_daemon",
+        description="Serve glTF physics export jobs from a warm Blender instance",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument(
+        "--port", type=int, default=9123, help="TCP port; 0 picks a free port"
+    )
+    parser.add_argument("--socket", help="Listen on this Unix socket instead")
+    parser.add_argument("--port-file", help="Write the listening address here")
+    parser.add_argument("--addon", help="Module name of the installed addon")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    daemon = ExportDaemon(args.addon)
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(args.socket)
+        address = args.socket
+    else:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((args.host, args.port))
+        address = "%s:%i" % server.getsockname()
+
+    with server:
+        server.listen()
+        if args.port_file:
+            with open(args.port_file, "w") as f:
+                f.write(address)
+        print("KHR physics export daemon listening on %s" % address, flush=True)
+        daemon.serve(server)
+
+    if args.socket:
+        os.unlink(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+    sys.exit(main(argv))
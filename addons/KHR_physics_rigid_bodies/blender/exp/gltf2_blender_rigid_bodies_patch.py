@@ -0,0 +1,406 @@
+import bpy
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, List
+from io_scene_gltf2.io.com import gltf2_io
+from io_scene_gltf2.io.com.gltf2_io_extensions import Extension, ChildOfRootExtension
+from io_scene_gltf2.io.exp.gltf2_io_binary_data import BinaryData
+from mathutils import Vector, Quaternion
+from ...blender.com.gltf2_blender_rigid_bodies_progress import (
+    check_aborted,
+    progress_log_prefix,
+)
+from ...io.com.gltf2_io_implicit_shapes import implicitShapes_Extension_Name
+from ...io.com.gltf2_io_rigid_bodies import rigidBody_Extension_Name
+from .gltf2_blender_rigid_bodies import glTF2ExportUserExtension
+
+glb_magic = 0x46546C67
+glb_chunk_json = 0x4E4F534A
+glb_chunk_bin = 0x004E4942
+
+# Names of the nodes the exporter creates to carry physics data which has no
+# equivalent Blender object. These are replaced when a file is patched.
+physics_helper_node_names = {
+    "jointSpaceA",
+    "physicsAlignmentNode",
+    "physicsSphereTreeNode",
+    "physicsWorldAnchor",
+    "staticBatchCollider",
+}
+# Static collider batching names the node it creates for each grid cell with
+# this prefix, followed by the cell
+static_batch_node_prefix = "staticBatch_"
+
+# Size of the blocks used to copy a GLB's binary chunk into the patched file
+copy_block_size = 64 * 1024 * 1024
+
+
+class GlbFile:
+    """A memory-mapped .glb file. The JSON chunk is parsed; the binary chunk
+    is left in the mapping, so it can be copied without being read in full"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length = struct.unpack_from("<III", self.map, 0)
+        if magic != glb_magic or version != 2:
+            raise ValueError("%s is not a glTF 2.0 binary file" % path)
+
+        self.json = None
+        self.bin_offset = None
+        self.bin_length = 0
+        offset = 12
+        while offset < length:
+            chunkLength, chunkType = struct.unpack_from("<II", self.map, offset)
+            offset += 8
+            if chunkType == glb_chunk_json:
+                self.json = json.loads(bytes(self.map[offset : offset + chunkLength]))
+            elif chunkType == glb_chunk_bin and self.bin_offset == None:
+                self.bin_offset = offset
+                self.bin_length = chunkLength
+            offset += chunkLength
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def write(self, path, gltf):
+        jsonBytes = json.dumps(gltf, separators=(",", ":")).encode()
+        jsonBytes += b" " * (-len(jsonBytes) % 4)
+        length = 12 + 8 + len(jsonBytes)
+        if self.bin_offset != None:
+            length += 8 + self.bin_length
+
+        with open(path, "wb") as out:
+            out.write(struct.pack("<III", glb_magic, 2, length))
+            out.write(struct.pack("<II", len(jsonBytes), glb_chunk_json))
+            out.write(jsonBytes)
+            if self.bin_offset != None:
+                out.write(struct.pack("<II", self.bin_length, glb_chunk_bin))
+                view = memoryview(self.map)
+                end = self.bin_offset + self.bin_length
+                for start in range(self.bin_offset, end, copy_block_size):
+                    out.write(view[start : min(start + copy_block_size, end)])
+                view.release()
+
+
+class PhysicsPatcher:
+    """Replaces the physics data in an exported glTF document with data
+    generated from the current Blender scene, leaving everything else in the
+    document untouched"""
+
+    def __init__(self, gltf: Dict[str, Any], export_settings):
+        self.gltf = gltf
+        self.nodes: List[Dict[str, Any]] = gltf.setdefault("nodes", [])
+        self.export_settings = export_settings
+        self.freeNodes: List[int] = []
+        self.nodeIndices: Dict[int, int] = {}
+        self.rootItemIndices: Dict[str, int] = {}
+        self.extensionsUsed = set()
+        self.extensionsRequired = set()
+
+        # Mesh/skin of collision geometry on nodes whose own mesh was removed
+        self.colliderMeshes: Dict[int, Any] = {}
+        self.colliderSkins: Dict[int, Any] = {}
+        # Transform of the collision geometry node, which carries the
+        # dequantization transform of quantized collision meshes
+        self.colliderTransforms: Dict[int, Any] = {}
+
+    def patch(self, objects) -> int:
+        """Patches the document with data from `objects`, returning the
+        number of nodes which have been updated"""
+        # Match before removing the old physics data, which holds the IDs
+        matches = self._matchObjects(objects)
+        matchedObjects = {nodeIdx: obj for obj, nodeIdx in matches}
+        self._removePhysics()
+
+        exporter = glTF2ExportUserExtension(patching=True)
+        syntheticNodes = {}
+        for obj, nodeIdx in matches:
+            fileNode = self.nodes[nodeIdx]
+            synthetic = exporter._constructNode(
+                obj.name, Vector((0, 0, 0)), Quaternion(), self.export_settings
+            )
+            synthetic.mesh = fileNode.get("mesh", self.colliderMeshes.get(nodeIdx))
+            synthetic.skin = fileNode.get("skin", self.colliderSkins.get(nodeIdx))
+            syntheticNodes[nodeIdx] = synthetic
+            # References to the synthetic node become references to the file's
+            self.nodeIndices[id(synthetic)] = nodeIdx
+            exporter.gather_node_hook(synthetic, obj, self.export_settings)
+
+        scene = gltf2_io.Scene(extensions={}, extras=None, name="", nodes=[])
+        exporter.gather_scene_hook(scene, bpy.context.scene, self.export_settings)
+
+        numPatched = 0
+        for nodeIdx, synthetic in syntheticNodes.items():
+            fileNode = self.nodes[nodeIdx]
+            ext = synthetic.extensions.get(rigidBody_Extension_Name)
+            if ext == None:
+                continue
+            numPatched += 1
+            self._keepColliderMesh(ext, nodeIdx)
+            fileNode.setdefault("extensions", {})[rigidBody_Extension_Name] = (
+                self._convert(ext)
+            )
+            self._setExtras(fileNode, synthetic.extras)
+            if len(synthetic.children):
+                fileNode.setdefault("children", []).extend(
+                    self._convert(synthetic.children)
+                )
+            if synthetic.mesh == None:
+                # The exporter strips render meshes from non-renderable objects
+                fileNode.pop("mesh", None)
+                fileNode.pop("skin", None)
+            if matchedObjects[nodeIdx] in exporter.session.settledMatrices:
+                # Warm started bodies are written where the simulation left them
+                for key in ("translation", "rotation", "scale"):
+                    fileNode[key] = getattr(synthetic, key)
+                fileNode.pop("matrix", None)
+
+        scenes = self.gltf.get("scenes", [])
+        if len(scenes):
+            defaultScene = scenes[self.gltf.get("scene", 0)]
+            self._setExtras(defaultScene, scene.extras)
+            # The world anchor for joints to static bodies outside the file
+            if len(scene.nodes):
+                defaultScene.setdefault("nodes", []).extend(self._convert(scene.nodes))
+
+        # Any helper nodes which weren't reused are left empty and unreferenced
+        for nodeIdx in self.freeNodes:
+            self.nodes[nodeIdx] = {}
+
+        self._updateExtensionLists()
+        return numPatched
+
+    def _keepColliderMesh(self, ext, nodeIdx):
+        """Points newly built collision meshes back at the mesh already in the
+        document; patching doesn't add to the document's buffers"""
+        for key in ("collider", "trigger"):
+            geom = (ext.extension.get(key) or {}).get("geometry") or {}
+            geomNode = geom.get("node")
+            if isinstance(geomNode, gltf2_io.Node) and isinstance(
+                geomNode.mesh, gltf2_io.Mesh
+            ):
+                geomNode.mesh = self.colliderMeshes.get(
+                    nodeIdx, self.nodes[nodeIdx].get("mesh")
+                )
+                geomNode.translation, geomNode.scale = self.colliderTransforms.get(
+                    nodeIdx, (None, None)
+                )
+
+    def _matchObjects(self, objects):
+        """Pairs each object with physics with its node in the document,
+        preferring the stable ID written to the node's extras"""
+        byStableId = {}
+        byName = {}
+        for nodeIdx, node in enumerate(self.nodes):
+            extras = node.get("extras")
+            if isinstance(extras, dict):
+                stableId = extras.get(rigidBody_Extension_Name, {}).get("stableId")
+                if stableId:
+                    byStableId[stableId] = nodeIdx
+            if "name" in node:
+                byName.setdefault(node["name"], nodeIdx)
+
+        matches = []
+        matched = set()
+        for obj in objects:
+            if obj.rigid_body == None and obj.rigid_body_constraint == None:
+                continue
+            nodeIdx = byStableId.get(obj.khr_physics_extra_props.stable_id)
+            if nodeIdx == None or nodeIdx in matched:
+                nodeIdx = byName.get(obj.name)
+            if nodeIdx == None or nodeIdx in matched:
+                print(
+                    "%s no node found for object '%s'" % (progress_log_prefix, obj.name)
+                )
+                continue
+            matched.add(nodeIdx)
+            matches.append((obj, nodeIdx))
+        return matches
+
+    def _removePhysics(self):
+        """Strips all existing physics data from the document, remembering
+        which nodes were only there to hold physics data, so they can be
+        reused"""
+        helpers = set()
+        for nodeIdx, node in enumerate(self.nodes):
+            name = node.get("name", "")
+            if name in physics_helper_node_names or name.startswith(
+                static_batch_node_prefix
+            ):
+                helpers.add(nodeIdx)
+            ext = node.get("extensions", {}).pop(rigidBody_Extension_Name, None)
+            if ext == None:
+                continue
+            if not node["extensions"]:
+                del node["extensions"]
+            joint = ext.get("joint")
+            if joint and joint.get("connectedNode") != None:
+                helpers.add(joint["connectedNode"])
+            for key in ("collider", "trigger"):
+                geomNode = ext.get(key, {}).get("geometry", {}).get("node")
+                if geomNode != None:
+                    helpers.add(geomNode)
+                    if "mesh" in self.nodes[geomNode]:
+                        self.colliderMeshes[nodeIdx] = self.nodes[geomNode]["mesh"]
+                    if "skin" in self.nodes[geomNode]:
+                        self.colliderSkins[nodeIdx] = self.nodes[geomNode]["skin"]
+                    self.colliderTransforms[nodeIdx] = (
+                        self.nodes[geomNode].get("translation"),
+                        self.nodes[geomNode].get("scale"),
+                    )
+
+        # Extras written alongside the physics data refer to nodes by index,
+        # and are rewritten from the scene along with it
+        for item in self.nodes + self.gltf.get("scenes", []):
+            extras = item.get("extras")
+            if isinstance(extras, dict) and rigidBody_Extension_Name in extras:
+                del extras[rigidBody_Extension_Name]
+                if not extras:
+                    del item["extras"]
+
+        for node in self.nodes:
+            if "children" in node:
+                node["children"] = [c for c in node["children"] if c not in helpers]
+                if not node["children"]:
+                    del node["children"]
+        for scene in self.gltf.get("scenes", []):
+            if "nodes" in scene:
+                scene["nodes"] = [n for n in scene["nodes"] if n not in helpers]
+        self.freeNodes = sorted(helpers, reverse=True)
+
+        rootExts = self.gltf.get("extensions", {})
+        rootExts.pop(rigidBody_Extension_Name, None)
+        rootExts.pop(implicitShapes_Extension_Name, None)
+        for listName in ("extensionsUsed", "extensionsRequired"):
+            if listName in self.gltf:
+                self.gltf[listName] = [
+                    e
+                    for e in self.gltf[listName]
+                    if e not in (rigidBody_Extension_Name, implicitShapes_Extension_Name)
+                ]
+
+    def _setExtras(self, item, extras):
+        """Copies our extension's extras from the synthetic export, leaving
+        any other extras intact"""
+        if not isinstance(extras, dict) or rigidBody_Extension_Name not in extras:
+            return
+        if not isinstance(item.setdefault("extras", {}), dict):
+            return
+        item["extras"][rigidBody_Extension_Name] = self._convert(
+            extras[rigidBody_Extension_Name]
+        )
+
+    def _updateExtensionLists(self):
+        for listName, names in (
+            ("extensionsUsed", self.extensionsUsed),
+            ("extensionsRequired", self.extensionsRequired),
+        ):
+            existing = self.gltf.setdefault(listName, [])
+            existing.extend(sorted(n for n in names if n not in existing))
+            if not existing:
+                del self.gltf[listName]
+        if not self.gltf.get("extensions"):
+            self.gltf.pop("extensions", None)
+
+    def _convert(self, value):
+        """Converts the exporter's in-memory representation to JSON, moving
+        root-level data into the document and replacing references with
+        indices, in the same way as the glTF exporter does"""
+        if isinstance(value, ChildOfRootExtension):
+            return self._addRootItem(value)
+        if isinstance(value, BinaryData):
+            # Patching doesn't add to the document's buffers, so cooked
+            # collision data is dropped; a full export regenerates it
+            return None
+        if isinstance(value, Extension):
+            self.extensionsUsed.add(value.name)
+            if value.required:
+                self.extensionsRequired.add(value.name)
+            return self._convert(value.extension)
+        if isinstance(value, gltf2_io.Node):
+            return self._addNode(value)
+        if isinstance(value, dict):
+            result = {}
+            for k, v in value.items():
+                v = self._convert(v)
+                if v != None and v != {} and v != []:
+                    result[k] = v
+            return result
+        if isinstance(value, (list, tuple)):
+            return [self._convert(v) for v in value]
+        return value
+
+    def _addRootItem(self, value) -> int:
+        self.extensionsUsed.add(value.name)
+        item = self._convert(value.extension)
+        container = self.gltf.setdefault("extensions", {}).setdefault(value.name, {})
+        for p in value.path[:-1]:
+            container = container.setdefault(p, {})
+        items = container.setdefault(value.path[-1], [])
+
+        # Share identical items, as the exporter does
+        key = "%s/%s/%s" % (value.name, "/".join(value.path), json.dumps(item, sort_keys=True))
+        if key not in self.rootItemIndices:
+            self.rootItemIndices[key] = len(items)
+            items.append(item)
+        return self.rootItemIndices[key]
+
+    def _addNode(self, node) -> int:
+        if id(node) in self.nodeIndices:
+            return self.nodeIndices[id(node)]
+        if len(self.freeNodes):
+            nodeIdx = self.freeNodes.pop()
+        else:
+            nodeIdx = len(self.nodes)
+            self.nodes.append({})
+        self.nodeIndices[id(node)] = nodeIdx
+
+        self.nodes[nodeIdx] = self._convert(
+            {
+                "name": node.name,
+                "translation": node.translation,
+                "rotation": node.rotation,
+                "scale": node.scale,
+                "matrix": node.matrix,
+                "mesh": node.mesh,
+                "skin": node.skin,
+                "children": node.children,
+                "extensions": node.extensions,
+                "extras": node.extras,
+            }
+        )
+        return nodeIdx
+
+
+def patch_physics(filepath, export_settings, output_path=None) -> int:
+    """Rewrites the physics data in the .gltf/.glb file at `filepath` using the
+    current scene. Returns the number of nodes patched"""
+    output_path = output_path or filepath
+    tempPath = output_path + ".tmp"
+    glb = None
+    if filepath.lower().endswith(".glb"):
+        glb = GlbFile(filepath)
+        gltf = glb.json
+    else:
+        with open(filepath, "rb") as f:
+            gltf = json.load(f)
+
+    try:
+        patcher = PhysicsPatcher(gltf, export_settings)
+        numPatched = patcher.patch(bpy.context.scene.objects)
+        # The exporter's hooks record aborts rather than raising them
+        check_aborted()
+        if glb != None:
+            glb.write(tempPath, gltf)
+        else:
+            with open(tempPath, "w") as f:
+                json.dump(gltf, f, indent=2)
+    finally:
+        if glb != None:
+            glb.close()
+    os.replace(tempPath, output_path)
+    return numPatched
@@ -0,0 +1,199 @@
+import bpy
+import json
+import math
+import os
+from mathutils import Vector
+from typing import Dict, List, Tuple
+from ...blender.com.gltf2_blender_rigid_bodies_analysis import UnionFind
+from ...blender.com.gltf2_blender_rigid_bodies_audit import is_dynamic
+from ...blender.com.gltf2_blender_rigid_bodies_progress import check_aborted
+
+
+def world_aabb(obj) -> Tuple[Vector, Vector]:
+    corners = [obj.matrix_world @ Vector(c) for c in obj.bound_box]
+    lo = Vector([min(c[i] for c in corners) for i in range(3)])
+    hi = Vector([max(c[i] for c in corners) for i in range(3)])
+    return lo, hi
+
+
+def _compound_parent(obj):
+    cur = obj.parent
+    while cur:
+        if cur.rigid_body != None and cur.rigid_body.collision_shape == "COMPOUND":
+            return cur
+        cur = cur.parent
+    return None
+
+
+def physics_islands(objects) -> List[List[bpy.types.Object]]:
+    """Groups objects with physics into sets which must be kept together;
+    dynamic bodies connected by joints, with their joints, and compound
+    shapes with their body. As with simulation islands, static and kinematic
+    bodies don't join the islands of the bodies jointed to them; the joints
+    are exported attached to the world instead. Each island also contains
+    the descendants of its objects."""
+    islands = UnionFind()
+    for obj in objects:
+        if obj.rigid_body != None:
+            islands.find(obj.name)
+            compound = _compound_parent(obj)
+            if compound != None:
+                islands.union(compound.name, obj.name)
+        if obj.rigid_body_constraint != None:
+            islands.find(obj.name)
+            for body in (
+                obj.rigid_body_constraint.object1,
+                obj.rigid_body_constraint.object2,
+            ):
+                if is_dynamic(body):
+                    islands.union(obj.name, body.name)
+
+    members: Dict[str, set] = {}
+    for name in list(islands.parent):
+        obj = bpy.data.objects[name]
+        root = islands.find(name)
+        group = members.setdefault(root, set())
+        group.add(obj)
+        # Descendants with physics of their own belong to their own island
+        group.update(
+            c
+            for c in obj.children_recursive
+            if c.name not in islands.parent or islands.find(c.name) == root
+        )
+    # Sort, so cell contents don't depend on the order of the scene's objects
+    return [
+        sorted(group, key=lambda o: o.name)
+        for _, group in sorted(members.items())
+    ]
+
+
+def _union_aabb(boxes):
+    lo = Vector([min(b[0][i] for b in boxes) for i in range(3)])
+    hi = Vector([max(b[1][i] for b in boxes) for i in range(3)])
+    return lo, hi
+
+
+def plan_tiles(objects, cell_size: float) -> Dict[Tuple[int, int], dict]:
+    """Assigns each physics island to the grid cell (in the XY plane) holding
+    the center of its bounds. Keeping islands whole means joints between
+    dynamic bodies never cross between cells; their placement only depends
+    on the island's bounds."""
+    cells = {}
+    objectCells = {}
+    islands = physics_islands(objects)
+    for island in islands:
+        lo, hi = _union_aabb([world_aabb(o) for o in island])
+        center = (lo + hi) * 0.5
+        cell = (math.floor(center.x / cell_size), math.floor(center.y / cell_size))
+        tile = cells.setdefault(cell, {"objects": set(), "boxes": []})
+        tile["objects"].update(island)
+        tile["boxes"].append((lo, hi))
+        objectCells.update((o, cell) for o in island)
+
+    for (cx, cy), tile in cells.items():
+        contentLo, contentHi = _union_aabb(tile["boxes"])
+        tile["content"] = (contentLo, contentHi)
+        tile["bounds"] = (
+            Vector((cx * cell_size, cy * cell_size, contentLo.z)),
+            Vector(((cx + 1) * cell_size, (cy + 1) * cell_size, contentHi.z)),
+        )
+
+    # A cell depends on the cells its content reaches into, and vice versa,
+    # since bodies in both may interact
+    for cell, tile in cells.items():
+        tile["dependencies"] = set()
+    for cell, tile in cells.items():
+        lo, hi = tile["content"]
+        for other, otherTile in cells.items():
+            if other == cell:
+                continue
+            otherLo, otherHi = otherTile["bounds"]
+            if (
+                lo.x < otherHi.x
+                and hi.x > otherLo.x
+                and lo.y < otherHi.y
+                and hi.y > otherLo.y
+            ):
+                tile["dependencies"].add(other)
+                otherTile["dependencies"].add(cell)
+
+    # Joints to static bodies in other cells only hold if those are loaded
+    for island in islands:
+        cell = objectCells[island[0]]
+        for obj in island:
+            joint = obj.rigid_body_constraint
+            if joint == None:
+                continue
+            for body in (joint.object1, joint.object2):
+                other = objectCells.get(body)
+                if other != None and other != cell:
+                    cells[cell]["dependencies"].add(other)
+                    cells[other]["dependencies"].add(cell)
+    return cells
+
+
+def _bounds_to_json(bounds, yup):
+    lo, hi = bounds
+    if yup:
+        return {"min": [lo.x, lo.z, -hi.y], "max": [hi.x, hi.z, -lo.y]}
+    return {"min": list(lo), "max": list(hi)}
+
+
+def _cell_id(cell):
+    return "%i_%i" % cell
+
+
+def tile_export(
+    manifest_path, cell_size, gltf_settings, physics_only=True
+) -> dict:
+    """Exports the physics of the current scene as one glTF file per grid
+    cell, next to `manifest_path`, then writes a manifest describing the
+    cells to `manifest_path`"""
+    scene = bpy.context.scene
+    cells = plan_tiles(scene.objects, cell_size)
+    yup = gltf_settings.get("export_yup", True)
+    ext = ".gltf" if gltf_settings.get("export_format", "GLB") != "GLB" else ".glb"
+    base = os.path.splitext(os.path.basename(manifest_path))[0]
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+
+    props = scene.khr_physics_exporter_props
+    viewLayer = bpy.context.view_layer
+    oldPhysicsOnly = props.physics_only
+    oldSelection = [o for o in viewLayer.objects if o.select_get()]
+    oldActive = viewLayer.objects.active
+    manifest = {
+        "cellSize": cell_size,
+        "upAxis": "Y" if yup else "Z",
+        "cells": [],
+    }
+    try:
+        props.physics_only = physics_only
+        for cell in sorted(cells):
+            tile = cells[cell]
+            fileName = "%s_%s%s" % (base, _cell_id(cell), ext)
+            for o in viewLayer.objects:
+                o.select_set(o in tile["objects"] and o.visible_get())
+            filePath = os.path.join(directory, fileName)
+            bpy.ops.export_scene.gltf(
+                filepath=filePath, use_selection=True, **gltf_settings
+            )
+            check_aborted(filePath)
+            manifest["cells"].append(
+                {
+                    "id": _cell_id(cell),
+                    "cell": list(cell),
+                    "file": fileName,
+                    "bounds": _bounds_to_json(tile["bounds"], yup),
+                    "contentBounds": _bounds_to_json(tile["content"], yup),
+                    "dependencies": [_cell_id(c) for c in sorted(tile["dependencies"])],
+                }
+            )
+    finally:
+        props.physics_only = oldPhysicsOnly
+        for o in viewLayer.objects:
+            o.select_set(o in oldSelection)
+        viewLayer.objects.active = oldActive
+
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
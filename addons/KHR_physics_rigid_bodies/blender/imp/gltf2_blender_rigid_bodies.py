@@ -1,4 +1,5 @@
 import bpy
+from ...blender.com.gltf2_blender_rigid_bodies_progress import *
 from ...io.com.gltf2_io_implicit_shapes import *
 from ...io.com.gltf2_io_rigid_bodies import *
 from typing import cast
@@ -21,13 +22,22 @@ class ParentFixup:
         self.convex_hull = convex_hull
 
 
+class ImportSession:
+    """Holds all state for a single import. Created when an import starts and
+    released once the scene's nodes have been fixed up, so that repeated
+    imports don't keep references to objects from earlier files."""
+
+    def __init__(self):
+        self.isExt: Optional[ImplicitShapesGlTFExtension] = None
+        self.rbExt: Optional[RigidBodiesGlTFExtension] = None
+        # Additional mapping to hook up joints
+        self.vnode_to_blender: dict = {}
+        self.joints_to_fixup: list[JointFixup] = []
+        self.parents_to_fixup: list[ParentFixup] = []
+
+
 class glTF2ImportUserExtension:
-    isExt: Optional[ImplicitShapesGlTFExtension] = None
-    rbExt: Optional[RigidBodiesGlTFExtension] = None
-    # Additional mapping to hook up joints
-    vnode_to_blender: dict = {}
-    joints_to_fixup: list[JointFixup] = []
-    parents_to_fixup: list[ParentFixup] = []
+    session: Optional[ImportSession] = None
 
     def __init__(self):
         # We need to wait until we create the gltf2UserExtension to import the gltf2 modules
@@ -47,16 +57,15 @@ class glTF2ImportUserExtension:
         if not gltf.data.extensions:
             return
 
-        self.vnode_to_blender = {}
-        self.joints_to_fixup = []
-        self.parents_to_fixup = []
+        self.session = ImportSession()
+        reset_cancel()
 
         isExt = gltf.data.extensions.get(implicitShapes_Extension_Name)
         if isExt != None:
-            self.isExt = ImplicitShapesGlTFExtension.from_dict(isExt)
+            self.session.isExt = ImplicitShapesGlTFExtension.from_dict(isExt)
         rbExt = gltf.data.extensions.get(rigidBody_Extension_Name)
         if rbExt != None:
-            self.rbExt = RigidBodiesGlTFExtension.from_dict(rbExt)
+            self.session.rbExt = RigidBodiesGlTFExtension.from_dict(rbExt)
             try:
                 # We need to ensure the scene has a physics world;
                 # This is created automatically when we create a rigid body
@@ -75,21 +84,37 @@ class glTF2ImportUserExtension:
         return None
 
     def gather_import_scene_after_nodes_hook(self, gltf_scene, blender_scene, gltf):
-        if not self.properties.enabled:
+        if not self.properties.enabled or self.session == None:
             return
 
-        for fixup in self.joints_to_fixup:
+        try:
+            self._apply_fixups(gltf)
+            self._applySolverSettings(gltf_scene, blender_scene)
+        except PhysicsAbort as e:
+            record_abort(e)
+        finally:
+            # Nothing else needs the per-import state once nodes are fixed up
+            self.session = None
+
+    def _apply_fixups(self, gltf):
+        progress = ProgressReporter(
+            "fixups applied",
+            len(self.session.joints_to_fixup) + len(self.session.parents_to_fixup),
+        )
+        for fixup in self.session.joints_to_fixup:
+            progress.step()
             other_vnode = gltf.vnodes[fixup.connected_idx]
-            other = self.vnode_to_blender[other_vnode]
+            other = self.session.vnode_to_blender[other_vnode]
             body_a = self._find_parent_body(fixup.joint)
             body_b = self._find_parent_body(other)
 
             fixup.joint.rigid_body_constraint.object1 = body_a
             fixup.joint.rigid_body_constraint.object2 = body_b
 
-        for fixup in self.parents_to_fixup:
+        for fixup in self.session.parents_to_fixup:
+            progress.step()
             other_vnode = gltf.vnodes[fixup.child_idx]
-            other = self.vnode_to_blender[other_vnode]
+            other = self.session.vnode_to_blender[other_vnode]
             other.parent = fixup.parent_node
             self._add_rigid_body(other)
             if fixup.convex_hull:
@@ -97,6 +122,31 @@ class glTF2ImportUserExtension:
             else:
                 other.rigid_body.collision_shape = "MESH"
             other.khr_physics_extra_props.non_renderable = True
+        progress.end()
+
+    @staticmethod
+    def _applySolverSettings(gltf_scene, blender_scene):
+        """Restores the rigid body world's settings from the scene's extras"""
+        extras = gltf_scene.extras if gltf_scene != None else None
+        if not isinstance(extras, dict):
+            return
+        solver = extras.get(rigidBody_Extension_Name, {}).get("solver")
+        world = blender_scene.rigidbody_world
+        if not isinstance(solver, dict) or world == None:
+            return
+        if solver.get("substepsPerFrame") != None:
+            world.substeps_per_frame = solver["substepsPerFrame"]
+        if solver.get("solverIterations") != None:
+            world.solver_iterations = solver["solverIterations"]
+
+    @staticmethod
+    def _applyDeactivation(rb, deactivation: dict):
+        if deactivation.get("enabled") != None:
+            rb.use_deactivation = deactivation["enabled"]
+        if deactivation.get("linearVelocity") != None:
+            rb.deactivate_linear_velocity = deactivation["linearVelocity"]
+        if deactivation.get("angularVelocity") != None:
+            rb.deactivate_angular_velocity = deactivation["angularVelocity"]
 
     def gather_import_node_after_hook(self, vnode, gltf_node, blender_object, gltf):
         if not self.properties.enabled:
@@ -104,6 +154,11 @@ class glTF2ImportUserExtension:
 
         try:
             self.gather_import_node_after_hook_2(vnode, gltf_node, blender_object, gltf)
+        except PhysicsAbort as e:
+            # The glTF importer would only log the error and carry on; drop
+            # the session, so no more physics is imported
+            record_abort(e)
+            self.session = None
         except:
             import traceback
 
@@ -113,10 +168,12 @@ class glTF2ImportUserExtension:
         if not self.properties.enabled:
             return
 
-        if self.rbExt == None:
+        if self.session == None or self.session.rbExt == None:
             return
 
-        self.vnode_to_blender[vnode] = blender_object
+        check_cancelled()
+
+        self.session.vnode_to_blender[vnode] = blender_object
 
         try:
             ext = gltf_node.extensions[rigidBody_Extension_Name]
@@ -143,10 +200,10 @@ class glTF2ImportUserExtension:
                 colliderIdx = nodeExt.collider.geometry.shape
 
             if colliderIdx != None:
-                if self.isExt == None:
+                if self.session.isExt == None:
                     # Shouldn't happen - referencing implicit shapes, but not in file
                     return
-                shape = self.isExt.shapes[cast(int, colliderIdx)]
+                shape = self.session.isExt.shapes[cast(int, colliderIdx)]
                 if shape.sphere != None:
                     blender_object.rigid_body.collision_shape = "SPHERE"
                 if shape.box != None:
@@ -185,14 +242,14 @@ class glTF2ImportUserExtension:
             if meshNodeIdx != None:
                 # todo: Handle the common case where the referenced node has the exact same mesh,
                 # transform, etc. - in this case, we can just use the existing node
-                self.parents_to_fixup.append(
+                self.session.parents_to_fixup.append(
                     ParentFixup(blender_object, meshNodeIdx, convex_hull)
                 )
 
             # todo.eoin Collision systems
 
             if nodeExt.collider != None and nodeExt.collider.physics_material != None:
-                mat = self.rbExt.materials[cast(int, nodeExt.collider.physics_material)]
+                mat = self.session.rbExt.materials[cast(int, nodeExt.collider.physics_material)]
                 if mat.dynamic_friction != None:
                     blender_object.rigid_body.friction = mat.dynamic_friction
                 if mat.restitution != None:
@@ -239,6 +296,10 @@ class glTF2ImportUserExtension:
                 blender_object.khr_physics_extra_props.gravity_factor = (
                     nodeExt.motion.gravity_factor
                 )
+            if isinstance(nodeExt.motion.extras, dict):
+                deactivation = nodeExt.motion.extras.get("deactivation")
+                if isinstance(deactivation, dict):
+                    self._applyDeactivation(blender_object.rigid_body, deactivation)
 
         if nodeExt.joint:
             # <todo.eoin Same as adding rigid body; might be a cleaner way.
@@ -247,7 +308,7 @@ class glTF2ImportUserExtension:
             bpy.ops.rigidbody.constraint_add()
             bpy.context.view_layer.objects.active = prev_active_objects
 
-            self.joints_to_fixup.append(
+            self.session.joints_to_fixup.append(
                 JointFixup(blender_object, nodeExt.joint.connected_node)
             )
 
@@ -258,9 +319,14 @@ class glTF2ImportUserExtension:
                 blender_object.rigid_body_constraint.disable_collisions = (
                     not nodeExt.joint.enable_collision
                 )
+            if isinstance(nodeExt.joint.extras, dict):
+                iterations = nodeExt.joint.extras.get("solverIterations")
+                if iterations != None:
+                    joint.use_override_solver_iterations = True
+                    joint.solver_iterations = iterations
 
             assert nodeExt.joint.joint != None
-            jointDesc = self.rbExt.joints[cast(int, nodeExt.joint.joint)]
+            jointDesc = self.session.rbExt.joints[cast(int, nodeExt.joint.joint)]
             if jointDesc.drives:
                 for drive in jointDesc.drives:
                     isLinear = drive.type == "linear"
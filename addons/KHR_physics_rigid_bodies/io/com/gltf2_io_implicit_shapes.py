@@ -202,10 +202,13 @@ class Shape:
 
 
 class ImplicitShapesGlTFExtension:
-    shapes: list[Shape] = []
+    shapes: list[Shape]
     extensions: Optional[Dict[str, Any]] = None
     extras: Any = None
 
+    def __init__(self):
+        self.shapes = []
+
     def should_export(self):
         return len(self.shapes) > 0
 
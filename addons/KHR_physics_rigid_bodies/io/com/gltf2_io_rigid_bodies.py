@@ -618,12 +618,17 @@ class RigidBodiesNodeExtension:
 
 
 class RigidBodiesGlTFExtension:
-    materials: list[Material] = []
-    joints: list[JointDescription] = []
-    collision_filters: list[CollisionFilter] = []
+    materials: list[Material]
+    joints: list[JointDescription]
+    collision_filters: list[CollisionFilter]
     extensions: Optional[Dict[str, Any]] = None
     extras: Any = None
 
+    def __init__(self):
+        self.materials = []
+        self.joints = []
+        self.collision_filters = []
+
     def should_export(self):
         return (
             len(self.materials) > 0
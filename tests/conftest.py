@@ -0,0 +1,301 @@
+"""Lets the addon's modules be imported outside of Blender.
+
+Where bpy, mathutils or the glTF addon aren't installed (i.e. when running
+under a plain Python), minimal stand-ins are registered for the parts of them
+which the tested modules use. The addon package itself is registered without
+running its __init__, which would register its UI with Blender.
+"""
+
+import os
+import sys
+import types
+from types import SimpleNamespace
+
+addon_dir = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "addons",
+    "KHR_physics_rigid_bodies",
+)
+addon_package = "KHR_physics_rigid_bodies"
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+class FakeObject:
+    """Stand-in for a bpy.types.Object, with only the physics properties"""
+
+    def __init__(self, name):
+        self.name = name
+        self.parent = None
+        self.rigid_body = None
+        self.rigid_body_constraint = None
+        self.khr_physics_extra_props = SimpleNamespace()
+        self.khr_physics_extra_constraint_props = SimpleNamespace()
+
+
+class ExporterProps(SimpleNamespace):
+    """Stand-in for the scene's exporter properties, with every optional
+    export step turned off"""
+
+    # Where the batch exporter looks for the addon's package
+    __module__ = addon_package + ".blender.com.gltf2_blender_rigid_bodies_ui"
+
+    def __init__(self):
+        super().__init__(
+            enabled=True,
+            physics_only=False,
+            bake_simulation=False,
+            warm_start=False,
+            write_solver_settings=False,
+            detect_overlaps=False,
+            overlap_tolerance=0.0,
+            fail_on_overlap=False,
+            audit_joints=False,
+            batch_static_colliders=False,
+            write_broadphase_hints=False,
+            write_simulation_islands=False,
+            write_articulations=False,
+            flag_ccd=False,
+            reparent_bones=False,
+            use_cache=False,
+            verbose_log=False,
+        )
+
+
+def _active():
+    return sys.modules["bpy"].context.view_layer.objects.active
+
+
+def _object_add():
+    _active().rigid_body = SimpleNamespace(enabled=True, collision_shape="CONVEX_HULL")
+
+
+def _constraint_add():
+    _active().rigid_body_constraint = SimpleNamespace(enabled=True, type="FIXED")
+
+
+class _Types(SimpleNamespace):
+    """bpy.types, where types other than those given are empty classes, for
+    use in annotations and isinstance() checks"""
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        setattr(self, name, type(name, (), {}))
+        return getattr(self, name)
+
+
+def _install_bpy():
+    context = SimpleNamespace(
+        scene=SimpleNamespace(
+            khr_physics_exporter_props=SimpleNamespace(enabled=True),
+            rigidbody_world=None,
+        ),
+        view_layer=SimpleNamespace(objects=SimpleNamespace(active=None)),
+        window_manager=None,
+    )
+    ops = SimpleNamespace(
+        rigidbody=SimpleNamespace(
+            world_add=lambda: None,
+            object_add=_object_add,
+            constraint_add=_constraint_add,
+        )
+    )
+    handlers = _module("bpy.app.handlers", persistent=lambda f: f)
+    app = _module("bpy.app", handlers=handlers)
+    _module(
+        "bpy",
+        app=app,
+        context=context,
+        ops=ops,
+        types=_Types(Object=FakeObject, Node=FakeObject),
+        is_stand_in=True,
+    )
+
+
+class _Vector(tuple):
+    def __new__(cls, values=(0.0, 0.0, 0.0)):
+        return super().__new__(cls, values)
+
+    def to_tuple(self):
+        return tuple(self)
+
+    @property
+    def length_squared(self):
+        return sum(x * x for x in self)
+
+
+class _Quaternion(_Vector):
+    def __new__(cls, values=(1.0, 0.0, 0.0, 0.0)):
+        return super().__new__(cls, values)
+
+    w, x, y, z = (property(lambda self, i=i: self[i]) for i in range(4))
+
+
+def _install_mathutils():
+    _module("mathutils", Vector=_Vector, Quaternion=_Quaternion, Matrix=object, Euler=object)
+
+
+# These mirror the conversion helpers of io_scene_gltf2.io.com.gltf2_io
+
+
+def from_int(x):
+    assert isinstance(x, int) and not isinstance(x, bool)
+    return x
+
+
+def from_float(x):
+    assert isinstance(x, (float, int)) and not isinstance(x, bool)
+    return float(x)
+
+
+def from_str(x):
+    assert isinstance(x, str)
+    return x
+
+
+def from_bool(x):
+    assert isinstance(x, bool)
+    return x
+
+
+def from_none(x):
+    assert x is None
+    return x
+
+
+def from_list(f, x):
+    assert isinstance(x, list)
+    return [f(y) for y in x]
+
+
+def from_dict(f, x):
+    assert isinstance(x, dict)
+    return {k: f(v) for (k, v) in x.items()}
+
+
+def from_union(fs, x):
+    for f in fs:
+        try:
+            return f(x)
+        except Exception:
+            pass
+    assert False
+
+
+def to_class(c, x):
+    assert isinstance(x, c)
+    return x.to_dict()
+
+
+def from_extension(x):
+    return x
+
+
+def from_extra(x):
+    return x
+
+
+class Extension:
+    def __init__(self, name, extension, required=True):
+        self.name = name
+        self.extension = extension
+        self.required = required
+
+
+class ChildOfRootExtension(Extension):
+    def __init__(self, path, required=True, **kwargs):
+        super().__init__(required=required, **kwargs)
+        self.path = path
+
+
+class _GltfProperty:
+    """Stand-in for the glTF exporter's property classes, which take their
+    fields as keyword arguments"""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+_gltf_classes = (
+    "Accessor",
+    "Animation",
+    "AnimationChannel",
+    "AnimationChannelTarget",
+    "AnimationSampler",
+    "Mesh",
+    "MeshPrimitive",
+    "Node",
+    "Scene",
+)
+
+
+def _install_gltf():
+    gltf2_io = _module(
+        "io_scene_gltf2.io.com.gltf2_io",
+        from_int=from_int,
+        from_float=from_float,
+        from_str=from_str,
+        from_bool=from_bool,
+        from_none=from_none,
+        from_list=from_list,
+        from_dict=from_dict,
+        from_union=from_union,
+        to_class=to_class,
+        from_extension=from_extension,
+        from_extra=from_extra,
+        **{name: type(name, (_GltfProperty,), {}) for name in _gltf_classes},
+    )
+    extensions = _module(
+        "io_scene_gltf2.io.com.gltf2_io_extensions",
+        Extension=Extension,
+        ChildOfRootExtension=ChildOfRootExtension,
+    )
+    constants = _module("io_scene_gltf2.io.com.gltf2_io_constants")
+    com = _module(
+        "io_scene_gltf2.io.com",
+        gltf2_io=gltf2_io,
+        gltf2_io_extensions=extensions,
+        gltf2_io_constants=constants,
+    )
+    binary_data = _module(
+        "io_scene_gltf2.io.exp.gltf2_io_binary_data",
+        BinaryData=type("BinaryData", (), {}),
+    )
+    exp = _module("io_scene_gltf2.io.exp", gltf2_io_binary_data=binary_data)
+    io = _module("io_scene_gltf2.io", com=com, exp=exp)
+
+    # The exporter imports these private helpers by name
+    nodes = _module("io_scene_gltf2.blender.exp.nodes")
+    for name in ("scale", "rotation", "location"):
+        setattr(nodes, "__convert_swizzle_" + name, lambda v, export_settings: v)
+    blender = _module(
+        "io_scene_gltf2.blender",
+        exp=_module("io_scene_gltf2.blender.exp", nodes=nodes),
+    )
+    _module("io_scene_gltf2", io=io, blender=blender)
+
+
+def _install_addon_package():
+    package = types.ModuleType(addon_package)
+    package.__path__ = [addon_dir]
+    sys.modules[addon_package] = package
+
+
+for name, install in (
+    ("bpy", _install_bpy),
+    ("mathutils", _install_mathutils),
+    ("io_scene_gltf2", _install_gltf),
+):
+    try:
+        __import__(name)
+    except ImportError:
+        install()
+
+if addon_package not in sys.modules:
+    _install_addon_package()
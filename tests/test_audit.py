@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FakeObject
+from KHR_physics_rigid_bodies.blender.com.gltf2_blender_rigid_bodies_audit import (
+    audit_joints,
+)
+
+
+def body(name, mass=1.0):
+    obj = FakeObject(name)
+    obj.rigid_body = SimpleNamespace(
+        enabled=True, type="ACTIVE", kinematic=False, mass=mass
+    )
+    return obj
+
+
+def fixed_joint(name, a, b, iterations=None):
+    obj = FakeObject(name)
+    obj.rigid_body_constraint = SimpleNamespace(
+        enabled=True,
+        type="FIXED",
+        object1=a,
+        object2=b,
+        use_override_solver_iterations=iterations != None,
+        solver_iterations=iterations or 10,
+    )
+    return obj
+
+
+def test_island_cost_uses_world_iterations():
+    a, b, c = body("a"), body("b"), body("c")
+    islands, findings = audit_joints(
+        [fixed_joint("ab", a, b), fixed_joint("bc", b, c)], 10, 100.0, 1000.0
+    )
+    assert len(islands) == 1
+    assert islands[0].axes == 12
+    assert islands[0].cost == pytest.approx(120)
+    assert findings == []
+
+
+def test_island_cost_uses_joint_override():
+    a, b, c = body("a"), body("b"), body("c")
+    joints = [fixed_joint("ab", a, b, iterations=100), fixed_joint("bc", b, c)]
+    islands, findings = audit_joints(joints, 10, 100.0, 500.0)
+    assert islands[0].cost == pytest.approx(6 * 100 + 6 * 10)
+    assert [f.kind for f in findings] == ["ISLAND_COST"]
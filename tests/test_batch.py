@@ -0,0 +1,85 @@
+import json
+import os
+import sys
+
+import pytest
+
+from conftest import addon_dir
+
+bpy = pytest.importorskip("bpy")
+if not getattr(bpy, "is_stand_in", False):
+    pytest.skip("needs the stand-in bpy from conftest.py", allow_module_level=True)
+
+sys.path.insert(0, os.path.join(addon_dir, "blender", "exp"))
+import gltf2_blender_rigid_bodies_batch as batch
+
+
+class FakeWorker:
+    """Stands in for a worker Blender process, which has already exited
+    having written `results` to its results file"""
+
+    results = None
+    returncode = 0
+
+    def __init__(self, args):
+        with open(args[args.index("--worker") + 1]) as f:
+            jobs = json.load(f)["jobs"]
+        results = self.results(jobs)
+        if results != None:
+            with open(args[args.index("--results") + 1], "w") as f:
+                f.write(results)
+
+    def wait(self):
+        return self.returncode
+
+
+def manifest(count):
+    return {
+        "jobs": [
+            {"input": "%i.blend" % i, "output": "%i.glb" % i} for i in range(count)
+        ]
+    }
+
+
+def completed(jobs):
+    return json.dumps(
+        [dict(job, success=True, seconds=1.0, size=10) for job in jobs]
+    )
+
+
+def test_pool_collects_results(monkeypatch):
+    monkeypatch.setattr(bpy.app, "binary_path", "blender", raising=False)
+    monkeypatch.setattr(FakeWorker, "results", staticmethod(completed))
+    monkeypatch.setattr(batch.subprocess, "Popen", FakeWorker)
+    results = batch.run_pool(manifest(4), 2, None)
+    assert sorted(r["input"] for r in results) == ["%i.blend" % i for i in range(4)]
+    assert all(r["success"] for r in results)
+
+
+def test_pool_survives_partial_results(monkeypatch):
+    # A worker killed while writing its results leaves them cut short
+    monkeypatch.setattr(bpy.app, "binary_path", "blender", raising=False)
+    monkeypatch.setattr(
+        FakeWorker, "results", staticmethod(lambda jobs: completed(jobs)[:20])
+    )
+    monkeypatch.setattr(FakeWorker, "returncode", -9)
+    monkeypatch.setattr(batch.subprocess, "Popen", FakeWorker)
+    results = batch.run_pool(manifest(3), 1, None)
+    assert len(results) == 3
+    assert not any(r["success"] for r in results)
+    assert results[0]["error"] == "Worker exited with code -9"
+
+
+def test_worker_replaces_results(monkeypatch, tmp_path):
+    jobs_path = tmp_path / "jobs.json"
+    jobs_path.write_text(json.dumps(manifest(2)))
+    results_path = tmp_path / "results.json"
+    monkeypatch.setattr(batch, "ensure_addon_enabled", lambda m: None)
+    monkeypatch.setattr(
+        batch,
+        "export_job",
+        lambda job, settings: dict(job, success=True, seconds=1.0, size=10),
+    )
+    batch.run_worker(str(jobs_path), str(results_path), None)
+    assert len(json.loads(results_path.read_text())) == 2
+    assert sorted(os.listdir(tmp_path)) == ["jobs.json", "results.json"]
@@ -0,0 +1,197 @@
+import os
+import socket
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import ExporterProps, addon_dir
+
+bpy = pytest.importorskip("bpy")
+if not getattr(bpy, "is_stand_in", False):
+    pytest.skip("needs the stand-in bpy from conftest.py", allow_module_level=True)
+
+sys.path.insert(0, os.path.join(addon_dir, "blender", "exp"))
+import gltf2_blender_rigid_bodies_client as client_module
+import gltf2_blender_rigid_bodies_daemon as daemon_module
+
+
+class StubBlender:
+    """Replaces the Blender operators which the batch exporter calls,
+    recording the files opened and exported"""
+
+    def __init__(self):
+        self.opened = []
+        self.exports = []
+        self.fail = False
+
+    def open_mainfile(self, filepath, load_ui):
+        self.opened.append(filepath)
+        bpy.data.filepath = filepath
+
+    def gltf(self, filepath, **settings):
+        if self.fail:
+            raise RuntimeError("Export failed")
+        self.exports.append((filepath, settings))
+        with open(filepath, "wb") as f:
+            f.write(bytes(1234))
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    stub = StubBlender()
+    monkeypatch.setattr(daemon_module.batch, "ensure_addon_enabled", lambda m: None)
+    monkeypatch.setattr(bpy.context.scene, "khr_physics_exporter_props", ExporterProps())
+    monkeypatch.setattr(bpy, "data", SimpleNamespace(filepath=""), raising=False)
+    monkeypatch.setattr(bpy.ops, "wm", stub, raising=False)
+    monkeypatch.setattr(bpy.ops, "export_scene", stub, raising=False)
+    return stub
+
+
+@pytest.fixture
+def blend_file(tmp_path):
+    path = tmp_path / "scene.blend"
+    path.write_bytes(b"BLENDER")
+    return str(path)
+
+
+@pytest.fixture
+def server(exporter):
+    """A daemon serving on a free localhost port, in a background thread"""
+    daemon = daemon_module.ExportDaemon()
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    thread = threading.Thread(target=daemon.serve, args=(listener,), daemon=True)
+    thread.start()
+    yield listener.getsockname()[1], thread
+    if thread.is_alive():
+        with client_module.ExportClient(port=listener.getsockname()[1]) as c:
+            c.shutdown()
+    thread.join(5)
+    listener.close()
+
+
+def test_handle_ops(exporter):
+    daemon = daemon_module.ExportDaemon()
+    assert daemon.handle({"op": "ping"}) == {"status": "ok"}
+    response = daemon.handle({"op": "frobnicate"})
+    assert response["status"] == "error"
+    assert "frobnicate" in response["error"]
+    assert daemon.running
+    assert daemon.handle({"op": "shutdown"}) == {"status": "ok"}
+    assert not daemon.running
+
+
+def test_handle_export_reuses_open_file(exporter, blend_file, tmp_path):
+    daemon = daemon_module.ExportDaemon()
+    output = str(tmp_path / "a.glb")
+    request = {
+        "op": "export",
+        "input": blend_file,
+        "output": output,
+        "settings": {"reparent_bones": True, "gltf": {"export_format": "GLB"}},
+    }
+    props = bpy.context.scene.khr_physics_exporter_props
+
+    response = daemon.handle(request)
+    assert response["status"] == "ok", response
+    assert response["output"] == output
+    assert response["size"] == 1234
+    assert props.reparent_bones
+    assert exporter.exports[-1] == (output, {"export_format": "GLB"})
+    assert len(exporter.opened) == 1
+
+    # Same file and settings; the open file is exported again
+    daemon.handle(request)
+    assert len(exporter.opened) == 1
+
+    # Different settings reload the file, so none are left over
+    yup = {"reparent_bones": True, "gltf": {"export_yup": False}}
+    daemon.handle(dict(request, settings=yup))
+    assert len(exporter.opened) == 2
+    assert exporter.exports[-1] == (output, {"export_yup": False})
+
+    # As does a modified file
+    os.utime(blend_file, (0, 0))
+    daemon.handle(dict(request, settings=yup))
+    assert len(exporter.opened) == 3
+    assert len(exporter.exports) == 4
+
+
+def test_handle_export_errors(exporter, blend_file, tmp_path):
+    daemon = daemon_module.ExportDaemon()
+    missing = {"op": "export", "input": str(tmp_path / "missing.blend"), "output": "a.glb"}
+    response = daemon.handle(missing)
+    assert response["status"] == "error"
+    assert exporter.opened == []
+
+    output = str(tmp_path / "a.glb")
+    unknown = {"op": "export", "input": blend_file, "output": output}
+    response = daemon.handle(dict(unknown, settings={"no_such_setting": 1}))
+    assert response["status"] == "error"
+    assert "no_such_setting" in response["error"]
+
+    request = {"op": "export", "input": blend_file, "output": output, "settings": {}}
+    exporter.fail = True
+    response = daemon.handle(request)
+    assert response["status"] == "error"
+    assert response["error"] == "RuntimeError: Export failed"
+    assert "size" not in response
+    # A failed export may have left the file half modified, so it's reloaded
+    exporter.fail = False
+    opened = len(exporter.opened)
+    assert daemon.handle(request)["status"] == "ok"
+    assert len(exporter.opened) == opened + 1
+
+
+def test_client_protocol(server, exporter, blend_file, tmp_path):
+    port, thread = server
+    output = str(tmp_path / "out.glb")
+    props = bpy.context.scene.khr_physics_exporter_props
+    with client_module.ExportClient(port=port, timeout=5) as c:
+        assert c.ping()
+        response = c.export(blend_file, output, {"flag_ccd": True})
+        assert response["status"] == "ok"
+        assert response["size"] == 1234
+        assert exporter.opened == [blend_file]
+        assert exporter.exports[-1] == (output, {})
+        assert props.flag_ccd
+
+        exporter.fail = True
+        with pytest.raises(client_module.ExportError, match="Export failed"):
+            c.export(blend_file, output)
+
+        # Malformed requests get an error, and the connection stays usable
+        c.stream.write(b"not json\n\n")
+        c.stream.flush()
+        assert b'"status": "error"' in c.stream.readline()
+        assert c.ping()
+
+    # A client which disconnects without reading its response doesn't stop
+    # the daemon
+    with client_module.ExportClient(port=port, timeout=5) as c:
+        c.stream.write(b'{"op": "ping"}\n' * 1000)
+        c.stream.flush()
+
+    # Each connection is served in turn
+    with client_module.ExportClient(port=port, timeout=5) as c:
+        assert c.ping()
+        assert c.shutdown() == {"status": "ok"}
+        # The daemon closes the connection once it has replied
+        with pytest.raises((client_module.ExportError, OSError)):
+            c.ping()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_client_main(server, exporter, blend_file, tmp_path, capsys):
+    port, _ = server
+    output = str(tmp_path / "out.glb")
+    assert client_module.main(["--port", str(port), "ping"]) == 0
+    assert client_module.main(["--port", str(port), "export", blend_file, output]) == 0
+    assert '"size": 1234' in capsys.readouterr().out
+    exporter.fail = True
+    assert client_module.main(["--port", str(port), "export", blend_file, output]) == 1
+    assert "Export failed" in capsys.readouterr().out
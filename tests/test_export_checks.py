@@ -0,0 +1,132 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip("bpy")
+if not getattr(bpy, "is_stand_in", False):
+    pytest.skip("needs the stand-in bpy from conftest.py", allow_module_level=True)
+
+from conftest import ExporterProps, FakeObject, addon_dir
+from KHR_physics_rigid_bodies.blender.exp.gltf2_blender_rigid_bodies import (
+    ColliderRecord,
+    glTF2ExportUserExtension,
+)
+from io_scene_gltf2.io.com import gltf2_io
+
+sys.path.insert(0, os.path.join(addon_dir, "blender", "exp"))
+import gltf2_blender_rigid_bodies_batch as batch
+
+
+def sphere_collider(name, center, radius):
+    obj = FakeObject(name)
+    obj.rigid_body = SimpleNamespace(
+        type="ACTIVE",
+        enabled=True,
+        kinematic=False,
+        collision_collections=[True] + [False] * 19,
+    )
+    obj.khr_physics_extra_props.is_trigger = False
+    center = np.array(center, dtype=float)
+    return ColliderRecord(
+        obj, obj, center - radius, center + radius, ("sphere", center, radius)
+    )
+
+
+class GltfExporter:
+    """Runs the physics hooks the way the glTF exporter does, which logs any
+    exception they raise and carries on, then writes the file regardless"""
+
+    def __init__(self):
+        self.colliders = []
+
+    def gltf(self, filepath, **settings):
+        extension = glTF2ExportUserExtension()
+        extension.session.colliders = self.colliders
+        scene = gltf2_io.Scene(name="", nodes=[], extensions={}, extras=None)
+        plan = SimpleNamespace(extensions=None)
+        for hook, args in (
+            ("gather_scene_hook", (scene, bpy.context.scene, {})),
+            ("gather_gltf_extensions_hook", (plan, {})),
+        ):
+            try:
+                getattr(extension, hook)(*args)
+            except Exception as e:
+                print("Extension hook %s fails: %s" % (hook, e))
+        with open(filepath, "wb") as f:
+            f.write(b"glTF")
+
+
+@pytest.fixture
+def exporter(monkeypatch, tmp_path):
+    blend = tmp_path / "scene.blend"
+    blend.write_bytes(b"BLENDER")
+    gltf = GltfExporter()
+    monkeypatch.setattr(bpy.context.scene, "khr_physics_exporter_props", ExporterProps())
+    monkeypatch.setattr(bpy, "data", SimpleNamespace(filepath=str(blend)), raising=False)
+    monkeypatch.setattr(bpy.ops, "export_scene", gltf, raising=False)
+    return gltf
+
+
+def export(tmp_path, settings):
+    job = {"input": str(tmp_path / "scene.blend"), "output": str(tmp_path / "a.glb")}
+    return batch.export_job(job, settings, reopen=False)
+
+
+overlap_settings = {"detect_overlaps": True, "fail_on_overlap": True}
+
+
+def test_overlap_fails_export(exporter, tmp_path):
+    exporter.colliders = [
+        sphere_collider("a", (0, 0, 0), 1.0),
+        sphere_collider("b", (1, 0, 0), 1.0),
+    ]
+    result = export(tmp_path, overlap_settings)
+    assert not result["success"]
+    assert result["error"].startswith("ExportValidationError")
+    # The file the glTF exporter wrote anyway is removed
+    assert not os.path.exists(result["output"])
+
+
+def test_overlap_without_fail_exports(exporter, tmp_path):
+    exporter.colliders = [
+        sphere_collider("a", (0, 0, 0), 1.0),
+        sphere_collider("b", (1, 0, 0), 1.0),
+    ]
+    result = export(tmp_path, {"detect_overlaps": True})
+    assert result["success"], result.get("error")
+    assert result["size"] == 4
+
+
+def test_separate_colliders_export(exporter, tmp_path):
+    exporter.colliders = [
+        sphere_collider("a", (0, 0, 0), 1.0),
+        sphere_collider("b", (3, 0, 0), 1.0),
+    ]
+    result = export(tmp_path, overlap_settings)
+    assert result["success"], result.get("error")
+    # A failed export doesn't leave its abort behind for the next one
+    exporter.colliders.append(sphere_collider("c", (3.5, 0, 0), 1.0))
+    assert not export(tmp_path, overlap_settings)["success"]
+    exporter.colliders.pop()
+    assert export(tmp_path, overlap_settings)["success"]
+
+
+def test_failed_patch_fails_job(exporter, monkeypatch, tmp_path):
+    (tmp_path / "a.glb").write_bytes(b"glTF")
+    status = {"CANCELLED"}
+    operators = SimpleNamespace(patch_physics=lambda **kwargs: status)
+    monkeypatch.setattr(bpy.ops, "khr_physics_rigid_bodies", operators, raising=False)
+    job = {
+        "input": str(tmp_path / "scene.blend"),
+        "output": str(tmp_path / "a.glb"),
+        "mode": "patch",
+    }
+    result = batch.export_job(job, {}, reopen=False)
+    assert not result["success"]
+    assert "Unable to patch" in result["error"]
+
+    status = {"FINISHED"}
+    assert batch.export_job(job, {}, reopen=False)["success"]
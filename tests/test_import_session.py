@@ -0,0 +1,144 @@
+import gc
+import weakref
+from types import SimpleNamespace
+
+import pytest
+
+bpy = pytest.importorskip("bpy")
+if not getattr(bpy, "is_stand_in", False):
+    pytest.skip("needs the stand-in bpy from conftest.py", allow_module_level=True)
+
+from conftest import FakeObject
+from KHR_physics_rigid_bodies.blender.imp.gltf2_blender_rigid_bodies import (
+    ImportSession,
+    glTF2ImportUserExtension,
+)
+
+import_cycles = 500
+
+# Two bodies joined by a fixed joint, and a body using a child mesh node as
+# its convex hull, so that every kind of fixup is exercised
+document = {
+    "extensions": {
+        "KHR_implicit_shapes": {
+            "shapes": [
+                {"type": "box", "box": {"size": [1, 2, 3]}},
+                {"type": "sphere", "sphere": {"radius": 0.5}},
+            ]
+        },
+        "KHR_physics_rigid_bodies": {
+            "physicsMaterials": [{"dynamicFriction": 0.5, "restitution": 0.1}],
+            "physicsJoints": [
+                {"limits": [{"linearAxes": [0, 1, 2], "min": 0, "max": 0}]}
+            ],
+        },
+    },
+    "nodes": [
+        {
+            "name": "bodyA",
+            "extensions": {
+                "KHR_physics_rigid_bodies": {
+                    "motion": {"mass": 2.0},
+                    "collider": {"geometry": {"shape": 0}, "physicsMaterial": 0},
+                }
+            },
+        },
+        {
+            "name": "bodyB",
+            "extensions": {
+                "KHR_physics_rigid_bodies": {
+                    "motion": {"mass": 1.0},
+                    "collider": {"geometry": {"shape": 1}},
+                }
+            },
+        },
+        {
+            "name": "joint",
+            "extensions": {
+                "KHR_physics_rigid_bodies": {"joint": {"connectedNode": 1, "joint": 0}}
+            },
+        },
+        {
+            "name": "hull",
+            "extensions": {
+                "KHR_physics_rigid_bodies": {
+                    "collider": {"geometry": {"node": 4, "convexHull": True}}
+                }
+            },
+        },
+        {"name": "hullMesh"},
+    ],
+}
+
+# Parent of each node in the document
+parents = {2: 0, 4: 3}
+
+
+class VNode:
+    """Stand-in for the glTF importer's vnodes, which are hashable"""
+
+    def __init__(self, index):
+        self.index = index
+
+
+class ImportedGltf:
+    """Stand-in for the glTF importer's state for one file"""
+
+    def __init__(self):
+        self.data = SimpleNamespace(extensions=document["extensions"])
+        self.vnodes = [VNode(i) for i in range(len(document["nodes"]))]
+
+
+def import_document(extension):
+    """Runs the importer's hooks as the glTF importer would, returning the
+    per-import objects, which shouldn't outlive the import"""
+    gltf = ImportedGltf()
+    extension.gather_import_gltf_before_hook(gltf)
+    session = extension.session
+
+    objects = []
+    for nodeIdx, node in enumerate(document["nodes"]):
+        obj = FakeObject(node["name"])
+        if nodeIdx in parents:
+            obj.parent = objects[parents[nodeIdx]]
+        objects.append(obj)
+        gltfNode = SimpleNamespace(extensions=node.get("extensions", {}))
+        extension.gather_import_node_after_hook(gltf.vnodes[nodeIdx], gltfNode, obj, gltf)
+
+    extension.gather_import_scene_after_nodes_hook(
+        SimpleNamespace(extras=None), bpy.context.scene, gltf
+    )
+    return gltf, session, objects
+
+
+def test_import_fixups():
+    extension = glTF2ImportUserExtension()
+    _, _, objects = import_document(extension)
+    bodyA, bodyB, joint, hull, hullMesh = objects
+
+    assert bodyA.rigid_body.collision_shape == "BOX"
+    assert bodyA.rigid_body.mass == 2.0
+    assert bodyA.rigid_body.friction == 0.5
+    assert bodyB.rigid_body.collision_shape == "SPHERE"
+    assert joint.rigid_body_constraint.object1 is bodyA
+    assert joint.rigid_body_constraint.object2 is bodyB
+    assert hullMesh.parent is hull
+    assert hullMesh.rigid_body.collision_shape == "CONVEX_HULL"
+
+
+def test_repeated_imports_release_session():
+    extension = glTF2ImportUserExtension()
+    refs = []
+    for _ in range(import_cycles):
+        gltf, session, objects = import_document(extension)
+        assert isinstance(session, ImportSession)
+        assert extension.session == None
+        refs.append(weakref.ref(gltf))
+        refs.append(weakref.ref(session))
+        refs.extend(weakref.ref(o) for o in objects)
+        refs.extend(weakref.ref(v) for v in gltf.vnodes)
+        del gltf, session, objects
+
+    gc.collect()
+    assert [r for r in refs if r() != None] == []
+    assert not any(isinstance(o, ImportSession) for o in gc.get_objects())
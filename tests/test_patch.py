@@ -0,0 +1,42 @@
+import pytest
+
+bpy = pytest.importorskip("bpy")
+if not getattr(bpy, "is_stand_in", False):
+    pytest.skip("needs the stand-in bpy from conftest.py", allow_module_level=True)
+
+from KHR_physics_rigid_bodies.blender.exp.gltf2_blender_rigid_bodies_patch import (
+    PhysicsPatcher,
+)
+
+collider = {"KHR_physics_rigid_bodies": {"collider": {"geometry": {"shape": 0}}}}
+
+
+def batched_document():
+    """A file exported with static collider batching: two static bodies whose
+    colliders were moved to a batch node, which patching recreates on the
+    bodies' own nodes"""
+    return {
+        "scenes": [{"nodes": [0, 1, 2]}],
+        "nodes": [
+            {"name": "wallA", "mesh": 0},
+            {"name": "wallB", "mesh": 0},
+            {"name": "staticBatch_0_0_0", "children": [3, 4]},
+            {"name": "staticBatchCollider", "extensions": collider},
+            {"name": "staticBatchCollider", "extensions": collider, "children": [5]},
+            {"name": "physicsAlignmentNode"},
+        ],
+        "extensions": {"KHR_physics_rigid_bodies": {}},
+        "extensionsUsed": ["KHR_physics_rigid_bodies"],
+    }
+
+
+def test_remove_physics_frees_static_batches():
+    gltf = batched_document()
+    patcher = PhysicsPatcher(gltf, {"gltf_yup": True, "gltf_apply": False})
+    patcher._removePhysics()
+
+    assert sorted(patcher.freeNodes) == [2, 3, 4, 5]
+    assert gltf["scenes"][0]["nodes"] == [0, 1]
+    assert [n["name"] for n in gltf["nodes"][:2]] == ["wallA", "wallB"]
+    assert "children" not in gltf["nodes"][2]
+    assert "KHR_physics_rigid_bodies" not in gltf.get("extensionsUsed", [])
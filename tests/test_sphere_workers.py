@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import addon_dir
+
+pytest.importorskip("numpy")
+
+# Stands in for a script run by Blender, e.g. the batch exporter, which can't
+# be imported again by the workers as it needs bpy
+script = """
+import importlib.util
+import multiprocessing
+import site
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+if __name__ != "__main__":
+    raise ImportError("No module named 'bpy'")
+
+# Loaded as part of the addon, rather than by its own name
+spec = importlib.util.spec_from_file_location("addon.spheres", %r)
+spheres = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(spheres)
+
+path = list(sys.path)
+module = spheres.standalone_module()
+assert sys.path == path
+
+box = (
+    [[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)],
+    [[0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5], [0, 4, 5], [0, 5, 1],
+     [2, 3, 7], [2, 7, 6], [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3]],
+)
+context = multiprocessing.get_context("spawn")
+with ProcessPoolExecutor(
+    max_workers=2,
+    mp_context=context,
+    initializer=site.addsitedir,
+    initargs=(spheres.module_directory,),
+) as pool:
+    with spheres.hidden_main_module():
+        futures = [pool.submit(module.sphere_tree_job, box + (n, 0.5)) for n in (1, 2)]
+    trees = [f.result() for f in futures]
+assert [len(t[1]) for t in trees] == [1, 1]
+"""
+
+
+def test_workers_spawn_without_main_module(tmp_path):
+    path = tmp_path / "blender_script.py"
+    spheres = os.path.join(
+        addon_dir, "blender", "com", "gltf2_blender_rigid_bodies_spheres.py"
+    )
+    path.write_text(script % spheres)
+    result = subprocess.run(
+        [sys.executable, str(path)], capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr